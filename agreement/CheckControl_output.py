@@ -1,7 +1,7 @@
 from collections import defaultdict
-import re
 import os
 from os import listdir
+from log_parsers import HITS_COLUMNS, read_hits, iter_showers, normalize_shower_key
 # File paths
 #input_file = "/nfs/fanae/user/jprado/Prado/entradaFPBRUTO"
 FPGA_Input_Hits_Folder="./data/Input_CMSSW/digis_IN_FPGA"
@@ -12,19 +12,10 @@ CMSSW_Shower_Folder="./data/Input_CMSSW/Shower_results_Emulator"
 
 def read_input_data(file_path):
     """Read input data and store it as a dictionary with ID as the key."""
+    hits = read_hits(file_path, file_type="emu", strict=False)
     input_data = {}
-    with open(file_path, 'r') as f:        
-        for line_num, line in enumerate(f, 0):  # Start at line 2
-            parts = line.strip().split()
-            if len(parts) != 8:
-                print(f"Error in input line {line_num}: Expected 7 columns, got {len(parts)}. Skipping.")
-                continue
-            try:
-                bxsend, sl, bx, tdc, layer, wire, wire_id, eventNumber = map(int, parts)                
-                input_data[wire_id] = (bxsend, sl, bx, tdc, layer, wire, eventNumber)
-                
-            except ValueError:
-                print(f"Error in input line {line_num}: Non-integer data. Skipping.")
+    for bxsend, sl, bx, tdc, layer, wire, wire_id, eventNumber in zip(*(hits[column].tolist() for column in HITS_COLUMNS["emu"])):
+        input_data[wire_id] = (bxsend, sl, bx, tdc, layer, wire, eventNumber)
     return input_data
 
 def Hit_Test_data(file_path):
@@ -32,28 +23,13 @@ def Hit_Test_data(file_path):
     output_data = {}
     duplicates = set()
     seen_ids = set()
-    with open(file_path, 'r') as f:
-        for line_num, line in enumerate(f, 1):
-            parts = line.strip().split("|")
-            if len(parts) != 5:
-                print(f"Error in output line {line_num}: Expected 5 parts, got {len(parts)}. Skipping.")
-                continue
-            try:
-                wire_id = int(parts[0].split(":")[1].strip())
-                bx = int(parts[1].split(":")[1].strip())
-                tdc = int(parts[2].split(":")[1].strip())
-                layer = int(parts[3].split(":")[1].strip())
-                wire = int(parts[4].split(":")[1].strip())
-                
-                if wire_id in seen_ids:
-                    duplicates.add(wire_id)
-
-                else:
-                    seen_ids.add(wire_id)
-                    output_data[wire_id] = (bx, tdc, layer, wire)
-                
-            except (IndexError, ValueError):
-                print(f"Error in output line {line_num}: Invalid format. Skipping.")
+    hits = read_hits(file_path, file_type="fpga", strict=False)
+    for wire_id, bx, tdc, layer, wire in zip(*(hits[column].tolist() for column in HITS_COLUMNS["fpga"])):
+        if wire_id in seen_ids:
+            duplicates.add(wire_id)
+        else:
+            seen_ids.add(wire_id)
+            output_data[wire_id] = (bx, tdc, layer, wire)
     
     if duplicates:
         print(f"Duplicate IDs in output: {sorted(duplicates)}")
@@ -110,35 +86,20 @@ def parse_showers_FPGA(shower_hits_file):
     """
     shower_data = []
     
-    with open(shower_hits_file, 'r') as file:
-        data = file.read()
-        
-        # Regular expression patterns to extract fields
-        index_pattern = r"Index:\s+(\d+)"
-        shower_bx_pattern = r"ShowerBX_SL\d+:\s+(\d+)"
-        max_wire_pattern = r"Max Wire SL\d+:\s+(\d+)"
-        min_wire_pattern = r"Min Wire SL\d+:\s+(\d+)"
-        wire_counter_pattern = r"WireCounter_SL\d+:\s+([0-9\s]+)"
-        ids_pattern = r"IDs:\s+([\d\s]+)"
-        
-        # Split the data into individual entries
-        entries = data.split("Index:")
-        
-        for entry in entries[1:]:  # Skip first empty entry
-            entry_data = {}
-            try:
-                # Extract fields
-                entry_data["Index"] = int(entry.split()[0])
-                entry_data["ShowerBX"] = int(re.search(shower_bx_pattern, entry).group(1))
-                entry_data["MaxWire"] = int(re.search(max_wire_pattern, entry).group(1))
-                entry_data["MinWire"] = int(re.search(min_wire_pattern, entry).group(1))
-                entry_data["WireCounter"] = [int(x) for x in re.search(wire_counter_pattern, entry).group(1).split()]
-                entry_data["IDs"] = [int(x) for x in re.search(ids_pattern, entry).group(1).split()]
-                
-                shower_data.append(entry_data)
-            except (ValueError, AttributeError) as e:
-                print(f"Error parsing entry: {e}")
-                continue
+    for index, block in iter_showers(shower_hits_file, file_type="fpga"):
+        fields = {normalize_shower_key(key): value for key, value in block.items()}
+        try:
+            shower_data.append({
+                "Index": index,
+                "ShowerBX": fields["bx"],
+                "MaxWire": fields["maxw"],
+                "MinWire": fields["minw"],
+                "WireCounter": fields["wires"],
+                "IDs": fields["ids"],
+            })
+        except KeyError as e:
+            print(f"Error parsing entry: missing {e}")
+            continue
     
     return shower_data
 #Read the data from the Emulator file
@@ -227,48 +188,23 @@ def parse_Shower_Emu(filename):
     """Parse shower data from the given file while handling missing files gracefully."""
     showers_sl1 = {}  # Dictionary for sl == 1
     showers_sl3 = {}  # Dictionary for sl == 3
-    current_event = {}
 
     if not os.path.exists(filename):
         print(f"Warning: File {filename} not found. Returning empty dictionaries.")
         return showers_sl1, showers_sl3  # Return empty dictionaries if file doesn't exist
 
-    with open(filename, 'r') as file:
-        for line in file:
-            line = line.strip()
-
-            # Match event headers
-            event_match = re.match(r"# Event (\d+)", line)
-            if event_match:
-                if current_event:  # Save previous event if not empty
-                    if current_event.get("sl") == 1:
-                        showers_sl1[current_event["event_id"]] = current_event
-                    elif current_event.get("sl") == 3:
-                        showers_sl3[current_event["event_id"]] = current_event
-                current_event = {"event_id": int(event_match.group(1))}
-                continue  # Move to the next line
-
-            # Match key-value pairs
-            key_value_match = re.match(r"(\w+):\s*(.*)", line)
-            if key_value_match:
-                key, value = key_value_match.groups()
-                try:
-                    if key == "wires_profile":  # Convert wire profile into a list
-                        current_event[key] = list(map(int, value.strip("[]").split(", ")))
-                    elif key in ["sl", "nDigis", "BX", "minW", "maxW"]:  # Convert to integer
-                        current_event[key] = int(value)
-                    elif key in ["avgPos", "avgTime"]:  # Convert to float
-                        current_event[key] = float(value)
-                except ValueError:
-                    print(f"Warning: Invalid value in file {filename}, line: {line}. Skipping entry.")
-                continue
-
-        # Save the last event in the appropriate dictionary
-        if current_event:
-            if current_event.get("sl") == 1:
-                showers_sl1[current_event["event_id"]] = current_event
-            elif current_event.get("sl") == 3:
-                showers_sl3[current_event["event_id"]] = current_event
+    for event_id, block in iter_showers(filename, file_type="emu"):
+        current_event = {"event_id": event_id}
+        for key, value in block.items():
+            if key in ["sl", "nDigis", "BX", "minW", "maxW", "wires_profile"]:
+                current_event[key] = value
+            elif key in ["avgPos", "avgTime"]:  # Convert to float
+                current_event[key] = float(value)
+
+        if current_event.get("sl") == 1:
+            showers_sl1[current_event["event_id"]] = current_event
+        elif current_event.get("sl") == 3:
+            showers_sl3[current_event["event_id"]] = current_event
 
     return showers_sl1, showers_sl3
 
@@ -348,7 +284,7 @@ def main():
     Total_Match=0
     Total_MissFPGA=0
     Total_MisEMUL=0
-    Files=os.listdir("./data/Input_CMSSW/digis_IN_FPGA/")
+    Files=[File for File in os.listdir("./data/Input_CMSSW/digis_IN_FPGA/") if File.endswith('.txt')]
     organized_data = {}
     for File in Files:
         Station=File.removesuffix('.txt')
@@ -1,30 +1,16 @@
 import pandas as pd
 import numpy as np
-import re
 from numbers import Number
-from collections import deque
-import ast
+from log_parsers import read_hits, read_showers, parse_chamber
 
 def read_hits_files(file_path, file_type="emu", return_df=True):
-    delimiter = "|" if file_type == "fpga" else " "
-    converters = {i: lambda s: int(s.split(':')[1].strip()) for i in range(5)} if file_type == "fpga" else None
-    columns = ['id', 'bx', 'tdc', 'l', 'w'] if file_type == "fpga" else ['bxsend', 'sl', 'bx', 'tdc', 'l', 'w', 'id', 'event']
-
-    data = np.loadtxt(
-        file_path,
-        delimiter=delimiter,
-        dtype=int,
-        converters=converters
-    )
-
-    if data.size == 0:  # Handle empty data array
-        return pd.DataFrame() if return_df else {}
+    columns = read_hits(file_path, file_type)
 
-    if data.ndim == 1:  # Reshape single-row data to ensure correct dimensions
-        data = data.reshape(1, -1)
+    if columns["id"].size == 0:  # Handle empty files
+        return pd.DataFrame() if return_df else {}
 
-    df = pd.DataFrame(data, columns=columns)
-    wh, sc, st = map(int, re.search(r"wh(-?\d+)_sc(\d+)_st(\d+)", file_path).groups())
+    df = pd.DataFrame(columns)
+    wh, sc, st = parse_chamber(file_path)
     df["wh"] = wh
     df["sc"] = sc
     df["st"] = st
@@ -36,83 +22,17 @@ def read_hits_files(file_path, file_type="emu", return_df=True):
 
 def read_showers_files(file_path, file_type="emu", return_df=True):
     try:
-        with open(file_path, 'r') as f:
-            content = f.read()
-
-        if not content.strip():
-            return pd.DataFrame()  # Return empty DataFrame if file is empty
-
-        # Extract wh, sc, st from filename
-        match = re.search(r"wh(-?\d+)_sc(\d+)_st(\d+)", file_path)
-        if not match:
-            raise ValueError("Filename must include 'wh-<n>_sc<nn>_st<n>' pattern.")
-        wh, sc, st = map(int, match.groups())
-
-        # Decide on split and SL logic
-        if file_type == "emu":
-            blocks = re.split(r'# Event ', content.strip())[1:]  # drop first if empty
-            get_id = lambda lines: int(lines[0])
-            sl = None
-        elif file_type == "fpga":
-            blocks = re.split(r'Index: ', content.strip())[1:]
-            sl = 1 if "SL0" in content else (3 if "SL1" in content else None)
-            get_id = lambda lines: int(lines[0])
-        else:
-            raise ValueError("file_type must be 'emu' or 'fpga'")
-
-        # Optional key remapping
-        key_map = {
-            "WireCounter": "wires",
-            "wiresprofile": "wires",
-            "Max Wire": "maxw",
-            "Min Wire": "minw",
-            "ShowerBX": "bx",
-        }
-
-        data = []
-        for block in blocks:
-            lines = block.strip().splitlines()
-            if not lines:
-                continue
-
-            entry = {
-                "wh": wh,
-                "sc": sc,
-                "st": st,
-                "event": None if file_type == "fpga" else get_id(lines),
-                "index": None if file_type == "emu" else get_id(lines),
-            }
-            if sl is not None:
-                entry["sl"] = sl
-
-            for line in lines[1:]:
-                if ':' not in line:
-                    continue
-                key, value = map(str.strip, line.split(':', 1))
-                key = key.replace("_", "")
-                key = key.replace("SL0", "").replace("SL1", "")
-                key = key_map.get(key, key).lower()
-
-                # Parse value (int, float, list, string)
-                try:
-                    if key == "wires" or key == "ids":
-                        if file_type == "emu":
-                            entry[key] = ast.literal_eval(value)
-                        elif file_type == "fpga":
-                            entry[key] = list(map(int, value.strip().split()))
-                    elif '.' in value:
-                        entry[key] = float(value)
-                    else:
-                        entry[key] = int(value)
-                except Exception:
-                    entry[key] = value  # fallback to raw string if parsing fails
-
-            data.append(entry)
-
-        return pd.DataFrame(data) if return_df else data
+        wh, sc, st = parse_chamber(file_path)
+        columns = read_showers(file_path, file_type)
     except FileNotFoundError:
         return pd.DataFrame()  # Return empty DataFrame if file does not exist
 
+    if len(columns["event"]) == 0:
+        return pd.DataFrame()  # Return empty DataFrame if file is empty
+
+    df = pd.DataFrame({"wh": wh, "sc": sc, "st": st, **columns})
+    return df if return_df else df.to_dict(orient="records")
+
 def get_missing_hits(cmssw_df, fpga_df, columns):
     df1 = cmssw_df[columns].sort_values(by=list(columns)).reset_index(drop=True)
     df2 = fpga_df[columns].sort_values(by=list(columns)).reset_index(drop=True)
@@ -142,29 +62,60 @@ def set_shower_bxsend(showers_row, cmssw_hits_df):
         
     return bxsend
 
+def set_hits_from_cmssw(hits_df, cmssw_hits_df, columns=("event", "bxsend")):
+    # same as looking up each hit id in cmssw_hits_df (first hit with that id), with a single indexed map
+    lookup = cmssw_hits_df.drop_duplicates("id").set_index("id")
+    for column in columns:
+        hits_df[column] = hits_df["id"].map(lookup[column])
+    return hits_df
+
+def set_showers_event(showers_df, cmssw_hits_df):
+    # vectorized set_shower_event: join the exploded shower ids with the cmssw hits, keeping the hits order
+    nids = showers_df["ids"].map(len).to_numpy()
+    pairs = pd.DataFrame({
+        "shower": np.repeat(np.arange(len(showers_df)), nids),
+        "id": np.concatenate([np.asarray(ids, dtype=int) for ids in showers_df["ids"]] + [np.zeros(0, dtype=int)]),
+    }).drop_duplicates()
+    hits = pd.DataFrame({"id": cmssw_hits_df["id"].to_numpy(), "event": cmssw_hits_df["event"].to_numpy(), "row": np.arange(len(cmssw_hits_df))})
+    pairs = pairs.merge(hits, on="id").sort_values(["shower", "row"], kind="stable").drop_duplicates(["shower", "event"])
+    events_by_shower = pairs.groupby("shower")["event"].agg(list)
+
+    events = [events_by_shower.get(ishower, []) for ishower in range(len(showers_df))]
+    return pd.Series([evn[0] if len(evn) == 1 else evn for evn in events], index=showers_df.index)
+
+def set_showers_bxsend(showers_df, cmssw_hits_df):
+    # vectorized set_shower_bxsend: last hit (in bx order) of each event, shifted to the bx of the shower
+    events = showers_df["event"] if "event" in showers_df.columns else set_showers_event(showers_df, cmssw_hits_df)
+    events = events.map(lambda event: event if isinstance(event, Number) else event[0])
+
+    last_hits = cmssw_hits_df.sort_values("bx").drop_duplicates("event", keep="last").set_index("event")
+    last_bxsend = events.map(last_hits["bxsend"])
+    last_bx = events.map(last_hits["bx"])
+    return last_bxsend + (showers_df["bx"] - last_bx)
+
+def sliding_window_counts(bxs, start, stop, buff_persistance=16):
+    # number of distinct bxs in [bx - buff_persistance - 1, bx] for each bx in range(start, stop), with a cumulative sum
+    occupied = np.zeros(stop - start, dtype=np.int64)
+    bxs = np.asarray(bxs, dtype=np.int64)
+    occupied[bxs[(bxs >= start) & (bxs < stop)] - start] = 1
+    cumulative = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(occupied)])
+    upper = np.arange(1, stop - start + 1)
+    lower = np.maximum(upper - buff_persistance - 2, 0)
+    return cumulative[upper] - cumulative[lower]
+
 def dump_hits_to_nhits(hits_df, buff_persistance=16):
+    # occupancy of the fifo of bxsends with hits: each one stays from its bxsend to buff_persistance + 1 bxsends later
     if not "bxsend" in hits_df.columns:
         raise KeyError("hits_df should contain bxsend column")
-    _hits_df = hits_df.sort_values("bxsend").copy()
-    hits_buffer = deque() # fifo of tuples (bx, [hit1, hit2, ...])
-    nhits_trend = []
+    if hits_df.empty:
+        return np.zeros((0, 2), dtype=np.int64)
 
-    min_bxsend = _hits_df["bxsend"].min()
-    max_bxsend = _hits_df["bxsend"].max()
-    
-    for bxsend in range(min_bxsend, max_bxsend + 17):
-        hits = _hits_df.loc[_hits_df["bxsend"] == bxsend]
+    min_bxsend = int(hits_df["bxsend"].min())
+    max_bxsend = int(hits_df["bxsend"].max())
+    bxsends = np.arange(min_bxsend, max_bxsend + 17)
+    nhits = sliding_window_counts(hits_df["bxsend"].to_numpy(), min_bxsend, max_bxsend + 17, buff_persistance)
 
-        if not hits.empty:
-            hits_buffer.extend([(bxsend, hits["id"].to_list())])
-
-        nhits = len(hits_buffer) if hits_buffer else 0
-
-        nhits_trend.append([bxsend, nhits])
-        while (hits_buffer and bxsend - hits_buffer[0][0] > buff_persistance):
-            hits_buffer.popleft()
-
-    return np.array(nhits_trend)
+    return np.column_stack([bxsends, nhits])
 
 def match_shower(shower_row, ref_showers_df, by={"bxsend": 30}):
     matches = []
@@ -175,12 +126,57 @@ def match_shower(shower_row, ref_showers_df, by={"bxsend": 30}):
             matches.append(False)
     return all(matches)
 
-def compute_agreement(showers_df, ref_showers_df):
+def _tolerance_windows(values, ref_values, tolerance):
+    # [first, last) positions in the sorted ref_values of the refs within tolerance of each value
+    first = np.searchsorted(ref_values, values - tolerance, side="left")
+    last = np.searchsorted(ref_values, values + tolerance, side="right")
+    return first, last
+
+def match_showers(showers_df, ref_showers_df, by={"bxsend": 30}):
+    # vectorized match_shower: interval join of the showers with the reference showers sorted by each key.
+    # matched is True when, for each key, some reference shower is within its tolerance (as match_shower does),
+    # pairs are the (shower, ref) index labels within tolerance in all the keys at once, with their differences
+    matched = np.ones(len(showers_df), dtype=bool)
+    candidates = None
+    for key, tolerance in by.items():
+        values = showers_df[key].to_numpy(dtype=float)
+        ref_values = ref_showers_df[key].to_numpy(dtype=float)
+        valid = ~np.isnan(ref_values)
+        order = np.flatnonzero(valid)[np.argsort(ref_values[valid], kind="stable")]
+        first, last = _tolerance_windows(values, ref_values[order], tolerance)
+        matched &= (last > first) & ~np.isnan(values)
+
+        if candidates is None:
+            # pairs of the first key, from the windows
+            sizes = np.where(np.isnan(values), 0, last - first)
+            shower_pos = np.repeat(np.arange(len(values)), sizes)
+            offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            candidates = (shower_pos, order[np.repeat(first, sizes) + offsets])
+        else:
+            shower_pos, ref_pos = candidates
+            keep = np.abs(ref_values[ref_pos] - values[shower_pos]) <= tolerance
+            candidates = (shower_pos[keep], ref_pos[keep])
+
+    shower_pos, ref_pos = candidates if candidates is not None else (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+    pairs = pd.DataFrame({"shower": showers_df.index[shower_pos], "ref": ref_showers_df.index[ref_pos]})
+    for key in by:
+        pairs[f"d{key}"] = showers_df[key].to_numpy()[shower_pos] - ref_showers_df[key].to_numpy()[ref_pos]
+    return matched, pairs
+
+def compute_agreement(showers_df, ref_showers_df, by={"bxsend": 30}, return_matches=False):
+    # fraction of showers_df matched in ref_showers_df (see match_showers). With return_matches, also the matched
+    # pairs and the unmatched showers, for diagnostics
     if showers_df.empty and ref_showers_df.empty:
-        return 1  # Agreement is perfect if both are empty
+        agreement_ratio = 1  # Agreement is perfect if both are empty
     elif showers_df.empty or ref_showers_df.empty:
-        return 0  # Agreement is zero if only one is empty
-
-    matches = showers_df.apply(match_shower, args=(ref_showers_df,), axis=1)
-    agreement_ratio = matches.value_counts()[True] / matches.size
-    return agreement_ratio
\ No newline at end of file
+        agreement_ratio = 0  # Agreement is zero if only one is empty
+    else:
+        matched, pairs = match_showers(showers_df, ref_showers_df, by=by)
+        agreement_ratio = matched.sum() / matched.size
+        if return_matches:
+            return agreement_ratio, pairs, showers_df.loc[~matched]
+        return agreement_ratio
+
+    if return_matches:
+        return agreement_ratio, pd.DataFrame(columns=["shower", "ref", *[f"d{key}" for key in by]]), showers_df
+    return agreement_ratio
@@ -1,5 +1,7 @@
 import os
 import re
+import argparse
+from multiprocessing import get_context
 from single_agreement import make_dataframes, stimate_agreements
 from pandas import DataFrame
 from dtpr.utils.functions import create_outfolder
@@ -31,47 +33,64 @@ def make_agreements_summary_plot(agreements_df, save=False):
     else:
         plt.show()
 
+def chamber_agreements(base_dir, wh, sc, st):
+    cmssw_hits_in, fpga_hits_in, cmssw_showers, fpga_showers = make_dataframes(base_dir, wh, sc, st)
+    _agreements = stimate_agreements(fpga_showers, cmssw_showers, cmssw_hits_in, fpga_hits_in)
+
+    if all([x is not None for x in _agreements]):
+        SL1_agreement, SL3_agreement, station_agreement, err_station_agreement = _agreements
+        return {
+            "wh": wh,
+            "sc": sc,
+            "st": st,
+            "SL1_agreement": SL1_agreement,
+            "SL3_agreement": SL3_agreement,
+            "station_agreement": station_agreement,
+            "err_station_agreement": err_station_agreement
+        }
+    return None
+
 def main():
-    base_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), "data/")
+    parser = argparse.ArgumentParser(description="Compute the FPGA vs CMSSW shower agreements of all the chambers")
+    parser.add_argument("-d", "--data", default=os.path.join(os.path.abspath(os.path.dirname(__file__)), "data/"), help="Input data folder")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of chambers processed in parallel")
+    args = parser.parse_args()
+
+    base_dir = os.path.join(args.data, "")
     results_dir = os.path.join(base_dir, "agreements_results/")
 
     create_outfolder(results_dir)
 
     # scan directory to know which wh, sc, st to use
-    _agreements_data = []
-    _anomalous_data = set()
+    # digis in text (.txt) and/or binary (.npy) format, the chambers only in binary format go last
+    chambers, binary_chambers = [], []
     for file in os.scandir(os.path.join(base_dir, "Input_CMSSW/digis_IN_FPGA/")):
-        if file.is_file() and file.name.endswith(".txt"):
+        if file.is_file() and file.name.endswith((".txt", ".npy")):
             # Extract wh, sc, st from filename
             match = re.search(r"wh(-?\d+)_sc(\d+)_st(\d+)", file.name)
             if match:
-                wh, sc, st = map(int, match.groups())
-            else:
-                continue
-            # print(f"Processing: wh={wh}, sc={sc}, st={st}")
-            cmssw_hits_in, fpga_hits_in, cmssw_showers, fpga_showers = make_dataframes(base_dir, wh, sc, st)
-            _agreements = stimate_agreements(fpga_showers, cmssw_showers, cmssw_hits_in, fpga_hits_in)
-
-            if all([x is not None for x in _agreements]):
-                SL1_agreement, SL3_agreement, station_agreement, err_station_agreement = _agreements
-                _agreements_data.append({
-                    "wh": wh,
-                    "sc": sc,
-                    "st": st,
-                    "SL1_agreement": SL1_agreement,
-                    "SL3_agreement": SL3_agreement,
-                    "station_agreement": station_agreement,
-                    "err_station_agreement": err_station_agreement
-                })
-                if station_agreement < 0.9:  # Threshold for anomalous data
-                    _anomalous_data.add((wh, sc, st))
+                (chambers if file.name.endswith(".txt") else binary_chambers).append((base_dir, *map(int, match.groups())))
+    chambers += [chamber for chamber in binary_chambers if chamber not in chambers]
+
+    # chambers are independent, results are kept in the scan order
+    if args.jobs > 1 and len(chambers) > 1:
+        with get_context("spawn").Pool(min(args.jobs, len(chambers))) as pool:
+            results = pool.starmap(chamber_agreements, chambers, chunksize=1)
+    else:
+        results = [chamber_agreements(*chamber) for chamber in chambers]
+
+    _agreements_data = [result for result in results if result is not None]
+    _anomalous_data = set()
+    for result in _agreements_data:
+        if result["station_agreement"] < 0.9:  # Threshold for anomalous data
+            _anomalous_data.add((result["wh"], result["sc"], result["st"]))
 
     # Create DataFrames
     agreements_df = DataFrame(_agreements_data)
     anomalous_df = DataFrame(_anomalous_data, columns=["wh", "sc", "st"])
 
     # Save DataFrames to CSV
-    # agreements_df.to_csv(os.path.join(results_dir, "agreements.csv"), index=False)
+    agreements_df.to_csv(os.path.join(results_dir, "agreements.csv"), index=False)
     anomalous_df.to_csv(os.path.join(results_dir, "anomalous.csv"), index=False)
 
     # make_agreements_summary_plot(agreements_df, save=False)
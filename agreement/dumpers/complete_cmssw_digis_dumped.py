@@ -1,4 +1,5 @@
 import os
+import sys
 import subprocess
 import shutil
 from dtpr.base import NTuple
@@ -6,6 +7,9 @@ from dtpr.base.config import RUN_CONFIG
 from dtpr.utils.functions import color_msg
 import pandas as pd
 
+sys.path.append("..")  # Adjust the path to include the agreement directory
+from log_parsers import write_hits_binary
+
 RUN_CONFIG.change_config_file(config_path="./run_config.yaml")
 # Create the Ntuple object
 ntuple = NTuple(inputFolder="./ntuple4aggreement.root")
@@ -14,7 +18,7 @@ ntuple = NTuple(inputFolder="./ntuple4aggreement.root")
 event_number_to_index = {event.number: event.index for event in ntuple.events}
 
 
-def remake_file(file, output_folder="../data/Input_CMSSW/digis_IN_FPGA"):
+def remake_file(file, output_folder="../data/Input_CMSSW/digis_IN_FPGA", binary=True):
     data = pd.read_csv(file, sep=" ", header=None, names=["sl", "bx", "tdc", "l", "w", "event"])
     data["event_index"] = data["event"].map(event_number_to_index)
     data["idd"] = data.index
@@ -34,6 +38,8 @@ def remake_file(file, output_folder="../data/Input_CMSSW/digis_IN_FPGA"):
 
     os.makedirs(output_folder, exist_ok=True)
     data.to_csv(f"{output_folder}/{file_name}", sep=" ", header=False, index=False)
+    if binary:  # same digis in the binary format of log_parsers.py, read instead of the text by the agreement scripts
+        write_hits_binary(f"{output_folder}/{os.path.splitext(file_name)[0]}.npy", data.to_numpy(), file_type="emu")
 
 def main():
     # create a __tmp_ folder to extract the tar.gz file
@@ -1,13 +1,23 @@
 """
 This script is used to dump digis and showers from ntuples.
+
+The text files (the input of the VHDL testbench) are appended event by event. With ``--binary``, once the run is
+done, the complete text files are also converted to the binary format of ``log_parsers.py`` (``digis_*.npy``,
+``showers_*.npz``), so that the binary files always hold the same digis and showers as the text ones.
 """
 import os
+import sys
+import glob
+import argparse
 from dtpr.base import Event, NTuple
 from dtpr.utils.functions import color_msg, create_outfolder, get_unique_locs
 from dtpr.base.config import RUN_CONFIG
 from tqdm import tqdm
 from collections import deque
 
+sys.path.append("..")  # Adjust the path to include the agreement directory
+from log_parsers import text_to_binary
+
 HOTS_PERSISTANCE = 2
 OBDT_PERSISTANCE = 4
 
@@ -90,7 +100,15 @@ def _dump_showers(event: Event, outpath: str, tag: str=""):
                     f"wires_profile: {shower.wires_profile}\n"
                 )
 
+def _write_binary(outpath: str, prefix: str, kind: str, tag: str=""):
+    for file_path in sorted(glob.glob(f"{outpath}/{prefix}_wh*_sc*_st*{tag}.txt")):
+        text_to_binary(file_path, kind, file_type="emu")
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-b", "--binary", action="store_true", help="Also write the binary format of the text files")
+    args = parser.parse_args()
+
     inpath = os.path.join("./ntuple4aggreement.root")
     outfolder = "../data/Input_CMSSW"
     RUN_CONFIG.change_config_file(config_path="./run_config.yaml")
@@ -130,6 +148,10 @@ def main():
             # _dump_digis(ev, outpath=os.path.join(outfolder, "digis_IN_FPGA"), tag="")	
             _dump_showers(ev, outpath=os.path.join(outfolder, "Shower_results_Emulator"), tag="")
 
+    if args.binary:
+        # _write_binary(os.path.join(outfolder, "digis_IN_FPGA"), "digis", "hits", tag="")
+        _write_binary(os.path.join(outfolder, "Shower_results_Emulator"), "showers", "showers", tag="")
+
     color_msg(f"Done!", color="green")
 
 if __name__ == "__main__":
@@ -130,6 +130,8 @@ def main():
     output_dir_shower = os.path.abspath("../data/FPGA_Outputs/ShowerOutput")
 
     for file in os.scandir(input_cmssw_digis_dir):
+        if not file.name.endswith(".txt"):  # the testbench reads the text format
+            continue
         edit_vhdl_testbench(vhdl_testbench_path, file.path)
         tcl_script = create_tcl_script(file.path, vivado_project_path)
         run_simulation(tcl_script, vivado_path)
@@ -0,0 +1,433 @@
+"""
+Streaming parsers of the text logs of the agreement studies, shared by ``agreement_functions`` (and so
+``single_agreement.py`` and ``all_agreement.py``) and ``CheckControl_output.py``.
+
+Hits files are read in chunks of whole lines and converted to int64 NumPy arrays:
+
+* emu (``digis_IN_FPGA/digis_*.txt``): ``bxsend sl bx tdc l w id event``
+* fpga (``HitLog/Hitlog_*.txt``): ``ID: id | BX: bx | TDC: tdc | Layer: l | Wire: w``
+
+Showers files are read line by line with a small state machine, a block starting at each header line:
+
+* emu (``Shower_results_Emulator/showers_*.txt``): ``# Event <event>`` followed by ``key: value`` lines,
+  with ``wires_profile: [w0, w1, ...]``
+* fpga (``ShowerOutput/output_*.txt``): ``Index: <index>`` followed by ``key: value`` lines, with
+  ``WireCounter_SL<n>: w0 w1 ...`` and ``IDs: id0 id1 ...``
+
+The CMSSW inputs can also be exchanged in a binary format with a fixed schema (``HITS_DTYPES``,
+``SHOWERS_DTYPES``), written by the dumpers next to the text files (which are kept as the input of the VHDL
+testbench): ``digis_*.npy`` (a structured array, one record per hit) and ``showers_*.npz`` (one array per column,
+with the wire profiles flattened in ``wires`` and their lengths in ``wires_size``). ``read_hits`` and
+``read_showers`` read both formats, and ``resolve_log_path`` picks the binary file of a text log when it is
+up to date and holds as many hits or showers as the text log.
+"""
+import os
+import re
+import ast
+import string
+import warnings
+import numpy as np
+from functools import lru_cache
+
+HITS_COLUMNS = {
+    "emu": ("bxsend", "sl", "bx", "tdc", "l", "w", "id", "event"),
+    "fpga": ("id", "bx", "tdc", "l", "w"),
+}
+SHOWERS_HEADERS = {"emu": "# Event ", "fpga": "Index: "}
+
+# normalization of the showers keys, e.g. "Max Wire SL0" -> "maxw", "wires_profile" -> "wires"
+SHOWERS_KEY_MAP = {
+    "WireCounter": "wires",
+    "wiresprofile": "wires",
+    "Max Wire": "maxw",
+    "Min Wire": "minw",
+    "ShowerBX": "bx",
+}
+SHOWERS_LIST_KEYS = ("wires", "ids")
+
+# binary exchange format
+HITS_DTYPES = {
+    "emu": np.dtype([("bxsend", "<i4"), ("sl", "i1"), ("bx", "<i2"), ("tdc", "<i2"), ("l", "i1"), ("w", "<i2"), ("id", "<i4"), ("event", "<i4")]),
+    "fpga": np.dtype([("id", "<i4"), ("bx", "<i2"), ("tdc", "<i2"), ("l", "i1"), ("w", "<i2")]),
+}
+SHOWERS_DTYPES = {
+    "event": "<i4", "sl": "i1", "ndigis": "<i2", "bx": "<i2", "minw": "<i2", "maxw": "<i2",
+    "avgpos": "<f8", "avgtime": "<f8", "wires": "<i2",
+}
+BINARY_EXTENSIONS = {"hits": ".npy", "showers": ".npz"}
+
+_CHAMBER = re.compile(r"wh(-?\d+)_sc(\d+)_st(\d+)")
+
+
+def parse_chamber(file_path):
+    """Return the (wh, sc, st) of the chamber in the name of a log file."""
+    match = _CHAMBER.search(file_path)
+    if not match:
+        raise ValueError("Filename must include 'wh-<n>_sc<nn>_st<n>' pattern.")
+    return tuple(map(int, match.groups()))
+
+
+# the labels and separators of the fpga hits ("ID: 1 | BX: 5 | ...") are blanked, leaving only the numbers
+_FPGA_LABELS = str.maketrans({char: " " for char in string.ascii_letters + "_:|"})
+
+
+def _has_values_per_line(text, nlines, ncols):
+    """Whether every line of the text has exactly ncols whitespace separated values."""
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+    # whitespace and control characters are blank (the latter also make np.fromstring fail)
+    blank = chars <= ord(" ")
+    # a value starts at a non blank character that follows a blank one (or the start of the text)
+    starts = ~blank
+    starts[1:] &= blank[:-1]
+    starts = np.flatnonzero(starts)
+    if starts.size != ncols * nlines:
+        return False
+    # then each line must hold its ncols values: the first and the last of them fall between its line ends
+    newlines = np.flatnonzero(chars == ord("\n"))
+    line_begin = np.concatenate([[-1], newlines])[:nlines]
+    line_end = np.concatenate([newlines, [chars.size]])[:nlines]
+    return bool(np.all(starts[::ncols] > line_begin) and np.all(starts[ncols - 1::ncols] < line_end))
+
+
+def _hit_values(text, file_type, ncols):
+    """
+    Convert the numbers of the hits lines into a (n, ncols) array, None if the text has anything else or any
+    line (blank ones included) has not exactly ncols values.
+    """
+    if file_type == "fpga":
+        text = text.translate(_FPGA_LABELS)
+    nlines = text.count("\n") + (not text.endswith("\n"))
+    if not _has_values_per_line(text, nlines, ncols):
+        return None
+    with warnings.catch_warnings(record=True) as caught:
+        # depending on the numpy version, malformed values stop the conversion with a DeprecationWarning or raise
+        warnings.simplefilter("always", DeprecationWarning)
+        try:
+            values = np.fromstring(text, dtype=np.int64, sep=" ")
+        except ValueError:
+            return None
+    if caught or values.size != ncols * nlines:
+        return None
+    return values.reshape(nlines, ncols)
+
+
+def iter_hits(file_path, file_type="emu", chunk_size=1 << 22, strict=True):
+    """
+    Read a hits log in chunks.
+
+    :param file_path: The path of the log
+    :type file_path: str
+    :param file_type: "emu" or "fpga", see ``HITS_COLUMNS`` for the columns of each one
+    :type file_type: str
+    :param chunk_size: Approximate number of characters converted at once (chunks end at a line end)
+    :type chunk_size: int
+    :param strict: Raise a ValueError on malformed lines. If False, they are reported and skipped
+    :type strict: bool
+    :return: A (n, ncolumns) int64 array per chunk, blank lines are skipped
+    :rtype: Iterator[np.ndarray]
+    """
+    ncols = len(HITS_COLUMNS[file_type])
+    with open(file_path, "r") as f:
+        first_line = 1
+        while True:
+            text = f.read(chunk_size)
+            if not text:
+                break
+            text += f.readline()
+            nlines = text.count("\n") + (not text.endswith("\n"))
+            data = _hit_values(text, file_type, ncols)
+            if data is None:
+                # blank or malformed lines in the chunk, go line by line
+                data = []
+                for line_num, line in enumerate(text.splitlines(), first_line):
+                    if not line.strip():
+                        continue
+                    line_values = _hit_values(line, file_type, ncols)
+                    if line_values is not None:
+                        data.append(line_values)
+                        continue
+                    message = f"{file_path}, line {line_num}: expected {ncols} integer values"
+                    if strict:
+                        raise ValueError(message)
+                    print(f"Error in {message}. Skipping.")
+                data = np.concatenate(data) if data else np.zeros(0, dtype=np.int64)
+            first_line += nlines
+            yield data.reshape(-1, ncols)
+
+
+def read_hits(file_path, file_type="emu", strict=True):
+    """
+    Read a hits log (text, or binary if it ends with .npy) into columns.
+
+    :param file_path: The path of the log
+    :type file_path: str
+    :param file_type: "emu" or "fpga"
+    :type file_type: str
+    :param strict: Raise a ValueError on malformed lines. If False, they are reported and skipped
+    :type strict: bool
+    :return: The int64 array of each column of ``HITS_COLUMNS[file_type]``, by name
+    :rtype: Dict[str, np.ndarray]
+    """
+    if file_path.endswith(BINARY_EXTENSIONS["hits"]):
+        return read_hits_binary(file_path, file_type)
+    chunks = list(iter_hits(file_path, file_type, strict=strict))
+    data = np.concatenate(chunks) if chunks else np.zeros((0, len(HITS_COLUMNS[file_type])), dtype=np.int64)
+    return {column: data[:, i] for i, column in enumerate(HITS_COLUMNS[file_type])}
+
+
+@lru_cache(maxsize=None)
+def normalize_shower_key(key):
+    """Return the common name of a showers key, e.g. "Max Wire SL0" -> "maxw"."""
+    key = key.replace("_", "").replace("SL0", "").replace("SL1", "").strip()
+    return SHOWERS_KEY_MAP.get(key, key).lower()
+
+
+def _parse_list(value, file_type):
+    # "w0 w1 ..." for fpga, "[w0, w1, ...]" for emu
+    sep, inner = (" ", value.strip()) if file_type == "fpga" else (",", value.strip("[] "))
+    if not inner:
+        return []
+    if inner.replace(sep, "").replace(" ", "").isdigit():
+        return np.fromstring(inner, dtype=np.int64, sep=sep).tolist()
+    try:
+        return list(map(int, inner.split(sep if file_type != "fpga" else None)))
+    except ValueError:
+        if file_type == "fpga":
+            raise
+        return ast.literal_eval(value)
+
+
+def parse_shower_value(key, value, file_type="emu"):
+    """Convert the value of a (normalized) showers key: a list for wires/ids, else float, int or the raw string."""
+    try:
+        if key in SHOWERS_LIST_KEYS:
+            return _parse_list(value, file_type)
+        return float(value) if "." in value else int(value)
+    except Exception:
+        return value
+
+
+def iter_showers(file_path, file_type="emu"):
+    """
+    Read a showers log block by block.
+
+    :param file_path: The path of the log
+    :type file_path: str
+    :param file_type: "emu" (blocks start with "# Event <event>") or "fpga" (blocks start with "Index: <index>")
+    :type file_type: str
+    :return: The (header id, raw key -> typed value) of each block, keys are parsed with their normalized name
+    :rtype: Iterator[Tuple[int, Dict[str, Any]]]
+    """
+    if file_type not in SHOWERS_HEADERS:
+        raise ValueError("file_type must be 'emu' or 'fpga'")
+    header = SHOWERS_HEADERS[file_type]
+    block_id, block = None, None
+    with open(file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(header):
+                if block is not None:
+                    yield block_id, block
+                block_id, block = int(line[len(header):]), {}
+            elif block is not None and ":" in line:
+                key, value = map(str.strip, line.split(":", 1))
+                block[key] = parse_shower_value(normalize_shower_key(key), value, file_type)
+    if block is not None:
+        yield block_id, block
+
+
+def read_showers(file_path, file_type="emu"):
+    """
+    Read a showers log (text, or binary emu showers if it ends with .npz) into columns.
+
+    The columns are ``event`` (emu header, None for fpga), ``index`` (fpga header, None for emu), ``sl`` for fpga
+    (1 for SL0 keys, 3 for SL1 keys) and the normalized keys of the blocks, in order of appearance. Numeric
+    columns are NumPy arrays, and wires/ids are lists (with None for the blocks missing a key).
+
+    :param file_path: The path of the log
+    :type file_path: str
+    :param file_type: "emu" or "fpga"
+    :type file_type: str
+    :return: The columns, by name
+    :rtype: Dict[str, Union[np.ndarray, list]]
+    """
+    if file_path.endswith(BINARY_EXTENSIONS["showers"]):
+        return read_showers_binary(file_path)
+
+    columns = {"event": [], "index": []}
+    if file_type == "fpga":
+        columns["sl"] = []
+    keys_seen = set()
+    nblocks = 0
+    for block_id, block in iter_showers(file_path, file_type):
+        columns["event"].append(block_id if file_type == "emu" else None)
+        columns["index"].append(block_id if file_type == "fpga" else None)
+        for key, value in block.items():
+            keys_seen.add(key)
+            # blocks missing a key get None, as do the previous ones for new keys
+            key = normalize_shower_key(key)
+            if key not in columns:
+                columns[key] = [None] * nblocks
+            columns[key].append(value)
+        nblocks += 1
+        for values in columns.values():
+            if len(values) < nblocks:
+                values.append(None)
+
+    if file_type == "fpga":
+        # the superlayer is given by the keys, e.g. ShowerBX_SL0
+        sl = 1 if any("SL0" in key for key in keys_seen) else (3 if any("SL1" in key for key in keys_seen) else None)
+        columns["sl"] = [sl] * nblocks
+    for key, values in columns.items():
+        if key not in SHOWERS_LIST_KEYS and values and all(isinstance(value, (int, float)) for value in values):
+            columns[key] = np.array(values)
+    return columns
+
+
+def _cast(values, dtype, name):
+    values = np.asarray(values)
+    cast = values.astype(dtype)
+    if not np.array_equal(cast, values):
+        raise ValueError(f"{name} values do not fit in the {np.dtype(dtype)} of the binary format")
+    return cast
+
+
+def write_hits_binary(file_path, rows, file_type="emu"):
+    """
+    Write hits in the binary format.
+
+    :param file_path: The path of the .npy file
+    :type file_path: str
+    :param rows: The hits, with the columns of ``HITS_COLUMNS[file_type]``
+    :type rows: Sequence[Sequence[int]] or np.ndarray
+    :param file_type: "emu" or "fpga"
+    :type file_type: str
+    :return: None
+    :rtype: None
+    """
+    dtype = HITS_DTYPES[file_type]
+    rows = np.asarray(rows, dtype=np.int64).reshape(-1, len(dtype.names))
+    data = np.empty(len(rows), dtype=dtype)
+    for i, name in enumerate(dtype.names):
+        data[name] = _cast(rows[:, i], dtype[name], name)
+    np.save(file_path, data)
+
+
+def read_hits_binary(file_path, file_type="emu"):
+    """Read a .npy hits file into int64 columns, as ``read_hits`` does for the text logs."""
+    data = np.load(file_path)
+    if data.dtype != HITS_DTYPES[file_type]:
+        raise ValueError(f"{file_path} does not have the schema of the {file_type} hits: {data.dtype}")
+    return {column: data[column].astype(np.int64) for column in HITS_COLUMNS[file_type]}
+
+
+def write_showers_binary(file_path, showers):
+    """
+    Write emulator showers in the binary format.
+
+    :param file_path: The path of the .npz file
+    :type file_path: str
+    :param showers: The showers, with the (normalized) keys of ``SHOWERS_DTYPES``, e.g. as given by ``read_showers``
+    :type showers: Dict[str, Sequence] or List[Dict[str, Any]]
+    :return: None
+    :rtype: None
+    """
+    if not isinstance(showers, dict):
+        showers = {key: [shower[key] for shower in showers] for key in SHOWERS_DTYPES}
+    nshowers = len(showers["event"])
+    if any(len(showers.get(key, [])) != nshowers for key in SHOWERS_DTYPES):
+        raise ValueError(f"The showers must have all the columns of the binary format: {list(SHOWERS_DTYPES)}")
+    arrays = {key: _cast(showers.get(key, []), dtype, key) for key, dtype in SHOWERS_DTYPES.items() if key != "wires"}
+    wires = [np.asarray(profile, dtype=np.int64) for profile in showers.get("wires", [])]
+    arrays["wires_size"] = _cast([len(profile) for profile in wires], "<i4", "wires_size")
+    arrays["wires"] = _cast(np.concatenate([np.zeros(0, dtype=np.int64)] + wires), SHOWERS_DTYPES["wires"], "wires")
+    np.savez(file_path, **arrays)
+
+
+def read_showers_binary(file_path):
+    """Read a .npz showers file into columns, as ``read_showers`` does for the emu text logs."""
+    with np.load(file_path) as data:
+        arrays = {key: data[key] for key in data.files}
+    nshowers = len(arrays["event"])
+    columns = {"event": arrays["event"].astype(np.int64), "index": [None] * nshowers}
+    for key, dtype in SHOWERS_DTYPES.items():
+        if key == "event":
+            continue
+        if key == "wires":
+            bounds = np.cumsum(arrays["wires_size"])[:-1]
+            columns[key] = [profile.tolist() for profile in np.split(arrays["wires"].astype(np.int64), bounds)] if nshowers else []
+        else:
+            columns[key] = arrays[key].astype(np.float64 if np.dtype(dtype).kind == "f" else np.int64)
+    return columns
+
+
+def binary_log_path(file_path, kind):
+    """Return the path of the binary file of a text log, kind being "hits" or "showers"."""
+    return os.path.splitext(file_path)[0] + BINARY_EXTENSIONS[kind]
+
+
+def _text_records(file_path, kind, chunk_size=1 << 24):
+    """Number of hits (lines) or showers (``# Event`` headers) of a text log, without parsing it."""
+    count = 0
+    with open(file_path, "rb") as f:
+        if kind == "hits":
+            last = b"\n"
+            while chunk := f.read(chunk_size):
+                count += chunk.count(b"\n")
+                last = chunk[-1:]
+            return count + (last != b"\n")
+        return sum(line.startswith(b"# Event") for line in f)
+
+
+def _binary_records(binary_path, kind):
+    """Number of hits or showers of a binary file, reading only its header (or the event column)."""
+    if kind == "hits":
+        return len(np.load(binary_path, mmap_mode="r"))
+    with np.load(binary_path) as data:
+        return len(data["event"])
+
+
+def resolve_log_path(file_path, kind):
+    """
+    Return the binary file of a text log if it describes the same content, else the text log.
+
+    The binary file is used when there is no text log, or when it is not older than the text log and holds the
+    same number of hits or showers (so a text log appended after the conversion is not silently truncated).
+
+    :param file_path: The path of the text log
+    :type file_path: str
+    :param kind: "hits" or "showers"
+    :type kind: str
+    :return: The path of the file to read
+    :rtype: str
+    """
+    binary_path = binary_log_path(file_path, kind)
+    if not os.path.exists(binary_path):
+        return file_path
+    if not os.path.exists(file_path):
+        return binary_path
+    if os.path.getmtime(binary_path) >= os.path.getmtime(file_path) and _binary_records(binary_path, kind) == _text_records(file_path, kind):
+        return binary_path
+    return file_path
+
+
+def text_to_binary(file_path, kind, file_type="emu"):
+    """
+    Convert a text log to the binary format, next to it.
+
+    :param file_path: The path of the text log
+    :type file_path: str
+    :param kind: "hits" or "showers" (emu only)
+    :type kind: str
+    :param file_type: "emu" or "fpga", for the hits
+    :type file_type: str
+    :return: The path of the binary file
+    :rtype: str
+    """
+    binary_path = binary_log_path(file_path, kind)
+    if kind == "hits":
+        columns = read_hits(file_path, file_type)
+        write_hits_binary(binary_path, np.column_stack([columns[column] for column in HITS_COLUMNS[file_type]]), file_type)
+    else:
+        write_showers_binary(binary_path, read_showers(file_path, "emu"))
+    return binary_path
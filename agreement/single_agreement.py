@@ -2,10 +2,11 @@ import matplotlib.pylab as plt
 import pandas as pd
 import numpy as np
 from agreement_functions import *
+from log_parsers import resolve_log_path
 import os
 
 def make_dataframes(base_dir, wh, sc, st):
-    cmssw_hits_in = read_hits_files(f"{base_dir}Input_CMSSW/digis_IN_FPGA/digis_wh{wh}_sc{sc}_st{st}.txt", file_type="emu")
+    cmssw_hits_in = read_hits_files(resolve_log_path(f"{base_dir}Input_CMSSW/digis_IN_FPGA/digis_wh{wh}_sc{sc}_st{st}.txt", "hits"), file_type="emu")
     fpga_hits_in = pd.concat(
         [
             read_hits_files(f"{base_dir}FPGA_Outputs/HitLog/Hitlog_wh{wh}_sc{sc}_st{st}_SL0.txt", file_type="fpga"),
@@ -13,7 +14,7 @@ def make_dataframes(base_dir, wh, sc, st):
         ]
     )
 
-    cmssw_showers = read_showers_files(f"{base_dir}Input_CMSSW/Shower_results_Emulator/showers_wh{wh}_sc{sc}_st{st}.txt", file_type="emu")
+    cmssw_showers = read_showers_files(resolve_log_path(f"{base_dir}Input_CMSSW/Shower_results_Emulator/showers_wh{wh}_sc{sc}_st{st}.txt", "showers"), file_type="emu")
     fpga_showers = pd.concat(
         [
             read_showers_files(f"{base_dir}FPGA_Outputs/ShowerOutput/output_wh{wh}_sc{sc}_st{st}_SL0.txt", file_type="fpga"),
@@ -22,15 +23,15 @@ def make_dataframes(base_dir, wh, sc, st):
     )
 
     # use the cmssw_hits_info to set missing vars to others dataframes
-    fpga_hits_in["event"] = fpga_hits_in.apply(lambda row: cmssw_hits_in.loc[cmssw_hits_in["id"]==row["id"], "event"].values[0], axis=1)
-    fpga_hits_in["bxsend"] = fpga_hits_in.apply(lambda row: cmssw_hits_in.loc[cmssw_hits_in["id"]==row["id"], "bxsend"].values[0], axis=1)
+    if not fpga_hits_in.empty:
+        set_hits_from_cmssw(fpga_hits_in, cmssw_hits_in)
 
     if not fpga_showers.empty:
-        fpga_showers["event"] = fpga_showers.apply(set_shower_event, args=(cmssw_hits_in,), axis=1)
-        fpga_showers["bxsend"] = fpga_showers.apply(set_shower_bxsend, args=(cmssw_hits_in,), axis=1)
+        fpga_showers["event"] = set_showers_event(fpga_showers, cmssw_hits_in)
+        fpga_showers["bxsend"] = set_showers_bxsend(fpga_showers, cmssw_hits_in)
 
     if not cmssw_showers.empty:
-        cmssw_showers["bxsend"] = cmssw_showers.apply(set_shower_bxsend, args=(cmssw_hits_in,), axis=1)
+        cmssw_showers["bxsend"] = set_showers_bxsend(cmssw_showers, cmssw_hits_in)
 
     return cmssw_hits_in, fpga_hits_in, cmssw_showers, fpga_showers
 
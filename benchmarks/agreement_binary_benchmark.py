@@ -0,0 +1,95 @@
+"""
+File size and load time of the CMSSW inputs of the agreement studies (digis and emulator showers) in the text
+format and in the binary format of ``agreement/log_parsers.py`` (``.npy`` digis, ``.npz`` showers), read with
+``agreement_functions.read_hits_files``/``read_showers_files``, checking that both formats give the same DataFrames.
+
+The text files are taken from an agreement data folder (``-d``, converted to binary in a temporary folder), or
+generated for ``--nchambers`` chambers (240 for the full detector) with ``--nhits`` digis each.
+
+Usage (from the repository root):
+    python benchmarks/agreement_binary_benchmark.py [-d agreement/data/] [--nchambers 240] [--nhits 20000]
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from dtpr.utils.functions import color_msg
+
+# the agreement scripts import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agreement"))
+from agreement_functions import read_hits_files, read_showers_files  # noqa: E402
+from log_parsers import text_to_binary  # noqa: E402
+
+KINDS = {
+    "digis": ("hits", "Input_CMSSW/digis_IN_FPGA", read_hits_files),
+    "showers": ("showers", "Input_CMSSW/Shower_results_Emulator", read_showers_files),
+}
+
+
+def write_text_inputs(base_dir, nchambers, nhits, seed=0):
+    """Write digis and emulator showers text files as the dumpers do, for nchambers chambers."""
+    rng = np.random.default_rng(seed)
+    chambers = [(wh, sc, st) for st in range(1, 5) for wh in range(-2, 3) for sc in range(1, 13)][:nchambers]
+    for _, folder, _ in KINDS.values():
+        os.makedirs(os.path.join(base_dir, folder), exist_ok=True)
+    for wh, sc, st in chambers:
+        event = np.sort(rng.integers(0, nhits // 20 + 1, nhits))
+        bx = rng.integers(0, 30, nhits)
+        hits = np.column_stack([
+            event * 50 + bx, rng.choice([1, 3], nhits), bx, rng.integers(0, 32, nhits),
+            rng.integers(1, 5, nhits), rng.integers(0, 96, nhits), np.arange(nhits), event,
+        ])
+        np.savetxt(os.path.join(base_dir, KINDS["digis"][1], f"digis_wh{wh}_sc{sc}_st{st}.txt"), hits, fmt="%d")
+        with open(os.path.join(base_dir, KINDS["showers"][1], f"showers_wh{wh}_sc{sc}_st{st}.txt"), "w") as f:
+            for ev in np.unique(event)[::4]:
+                profile = rng.integers(0, 3, 96).tolist()
+                f.write(
+                    f"# Event {ev}\nsl: {rng.choice([1, 3])}\nnDigis: {rng.integers(6, 40)}\nBX: {rng.integers(0, 30)}\n"
+                    f"minW: 3\nmaxW: 60\navgPos: {rng.uniform(0, 96)}\navgTime: {rng.uniform(0, 500)}\nwires_profile: {profile}\n"
+                )
+
+
+def load_time(files, reader):
+    start = time.perf_counter()
+    frames = [reader(path) for path in files]
+    return time.perf_counter() - start, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-d", "--data", default=None, help="Agreement data folder with the text inputs")
+    parser.add_argument("--nchambers", type=int, default=240, help="Chambers of the generated inputs")
+    parser.add_argument("--nhits", type=int, default=20000, help="Digis per chamber of the generated inputs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.data:
+            for _, folder, _ in KINDS.values():
+                shutil.copytree(os.path.join(args.data, folder), os.path.join(tmpdir, folder), ignore=shutil.ignore_patterns("*.npy", "*.npz"))
+        else:
+            write_text_inputs(tmpdir, args.nchambers, args.nhits)
+
+        for name, (kind, folder, reader) in KINDS.items():
+            text_files = sorted(glob.glob(os.path.join(tmpdir, folder, "*.txt")))
+            binary_files = [text_to_binary(path, kind) for path in text_files]
+            text_size = sum(os.path.getsize(path) for path in text_files) / 1e6
+            binary_size = sum(os.path.getsize(path) for path in binary_files) / 1e6
+
+            text_time, text_frames = load_time(text_files, reader)
+            binary_time, binary_frames = load_time(binary_files, reader)
+            for text_frame, binary_frame in zip(text_frames, binary_frames):
+                pd.testing.assert_frame_equal(text_frame, binary_frame)
+
+            color_msg(f"{name} ({len(text_files)} files):", color="blue", indentLevel=1)
+            color_msg(f"size: text {text_size:.1f} MB, binary {binary_size:.1f} MB ({binary_size / max(text_size, 1e-12):.0%})", indentLevel=2)
+            color_msg(f"load: text {text_time:.2f} s, binary {binary_time:.2f} s (x{text_time / max(binary_time, 1e-12):.1f})", indentLevel=2)
+    color_msg("Same DataFrames with both formats", color="green")
+
+
+if __name__ == "__main__":
+    main()
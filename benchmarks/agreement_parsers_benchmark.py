@@ -0,0 +1,176 @@
+"""
+Parsing throughput (MB/s) of the agreement logs with the streaming parsers of ``agreement/log_parsers.py``
+(through ``agreement_functions.read_hits_files``/``read_showers_files``) against the parsers they replace
+(``np.loadtxt`` with a per-column converter for the FPGA hits, regex split of the whole file and
+``ast.literal_eval`` of the wire lists for the showers), checking that both give the same DataFrames.
+
+The logs are generated in a temporary folder (``--nhits`` hits per file, one shower every ~10 hits), or taken from
+an agreement data folder (``-d``, the largest file of each kind).
+
+Usage (from the repository root):
+    python benchmarks/agreement_parsers_benchmark.py [--nhits 1000000] [-d agreement/data/] [-r REPEAT]
+"""
+import os
+import re
+import ast
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from dtpr.utils.functions import color_msg
+
+# the agreement scripts import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agreement"))
+from agreement_functions import read_hits_files, read_showers_files  # noqa: E402
+
+
+def legacy_read_hits_files(file_path, file_type="emu"):
+    """read_hits_files as it was, with np.loadtxt"""
+    delimiter = "|" if file_type == "fpga" else " "
+    converters = {i: lambda s: int(s.split(':')[1].strip()) for i in range(5)} if file_type == "fpga" else None
+    columns = ['id', 'bx', 'tdc', 'l', 'w'] if file_type == "fpga" else ['bxsend', 'sl', 'bx', 'tdc', 'l', 'w', 'id', 'event']
+    data = np.loadtxt(file_path, delimiter=delimiter, dtype=int, converters=converters)
+    if data.size == 0:
+        return pd.DataFrame()
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    df = pd.DataFrame(data, columns=columns)
+    wh, sc, st = map(int, re.search(r"wh(-?\d+)_sc(\d+)_st(\d+)", file_path).groups())
+    df["wh"] = wh
+    df["sc"] = sc
+    df["st"] = st
+    if file_type == "fpga":
+        df["sl"] = 1 if "SL0" in file_path else (3 if "SL1" in file_path else None)
+    return df
+
+
+def legacy_read_showers_files(file_path, file_type="emu"):
+    """read_showers_files as it was, with the regex split and ast.literal_eval (keys stripped as they are now)"""
+    with open(file_path, 'r') as f:
+        content = f.read()
+    if not content.strip():
+        return pd.DataFrame()
+    wh, sc, st = map(int, re.search(r"wh(-?\d+)_sc(\d+)_st(\d+)", file_path).groups())
+    blocks = re.split(r'# Event ' if file_type == "emu" else r'Index: ', content.strip())[1:]
+    sl = None if file_type == "emu" else (1 if "SL0" in content else (3 if "SL1" in content else None))
+    key_map = {"WireCounter": "wires", "wiresprofile": "wires", "Max Wire": "maxw", "Min Wire": "minw", "ShowerBX": "bx"}
+    data = []
+    for block in blocks:
+        lines = block.strip().splitlines()
+        entry = {
+            "wh": wh, "sc": sc, "st": st,
+            "event": None if file_type == "fpga" else int(lines[0]),
+            "index": None if file_type == "emu" else int(lines[0]),
+        }
+        if sl is not None:
+            entry["sl"] = sl
+        for line in lines[1:]:
+            if ':' not in line:
+                continue
+            key, value = map(str.strip, line.split(':', 1))
+            key = key.replace("_", "").replace("SL0", "").replace("SL1", "").strip()
+            key = key_map.get(key, key).lower()
+            try:
+                if key == "wires" or key == "ids":
+                    entry[key] = ast.literal_eval(value) if file_type == "emu" else list(map(int, value.strip().split()))
+                elif '.' in value:
+                    entry[key] = float(value)
+                else:
+                    entry[key] = int(value)
+            except Exception:
+                entry[key] = value
+        data.append(entry)
+    return pd.DataFrame(data)
+
+
+def write_logs(folder, nhits, seed=0):
+    """Write a log of each kind with nhits hits, in the formats of the dumpers and of the FPGA simulation."""
+    rng = np.random.default_rng(seed)
+    chamber = "wh-1_sc10_st1"
+    event = np.sort(rng.integers(0, nhits // 20 + 1, nhits))
+    bx = rng.integers(0, 30, nhits)
+    hits = np.column_stack([
+        event * 50 + bx, rng.choice([1, 2, 3], nhits), bx, rng.integers(0, 32, nhits),
+        rng.integers(1, 5, nhits), rng.integers(0, 96, nhits), np.arange(nhits), event,
+    ])
+    paths = {
+        "emu hits": os.path.join(folder, f"digis_{chamber}.txt"),
+        "fpga hits": os.path.join(folder, f"Hitlog_{chamber}_SL0.txt"),
+        "emu showers": os.path.join(folder, f"showers_{chamber}.txt"),
+        "fpga showers": os.path.join(folder, f"output_{chamber}_SL0.txt"),
+    }
+    np.savetxt(paths["emu hits"], hits, fmt="%d")
+    with open(paths["fpga hits"], "w") as f:
+        f.writelines(f"ID: {h[6]} | BX: {h[2]} | TDC: {h[3]} | Layer: {h[4]} | Wire: {h[5]}\n" for h in hits.tolist())
+    nshowers = nhits // 10
+    with open(paths["emu showers"], "w") as f:
+        for i in range(nshowers):
+            profile = rng.integers(0, 3, 96).tolist()
+            f.write(f"# Event {i}\nsl: 1\nnDigis: 8\nBX: {i % 30}\nminW: 3\nmaxW: 60\navgPos: 31.5\navgTime: 12.25\nwires_profile: {profile}\n")
+    with open(paths["fpga showers"], "w") as f:
+        for i in range(nshowers):
+            profile = " ".join(map(str, rng.integers(0, 3, 96).tolist()))
+            ids = " ".join(map(str, range(10 * i, 10 * i + 10)))
+            f.write(f"Index: {i}\nShowerBX_SL0: {i % 30}\nMax Wire SL0: 60\nMin Wire SL0: 3\nWireCounter_SL0: {profile}\nIDs: {ids}\n")
+    return paths
+
+
+def data_logs(base_dir):
+    """The largest log of each kind of an agreement data folder."""
+    patterns = {
+        "emu hits": "Input_CMSSW/digis_IN_FPGA/*.txt",
+        "fpga hits": "FPGA_Outputs/HitLog/*.txt",
+        "emu showers": "Input_CMSSW/Shower_results_Emulator/*.txt",
+        "fpga showers": "FPGA_Outputs/ShowerOutput/*.txt",
+    }
+    paths = {}
+    for kind, pattern in patterns.items():
+        files = glob.glob(os.path.join(base_dir, pattern))
+        if files:
+            paths[kind] = max(files, key=os.path.getsize)
+    return paths
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nhits", type=int, default=1000000, help="Hits of the generated logs")
+    parser.add_argument("-d", "--data", default=None, help="Agreement data folder to take the logs from instead")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Repetitions, the best time is kept")
+    args = parser.parse_args()
+
+    readers = {
+        "emu hits": (lambda p: legacy_read_hits_files(p, "emu"), lambda p: read_hits_files(p, "emu")),
+        "fpga hits": (lambda p: legacy_read_hits_files(p, "fpga"), lambda p: read_hits_files(p, "fpga")),
+        "emu showers": (lambda p: legacy_read_showers_files(p, "emu"), lambda p: read_showers_files(p, "emu")),
+        "fpga showers": (lambda p: legacy_read_showers_files(p, "fpga"), lambda p: read_showers_files(p, "fpga")),
+    }
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = data_logs(args.data) if args.data else write_logs(tmpdir, args.nhits)
+        for kind, path in paths.items():
+            size = os.path.getsize(path) / 1e6
+            legacy, streaming = readers[kind]
+            legacy_time, legacy_df = best_time(lambda: legacy(path), args.repeat)
+            new_time, new_df = best_time(lambda: streaming(path), args.repeat)
+            pd.testing.assert_frame_equal(legacy_df, new_df)
+            color_msg(
+                f"{kind:>12} ({size:.1f} MB): legacy {size / legacy_time:7.1f} MB/s, streaming {size / new_time:7.1f} MB/s "
+                f"(x{legacy_time / new_time:.1f})", color="blue", indentLevel=1
+            )
+    color_msg("Same DataFrames with both parsers", color="green")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Time of the barrel filter matching (``filter_main.barrel_filter_analyzer``) looping over the BF boards against
+analyzing each unique (shower, TP) pair once (``unique_pairs=True``), on the same events. Also reports the number
+of pairs analyzed by each mode (the overlap factor of the boards) and checks that both fill the same matched lists.
+
+Run from the filter_studies folder, with a config including the filter_matching preprocessor:
+    cd filter_studies && python ../benchmarks/bf_unique_pairs_benchmark.py -i NTUPLE -cf ./run_config.yaml [-n NEVENTS]
+"""
+import time
+import argparse
+from dtpr.utils.functions import color_msg
+
+
+def reset_matches(ev):
+    """Empty the matched lists filled by the filter matching"""
+    for shower in ev.fwshowers:
+        shower.matched_tps = []
+    for tp in ev.tps:
+        tp.matched_showers = []
+
+
+def matches(ev):
+    """Matched TPs of each shower and matched showers of each TP, by index and in order"""
+    return (
+        [[tp.index for tp in shower.matched_tps] for shower in ev.fwshowers],
+        [[shower.index for shower in tp.matched_showers] for tp in ev.tps],
+    )
+
+
+def count_pairs(ev, neighbor_sectors, boards_mask):
+    """Number of TP-shower pairs analyzed by the loop over the boards and of unique pairs"""
+    per_board = unique = 0
+    for shower in ev.fwshowers:
+        tps = [tp for tp in ev.tps if tp.wh == shower.wh and tp.st != shower.st]
+        per_board += sum(
+            shower.sc in sectors and tp.sc in sectors for sectors in neighbor_sectors.values() for tp in tps
+        )
+        unique += sum(bool(boards_mask.get(shower.sc, 0) & boards_mask.get(tp.sc, 0)) for tp in tps)
+    return per_board, unique
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="DTNTuple file/folder")
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML")
+    parser.add_argument("-n", "--nevents", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3, help="Times each event is analyzed per mode")
+    args = parser.parse_args()
+
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+    from filter_main import barrel_filter_analyzer, get_tps_geometry, BF_neighbor_sectors, BF_boards_mask
+
+    RUN_CONFIG.change_config_file(config_path=args.config)
+    ntuple = NTuple(inputFolder=args.inpath)
+
+    times = {False: 0., True: 0.}
+    pairs = [0, 0]
+    mismatches = nanalyzed = 0
+    for iev, ev in enumerate(ntuple.events):
+        if iev >= args.nevents:
+            break
+        if ev is None or not ev.fwshowers:
+            continue
+        nanalyzed += 1
+        get_tps_geometry(ev) # shared by both modes, not timed
+        results = {}
+        for unique_pairs in (False, True):
+            for _ in range(args.repeat):
+                reset_matches(ev)
+                start = time.perf_counter()
+                barrel_filter_analyzer(ev, unique_pairs=unique_pairs)
+                times[unique_pairs] += time.perf_counter() - start
+            results[unique_pairs] = matches(ev)
+        mismatches += results[False] != results[True]
+        per_board, unique = count_pairs(ev, BF_neighbor_sectors, BF_boards_mask)
+        pairs[0] += per_board
+        pairs[1] += unique
+
+    color_msg(f"TP-shower pairs: {pairs[0]} per board, {pairs[1]} unique (overlap factor {pairs[0] / max(pairs[1], 1):.2f})", color="blue")
+    for unique_pairs, label in ((False, "per board"), (True, "unique pairs")):
+        color_msg(f"{label:>12}: {1e3 * times[unique_pairs] / max(nanalyzed * args.repeat, 1):.3f} ms/event", color="blue", indentLevel=1)
+    color_msg(f"speedup: {times[False] / max(times[True], 1e-12):.2f}x, events with different matches: {mismatches}",
+              color="green" if not mismatches else "red")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Wall time and bytes read when filling the histograms of a config (e.g. the rates config) over the first input
+files, with and without the pruning of ``utils.config_pruning``:
+
+* ``dtpr fill-histos`` with the full config, the serial reference.
+* the fill of ``utils/parallel_fill_histos.py`` (one process over all the files) with the full config.
+* the same fill with ``--prune``: the pruned config, and only its branches active in the tree of each NTuple.
+
+The bytes read by each run are the ``rchar`` of ``/proc/self/io`` (Linux only), so they show what deactivating
+the branches actually saves. For reference, ``--uproot`` also reports the bytes of the branches of each config
+read with uproot, i.e. what the pruning saves in the columnar readers (``utils.columnar``), which only read those.
+
+Usage (from the study folder, as with dtpr):
+    python ../benchmarks/branch_pruning_benchmark.py -i NTUPLE_FOLDER -cf ./run_config.yaml [--maxfiles 1] [--uproot [-n NEVENTS]]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import yaml
+from dtpr.utils.functions import color_msg
+from utils.config_pruning import prune_config, particle_branches
+from utils.parallel_fill_histos import list_root_files
+
+_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs the dtpr command line, or the fill of a shard of the parallel runner, in this interpreter and writes the
+# bytes it read (rchar) to a file at exit
+_MEASURED_RUN = """
+import sys, json, runpy
+stats_path, kind, args = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+try:
+    if kind == "dtpr":
+        sys.argv = args
+        runpy.run_path(args[0], run_name="__main__")
+    else:
+        from utils.parallel_fill_histos import _fill_shard
+        _fill_shard(tuple(args))
+finally:
+    try:
+        with open("/proc/self/io") as f, open(stats_path, "w") as out:
+            out.write(dict(line.split(": ") for line in f.read().splitlines())["rchar"])
+    except OSError:
+        pass
+"""
+
+
+def measured_run(kind, args, outfolder, cwd):
+    """Run dtpr or a shard fill in a new process, return its wall time and the bytes it read (None if unknown)."""
+    stats_path = os.path.join(outfolder, "rchar")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_REPO, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", _MEASURED_RUN, stats_path, kind, json.dumps(args)], check=True, cwd=cwd, env=env)
+    wall = time.perf_counter() - start
+    try:
+        with open(stats_path) as f:
+            return wall, int(f.read())
+    except (OSError, ValueError):
+        return wall, None
+
+
+def read_branches(files, tree_name, branches, nevents):
+    """Read the branches of the first nevents of each file with uproot, return the bytes requested and the wall time."""
+    import uproot
+
+    nbytes, start = 0, time.perf_counter()
+    for path in files:
+        with uproot.open(path) as f:
+            tree = f[tree_name]
+            tree.arrays(sorted(branches & set(tree.keys())), entry_stop=nevents, library="ak")
+            nbytes += f.file.source.num_requested_bytes
+    return nbytes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="DTNTuple file/folder")
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML")
+    parser.add_argument("--maxfiles", type=int, default=1, help="Input files to use")
+    parser.add_argument("--uproot", action="store_true", help="Also read the branches of each config with uproot")
+    parser.add_argument("-n", "--nevents", type=int, default=None, help="Events to read per file with uproot (all if not set)")
+    args = parser.parse_args()
+
+    script = shutil.which("dtpr")
+    if script is None:
+        raise FileNotFoundError("The dtpr command is not available")
+    config_path = os.path.abspath(args.config)
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    pruned = prune_config(config_path)
+    files = [os.path.abspath(path) for path in list_root_files(args.inpath, args.maxfiles)]
+
+    # the inputs are given to dtpr through a temporary folder, and the pruned config is written next to the
+    # original one, so that relative sources still resolve. All the runs are done from the folder of the config
+    config_dir = os.path.dirname(config_path)
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory(dir=config_dir) as pruned_dir:
+        inpath = os.path.join(tmpdir, "inputs")
+        os.makedirs(inpath)
+        for i, path in enumerate(files):
+            os.symlink(path, os.path.join(inpath, f"{i}_{os.path.basename(path)}"))
+        pruned_path = os.path.join(pruned_dir, os.path.basename(config_path))
+        with open(pruned_path, "w") as f:
+            yaml.safe_dump(pruned, f, sort_keys=False)
+
+        runs = {
+            "dtpr fill-histos": lambda out: ("dtpr", [script, "fill-histos", "-i", inpath, "-o", out, "-cf", config_path]),
+            "runner": lambda out: ("shard", [0, files, config_path, config_path, os.path.join(out, "part.root"), None, False]),
+            "runner --prune": lambda out: ("shard", [0, files, config_path, pruned_path, os.path.join(out, "part.root"), None, True]),
+        }
+        results = {}
+        for i, (label, run) in enumerate(runs.items()):
+            outfolder = os.path.join(tmpdir, f"run{i}")
+            os.makedirs(outfolder)
+            results[label] = measured_run(*run(outfolder), outfolder, cwd=config_dir)
+            wall, nbytes = results[label]
+            read = f"{nbytes / 1e6:.1f} MB read" if nbytes is not None else "bytes read unknown"
+            color_msg(f"{label:>16}: {wall:.1f} s, {read}", color="blue", indentLevel=1)
+    (full_wall, full_bytes), (pruned_wall, pruned_bytes) = results["runner"], results["runner --prune"]
+    summary = f"with --prune, the runner takes {pruned_wall / max(full_wall, 1e-12):.1%} of the time"
+    if full_bytes and pruned_bytes is not None:
+        summary += f" and reads {pruned_bytes / full_bytes:.1%} of the bytes"
+    color_msg(summary, color="green")
+
+    if args.uproot:
+        tree_name = config.get("ntuple_tree_name", "/dtNtupleProducer/DTTREE").strip("/")
+        for label, cfg in (("full", config), ("pruned", pruned)):
+            branches = particle_branches(cfg["particle_types"])
+            nbytes, wall = read_branches(files, tree_name, branches, args.nevents)
+            color_msg(f"uproot {label:>6}: {len(branches)} branches, {nbytes / 1e6:.1f} MB read in {wall:.2f} s", color="blue", indentLevel=1)
+
+
+if __name__ == "__main__":
+    main()
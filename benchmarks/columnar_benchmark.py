@@ -0,0 +1,64 @@
+"""
+Regression check and timing of the columnar firmware shower emulation (``utils.columnar.emulate_fwshowers``)
+against the per event array emulation (``utils.shower_functions._emulate_fwshowers``).
+
+Digis are read in chunks with ``utils.columnar.iterate_particles`` (the config must define digis).
+
+Usage:
+    python benchmarks/columnar_benchmark.py -i NTUPLE -cf CONFIG [--step-size "100 MB"] [--thr 9 9 8 8]
+"""
+import argparse
+import time
+import numpy as np
+import awkward as ak
+from dtpr.utils.functions import color_msg
+from utils.columnar import iterate_particles, emulate_fwshowers
+from utils.shower_functions import _emulate_fwshowers
+
+_FIELDS = ["wh", "sc", "st", "sl", "nDigis", "BX", "average_BX_hits", "BXM1", "BXM2", "min_wire", "max_wire", "shower_profile"]
+
+
+def per_event_showers(digis, threshold):
+    cols = [ak.to_numpy(digis[f]).astype(np.int64) for f in ("wh", "sc", "st", "sl", "w", "BX")]
+    showers = [dict(shower, nDigis=shower["nhits"], shower_profile=list(shower["shower_profile"])) for shower in _emulate_fwshowers(*cols, threshold=threshold)]
+    return sorted([shower[f] for f in _FIELDS] for shower in showers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="DTNTuple file/folder")
+    parser.add_argument("-cf", "--config", required=True, help="Run config YAML")
+    parser.add_argument("--step-size", default="100 MB", help="Chunk size (number of events or memory size)")
+    parser.add_argument("--thr", type=int, nargs=4, default=[9, 9, 8, 8])
+    parser.add_argument("--maxchunks", type=int, default=None, help="Maximum number of chunks to process")
+    args = parser.parse_args()
+
+    step_size = int(args.step_size) if args.step_size.isdigit() else args.step_size
+    timings, nevents, nshowers, mismatches = {"read": 0., "columnar": 0., "per event": 0.}, 0, 0, 0
+    chunks = iterate_particles(args.inpath, args.config, names=["digis"], step_size=step_size)
+    for ichunk in range(args.maxchunks or np.iinfo(np.int64).max):
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        timings["read"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        showers = emulate_fwshowers(chunk["digis"], threshold=args.thr)
+        timings["columnar"] += time.perf_counter() - start
+
+        for digis, new in zip(chunk["digis"], showers.to_list()):
+            start = time.perf_counter()
+            ref = per_event_showers(digis, args.thr)
+            timings["per event"] += time.perf_counter() - start
+            mismatches += ref != sorted([shower[f] for f in _FIELDS] for shower in new)
+            nshowers += len(ref)
+        nevents += len(showers)
+
+    color_msg(f"{nevents} events, {nshowers} showers, {mismatches} events with differences", color="green" if not mismatches else "red")
+    for label, t in timings.items():
+        color_msg(f"{label:>10}: {1e3 * t / max(nevents, 1):.3f} ms/event", color="blue", indentLevel=1)
+
+
+if __name__ == "__main__":
+    main()
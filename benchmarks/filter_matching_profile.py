@@ -0,0 +1,55 @@
+"""
+Profile of the barrel filter matching preprocessor (``filter_main.barrel_filter_analyzer``), reporting the share of
+its time spent building the TP geometry (``build_tps_geometry``, once per event), the shower segments and the
+matching itself, plus the top functions by cumulative time.
+
+Run from the filter_studies folder, with a config including the filter_matching preprocessor:
+    cd filter_studies && python ../benchmarks/filter_matching_profile.py -i NTUPLE -cf ./run_config.yaml [-n NEVENTS]
+"""
+import argparse
+import cProfile
+import pstats
+from dtpr.utils.functions import color_msg
+
+_STEPS = ["barrel_filter_analyzer", "build_tps_geometry", "get_shower_segment", "match_tps_to_showers"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="DTNTuple file/folder")
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML")
+    parser.add_argument("-n", "--nevents", type=int, default=100)
+    parser.add_argument("--top", type=int, default=15, help="Number of functions to print")
+    parser.add_argument("-o", "--output", default=None, help="Path to save the raw profile (e.g. for snakeviz)")
+    args = parser.parse_args()
+
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+
+    RUN_CONFIG.change_config_file(config_path=args.config)
+    ntuple = NTuple(inputFolder=args.inpath)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for iev, _ in enumerate(ntuple.events):
+        if iev + 1 >= args.nevents:
+            break
+    profiler.disable()
+
+    stats = pstats.Stats(profiler)
+    cumulative = {}
+    for (filename, _, funcname), (_, _, _, ct, _) in stats.stats.items():
+        if funcname in _STEPS and filename.endswith("filter_main.py"):
+            cumulative[funcname] = cumulative.get(funcname, 0.) + ct
+    total = cumulative.get("barrel_filter_analyzer", 0.)
+    color_msg(f"filter_matching over {args.nevents} events: {total:.2f} s", color="green")
+    for step in _STEPS[1:]:
+        color_msg(f"{step:>22}: {cumulative.get(step, 0.):8.3f} s ({cumulative.get(step, 0.) / max(total, 1e-12):.1%})", color="blue", indentLevel=1)
+
+    stats.sort_stats("cumulative").print_stats(args.top)
+    if args.output:
+        stats.dump_stats(args.output)
+
+
+if __name__ == "__main__":
+    main()
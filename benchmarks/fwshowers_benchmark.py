@@ -0,0 +1,99 @@
+"""
+Regression check and timing of the firmware shower emulation engines (see ``utils.shower_functions``).
+
+Events are either read from a DTNTuple (``-i``/``-cf``) or generated synthetically (noise hits plus
+a few dense clusters). For every event both engines are run and their showers compared field by field,
+exiting with an error if they differ. The outputs of the original emulation are pinned in ``tests/test_fwshowers.py``.
+
+Usage:
+    python benchmarks/fwshowers_benchmark.py [-n NEVENTS] [-i NTUPLE -cf CONFIG] [--thr 9 9 8 8]
+"""
+import sys
+import argparse
+import time
+import numpy as np
+from dtpr.utils.functions import color_msg
+from utils.shower_functions import _emulate_fwshowers, _emulate_fwshowers_loop
+
+_FIELDS = ["wh", "sc", "st", "sl", "nhits", "BX", "average_BX_hits", "BXM1", "BXM2", "min_wire", "max_wire"]
+
+
+def synthetic_columns(rng, nnoise=300, nclusters=4, maxbx=40):
+    """Noise digis spread over the whole barrel plus some dense clusters, sorted by BX."""
+    cols = [
+        rng.integers(-2, 3, nnoise), rng.integers(1, 15, nnoise), rng.integers(1, 5, nnoise),
+        rng.integers(1, 4, nnoise), rng.integers(0, 97, nnoise), rng.integers(0, maxbx, nnoise),
+    ]
+    for _ in range(nclusters):
+        n = rng.integers(5, 40)
+        loc = [rng.integers(-2, 3), rng.integers(1, 15), rng.integers(1, 5), rng.integers(1, 4)]
+        w0, bx0 = rng.integers(0, 80), rng.integers(0, maxbx - 10)
+        for i, val in enumerate(loc):
+            cols[i] = np.append(cols[i], np.full(n, val))
+        cols[4] = np.append(cols[4], w0 + rng.integers(0, 16, n))
+        cols[5] = np.append(cols[5], bx0 + rng.integers(0, 10, n))
+    order = np.argsort(cols[5], kind="stable")
+    return tuple(np.asarray(c, dtype=np.int64)[order] for c in cols)
+
+
+def ntuple_columns(inpath, config, nevents):
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+    from utils.shower_functions import _digis_columns
+
+    RUN_CONFIG.change_config_file(config_path=config)
+    ntuple = NTuple(inputFolder=inpath)
+    for iev, ev in enumerate(ntuple.events):
+        if iev >= nevents:
+            break
+        if ev is None or not getattr(ev, "digis", None):
+            continue
+        yield _digis_columns(ev.digis)
+
+
+def same_showers(ref, new):
+    if len(ref) != len(new):
+        return False
+    for a, b in zip(ref, new):
+        if any(a[f] != b[f] for f in _FIELDS):
+            return False
+        if not np.array_equal(a["shower_profile"], b["shower_profile"]) or not np.array_equal(a["digis_idx"], b["digis_idx"]):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--nevents", type=int, default=500)
+    parser.add_argument("-i", "--inpath", default=None, help="DTNTuple file/folder. If not set, synthetic events are used")
+    parser.add_argument("-cf", "--config", default=None, help="Run config YAML (needed with -i)")
+    parser.add_argument("--thr", type=int, nargs=4, default=[9, 9, 8, 8])
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.inpath:
+        events = list(ntuple_columns(args.inpath, args.config, args.nevents))
+    else:
+        rng = np.random.default_rng(args.seed)
+        events = [synthetic_columns(rng) for _ in range(args.nevents)]
+
+    timings, nshowers, mismatches = {"loop": 0., "vectorized": 0.}, 0, 0
+    for cols in events:
+        start = time.perf_counter()
+        ref = _emulate_fwshowers_loop(*cols, threshold=args.thr)
+        timings["loop"] += time.perf_counter() - start
+        start = time.perf_counter()
+        new = _emulate_fwshowers(*cols, threshold=args.thr)
+        timings["vectorized"] += time.perf_counter() - start
+        nshowers += len(ref)
+        mismatches += not same_showers(ref, new)
+
+    color_msg(f"{len(events)} events, {nshowers} showers, {mismatches} events with differences", color="green" if not mismatches else "red")
+    for engine, t in timings.items():
+        color_msg(f"{engine:>10}: {1e3 * t / max(len(events), 1):.3f} ms/event", color="blue", indentLevel=1)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
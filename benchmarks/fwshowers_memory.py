@@ -0,0 +1,62 @@
+"""
+Memory footprint per event of the firmware shower emulation engines (see ``utils.shower_functions``).
+
+For every event the peak of the memory allocated by the emulation is traced (``tracemalloc``), and
+compared with the size of the full-detector dense arrays used by the original emulation
+(5x15x5x3 superlayers x (MaxBX+1) BXs x 97 wires for the hits profile). The peak RSS of the process
+is also reported, so run it once per engine to compare them.
+
+Usage:
+    python benchmarks/fwshowers_memory.py --engine {vectorized,loop} [-n NEVENTS] [-i NTUPLE -cf CONFIG]
+"""
+import argparse
+import resource
+import tracemalloc
+import numpy as np
+from dtpr.utils.functions import color_msg
+from utils.shower_functions import _emulate_fwshowers, _emulate_fwshowers_loop
+from benchmarks.fwshowers_benchmark import synthetic_columns, ntuple_columns
+
+
+def dense_footprint(maxbx):
+    """Bytes allocated per event by the full-detector dense layout of the original emulation."""
+    nsl, itemsize = 5 * 15 * 5 * 3, np.dtype(int).itemsize
+    return nsl * itemsize * ((3 + 97) * (maxbx + 1) + 2 * 128)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=["vectorized", "loop"], default="vectorized")
+    parser.add_argument("-n", "--nevents", type=int, default=200)
+    parser.add_argument("-i", "--inpath", default=None, help="DTNTuple file/folder. If not set, synthetic events are used")
+    parser.add_argument("-cf", "--config", default=None, help="Run config YAML (needed with -i)")
+    parser.add_argument("--thr", type=int, nargs=4, default=[9, 9, 8, 8])
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.inpath:
+        events = ntuple_columns(args.inpath, args.config, args.nevents)
+    else:
+        rng = np.random.default_rng(args.seed)
+        events = (synthetic_columns(rng, maxbx=rng.integers(20, 200)) for _ in range(args.nevents))
+
+    emulate = _emulate_fwshowers if args.engine == "vectorized" else _emulate_fwshowers_loop
+    peaks, dense = [], []
+    tracemalloc.start()
+    for cols in events:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        emulate(*cols, threshold=args.thr)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        dense.append(dense_footprint(int(cols[5].max())))
+    tracemalloc.stop()
+
+    peaks, dense = np.array(peaks) / 2**20, np.array(dense) / 2**20
+    color_msg(f"{args.engine} engine, {peaks.size} events", color="green")
+    color_msg(f"traced peak per event: mean {peaks.mean():.3f} MB, max {peaks.max():.3f} MB", color="blue", indentLevel=1)
+    color_msg(f"dense layout per event: mean {dense.mean():.3f} MB, max {dense.max():.3f} MB", color="blue", indentLevel=1)
+    color_msg(f"process peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.1f} MB", color="blue", indentLevel=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Time of the genmuon_matcher preprocessor (``utils.genmuon_functions.analyze_genmuon_matches``) against the loop
+over all the generator muon - segment and matched segment - TP pairs it replaces (``match_genmuon_offline_segment``
+and ``match_offline_AMtp`` called pair by pair), on the same events, checking that both fill the same matched
+lists (same particles, same order). It also reports the segment - TP candidate pairs evaluated by the loop (every
+TP for each matched segment of each muon), by all TPs against the matched segments once, and by the chamber-keyed
+TP index (``utils.segment_functions.get_tps_by_chamber``, the BX == 0 TPs of the segment chamber).
+
+Run from a study folder, with a config including the genmuon_matcher preprocessor:
+    cd efficiencies && python ../benchmarks/genmuon_matching_benchmark.py -i NTUPLE -cf ./run_config.yaml [-n NEVENTS]
+"""
+import time
+import argparse
+from dtpr.utils.functions import color_msg
+from utils.genmuon_functions import analyze_genmuon_matches, match_genmuon_offline_segment
+from utils.segment_functions import match_offline_AMtp, get_tps_by_chamber, _chamber_sector
+
+_MATCHED_LISTS = {
+    "genmuons": ("matched_segments", "matched_tps"),
+    "segments": ("matched_genmuons", "matched_tps"),
+    "tps": ("matched_segments", "matched_genmuons"),
+}
+
+
+def loop_genmuon_matches(ev):
+    """Pair by pair matching, as analyze_genmuon_matches used to do"""
+    for gm in ev.genmuons:
+        for seg in ev.segments:
+            match_genmuon_offline_segment(gm, seg, 0.1, 0.3)
+        for _seg in getattr(gm, 'matched_segments', []):
+            for tp in ev.tps:
+                match_offline_AMtp(_seg, tp, max_dPhi=0.1)
+
+
+def count_candidate_pairs(ev):
+    """Segment - TP pairs evaluated by the loop, by all TPs against each matched segment and by the chamber index"""
+    segments = [seg for seg in ev.segments if getattr(seg, "matched_genmuons", [])]
+    tps_by_chamber = get_tps_by_chamber(ev)
+    loop = sum(len(getattr(gm, "matched_segments", [])) for gm in ev.genmuons) * len(ev.tps)
+    chamber = sum(len(tps_by_chamber.get((seg.wh, _chamber_sector(seg.sc), seg.st, True), [])) for seg in segments)
+    return loop, len(segments) * len(ev.tps), chamber
+
+
+def reset_matches(ev):
+    for ptype, attrs in _MATCHED_LISTS.items():
+        for particle in getattr(ev, ptype, []):
+            for attr in attrs:
+                setattr(particle, attr, [])
+
+
+def matches(ev):
+    return [
+        [[p.index for p in getattr(particle, attr, [])] for particle in getattr(ev, ptype, []) for attr in attrs]
+        for ptype, attrs in _MATCHED_LISTS.items()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="DTNTuple file/folder")
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML")
+    parser.add_argument("-n", "--nevents", type=int, default=1000)
+    args = parser.parse_args()
+
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+
+    RUN_CONFIG.change_config_file(config_path=args.config)
+    ntuple = NTuple(inputFolder=args.inpath)
+
+    times = {"loop": 0., "vectorized": 0.}
+    nevents = mismatches = 0
+    pairs = [0, 0, 0]
+    for iev, ev in enumerate(ntuple.events):
+        if iev >= args.nevents:
+            break
+        if ev is None:
+            continue
+        nevents += 1
+        results = {}
+        for label, matcher in (("loop", loop_genmuon_matches), ("vectorized", analyze_genmuon_matches)):
+            reset_matches(ev)
+            start = time.perf_counter()
+            matcher(ev)
+            times[label] += time.perf_counter() - start
+            results[label] = matches(ev)
+        mismatches += results["loop"] != results["vectorized"]
+        pairs = [total + n for total, n in zip(pairs, count_candidate_pairs(ev))]
+
+    color_msg(f"segment-TP candidate pairs: {pairs[0]} in the loop, {pairs[1]} matched segments x TPs, "
+              f"{pairs[2]} with the chamber index ({pairs[2] / max(pairs[1], 1):.2%})", color="blue")
+    for label, wall in times.items():
+        color_msg(f"{label:>10}: {1e3 * wall / max(nevents, 1):.3f} ms/event", color="blue", indentLevel=1)
+    color_msg(f"speedup: {times['loop'] / max(times['vectorized'], 1e-12):.2f}x over {nevents} events, "
+              f"events with different matches: {mismatches}", color="green" if not mismatches else "red")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Time to fill the matched lists of high multiplicity events with plain lists (``if x not in matched`` before each
+append, as ``dtpr.utils.functions.append_to_matched_list``) and with ``utils.functions.MatchedList`` (through
+``utils.functions.append_to_matched_list``), checking that both keep the same particles in the same order.
+
+Each shower is matched to a number of TPs (and each of those TPs to all the showers), and every pair is added
+several times, as when the same pair is seen by several BF boards or matchers.
+
+Usage (from the repository root):
+    python benchmarks/matched_list_benchmark.py [--showers 20] [--tps 10 30 100 300] [--repeat 3]
+"""
+import time
+import random
+import argparse
+from dtpr.utils.functions import color_msg
+from utils.functions import append_to_matched_list
+
+
+class _Particle:
+    """Minimal particle, matched lists are plain attributes as in the run configs (matched_tps: [])"""
+    def __init__(self, index):
+        self.index = index
+        self.matched_tps = []
+        self.matched_showers = []
+
+
+def fill_lists(pairs):
+    for shower, tp in pairs:
+        if tp not in shower.matched_tps:
+            shower.matched_tps.append(tp)
+        if shower not in tp.matched_showers:
+            tp.matched_showers.append(shower)
+
+
+def fill_matched_lists(pairs):
+    for shower, tp in pairs:
+        append_to_matched_list(shower, "matched_tps", tp)
+        append_to_matched_list(tp, "matched_showers", shower)
+
+
+def make_event(nshowers, ntps, repeat, seed=0):
+    """Showers and TPs of an event, with every shower matched to every TP, each pair repeated, in random order"""
+    showers = [_Particle(i) for i in range(nshowers)]
+    tps = [_Particle(i) for i in range(ntps)]
+    pairs = [(shower, tp) for shower in showers for tp in tps] * repeat
+    random.Random(seed).shuffle(pairs)
+    return showers, tps, pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--showers", type=int, default=20, help="Showers per event")
+    parser.add_argument("--tps", type=int, nargs="+", default=[10, 30, 100, 300], help="Matched TPs per shower")
+    parser.add_argument("--repeat", type=int, default=3, help="Times each pair is added")
+    parser.add_argument("--events", type=int, default=20)
+    args = parser.parse_args()
+
+    for ntps in args.tps:
+        times, contents = {}, {}
+        for label, fill in (("list", fill_lists), ("MatchedList", fill_matched_lists)):
+            events = [make_event(args.showers, ntps, args.repeat, seed) for seed in range(args.events)]
+            start = time.perf_counter()
+            for _, _, pairs in events:
+                fill(pairs)
+            times[label] = (time.perf_counter() - start) / args.events
+            contents[label] = [
+                ([[tp.index for tp in s.matched_tps] for s in showers], [[s.index for s in tp.matched_showers] for tp in tps])
+                for showers, tps, _ in events
+            ]
+        same = contents["list"] == contents["MatchedList"]
+        color_msg(
+            f"{args.showers} showers x {ntps} TPs: list {1e3 * times['list']:.2f} ms/event, "
+            f"MatchedList {1e3 * times['MatchedList']:.2f} ms/event ({times['list'] / times['MatchedList']:.1f}x), "
+            f"same matches: {same}", color="green" if same else "red"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Time of ``agreement_functions.dump_hits_to_nhits`` (cumulative sum over the bxsend occupancy) against the loop over
+every bxsend it replaces (a ``.loc`` selection of the hits per bxsend and a FIFO of the bxsends with hits), checking
+that both give the same [bxsend, nhits] trend. The loop is only timed up to ``--max-loop-bx`` bxsends.
+
+Usage (from the repository root):
+    python benchmarks/nhits_trend_benchmark.py [--bx 1000 10000 1000000] [--occupancy 0.3]
+"""
+import os
+import sys
+import time
+import argparse
+from collections import deque
+import numpy as np
+import pandas as pd
+from dtpr.utils.functions import color_msg
+
+# the agreement scripts import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agreement"))
+from agreement_functions import dump_hits_to_nhits  # noqa: E402
+
+
+def loop_dump_hits_to_nhits(hits_df, buff_persistance=16):
+    """dump_hits_to_nhits as it was, bxsend by bxsend"""
+    _hits_df = hits_df.sort_values("bxsend").copy()
+    hits_buffer = deque()
+    nhits_trend = []
+    min_bxsend = _hits_df["bxsend"].min()
+    max_bxsend = _hits_df["bxsend"].max()
+    for bxsend in range(min_bxsend, max_bxsend + 17):
+        hits = _hits_df.loc[_hits_df["bxsend"] == bxsend]
+        if not hits.empty:
+            hits_buffer.extend([(bxsend, hits["id"].to_list())])
+        nhits_trend.append([bxsend, len(hits_buffer)])
+        while hits_buffer and bxsend - hits_buffer[0][0] > buff_persistance:
+            hits_buffer.popleft()
+    return np.array(nhits_trend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bx", type=int, nargs="+", default=[1000, 10000, 1000000], help="bxsend ranges")
+    parser.add_argument("--occupancy", type=float, default=0.3, help="Mean hits per bxsend")
+    parser.add_argument("--max-loop-bx", type=int, default=20000, help="Largest range timed with the loop")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for nbx in args.bx:
+        nhits = max(int(nbx * args.occupancy), 1)
+        hits_df = pd.DataFrame({"bxsend": rng.integers(0, nbx, nhits), "id": np.arange(nhits)})
+
+        start = time.perf_counter()
+        trend = dump_hits_to_nhits(hits_df)
+        new_time = time.perf_counter() - start
+        msg = f"{nbx:>8} bxsends, {nhits:>7} hits: cumsum {1e3 * new_time:8.2f} ms"
+
+        if nbx <= args.max_loop_bx:
+            start = time.perf_counter()
+            reference = loop_dump_hits_to_nhits(hits_df)
+            loop_time = time.perf_counter() - start
+            assert np.array_equal(trend, reference), "different nhits trends"
+            msg += f", loop {1e3 * loop_time:10.1f} ms (x{loop_time / new_time:.0f})"
+        color_msg(msg, color="blue", indentLevel=1)
+    color_msg("Same nhits trends with both implementations", color="green")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Throughput (showers/s) of the NN shower discriminator at different batch sizes (see
+``utils.shower_functions.score_fwshowers``). Shower profiles are taken from the firmware emulation
+of the events, which are either read from a DTNTuple (``-i``/``-cf``) or generated synthetically.
+
+Usage:
+    python benchmarks/nn_filter_throughput.py [-n NEVENTS] [-i NTUPLE -cf CONFIG] [--batch-sizes 1 64 1024] [--backend numpy]
+"""
+import argparse
+import time
+import numpy as np
+from types import SimpleNamespace
+from dtpr.utils.functions import color_msg
+from utils.shower_functions import _emulate_fwshowers, score_fwshowers, _nn_available
+from benchmarks.fwshowers_benchmark import synthetic_columns, ntuple_columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--nevents", type=int, default=1000)
+    parser.add_argument("-i", "--inpath", default=None, help="DTNTuple file/folder. If not set, synthetic events are used")
+    parser.add_argument("-cf", "--config", default=None, help="Run config YAML (needed with -i)")
+    parser.add_argument("--thr", type=int, nargs=4, default=[9, 9, 8, 8])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 1024])
+    parser.add_argument("--backend", choices=["numpy", "torch"], default="numpy")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if not _nn_available(args.backend):
+        color_msg("Shower discriminator model or scaler not found, nothing to benchmark", color="red")
+        return
+
+    if args.inpath:
+        events = ntuple_columns(args.inpath, args.config, args.nevents)
+    else:
+        rng = np.random.default_rng(args.seed)
+        events = (synthetic_columns(rng) for _ in range(args.nevents))
+    showers = [
+        SimpleNamespace(shower_profile=shower["shower_profile"])
+        for cols in events for shower in _emulate_fwshowers(*cols, threshold=args.thr)
+    ]
+    color_msg(f"{len(showers)} showers", color="green")
+
+    reference = None
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        score_fwshowers(showers, batch_size=batch_size, backend=args.backend)
+        elapsed = time.perf_counter() - start
+        probs = np.array([shower.prediction_value for shower in showers])
+        reference = probs if reference is None else reference
+        color_msg(
+            f"batch size {batch_size:>5}: {len(showers) / elapsed:12.1f} showers/s, "
+            f"max |dp| wrt batch size {args.batch_sizes[0]}: {np.abs(probs - reference).max():.2e}",
+            color="blue", indentLevel=1,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Per-event time of the preprocessor chain of a run config (by default ``efficiencies/run_config.yaml``)
+with the location index of ``utils.functions.get_particles_by_loc`` and without it (plain
+``ev.filter_particles`` scans, as before the index was introduced).
+
+Usage:
+    python benchmarks/particle_index_benchmark.py -i NTUPLE [-cf CONFIG] [-n NEVENTS]
+"""
+import argparse
+import os
+import time
+import numpy as np
+from dtpr.base import NTuple
+from dtpr.base.config import RUN_CONFIG
+from dtpr.utils.functions import color_msg
+import utils.functions
+import utils.shower_functions
+import utils.genmuon_functions
+
+_PATCHED_MODULES = [utils.shower_functions, utils.genmuon_functions]
+
+
+def _filter_particles_by_loc(ev, particle_type, **loc):
+    return ev.filter_particles(particle_type, **loc)
+
+
+def time_events(inpath, config, nevents):
+    RUN_CONFIG.change_config_file(config_path=config)
+    ntuple = NTuple(inputFolder=inpath)
+    times = []
+    start = time.perf_counter()
+    for iev, ev in enumerate(ntuple.events):
+        times.append(time.perf_counter() - start)
+        if iev + 1 >= nevents:
+            break
+        start = time.perf_counter()
+    return np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="DTNTuple file/folder, e.g. a Zprime PU200 ntuple")
+    parser.add_argument("-cf", "--config", default=os.path.join(os.path.dirname(__file__), "..", "efficiencies", "run_config.yaml"))
+    parser.add_argument("-n", "--nevents", type=int, default=200)
+    args = parser.parse_args()
+
+    with_index = time_events(args.inpath, args.config, args.nevents)
+
+    # without the index: location queries are linear scans and the indexer preprocessor does nothing
+    for module in _PATCHED_MODULES:
+        module.get_particles_by_loc = _filter_particles_by_loc
+    utils.functions.index_particles = lambda ev, **kwargs: None
+    without_index = time_events(args.inpath, args.config, args.nevents)
+
+    color_msg(f"{with_index.size} events", color="green")
+    for label, times in [("filter_particles", without_index), ("location index", with_index)]:
+        color_msg(f"{label:>16}: {1e3 * times.mean():.2f} ms/event (median {1e3 * np.median(times):.2f} ms)", color="blue", indentLevel=1)
+
+
+if __name__ == "__main__":
+    main()
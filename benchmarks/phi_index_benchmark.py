@@ -0,0 +1,74 @@
+"""
+Equivalence check and timing versus occupancy of the phi-bin indexed TP-shower matching
+(``ray_seg_matching_indexed``) against the exhaustive matcher (``ray_seg_matching_matrix``), see
+``filter_studies/filter_matching_functions.py``.
+
+Synthetic barrel-like events, as the groups matched by the barrel filter (showers of one wheel and station against
+the TPs of the other stations): shower segments are chords of one station at random phi, and TPs are rays starting
+at the other stations, close to the radial direction.
+
+Usage:
+    python benchmarks/phi_index_benchmark.py [--ntps 20 100 1000] [--nshowers 2 10 100 1000] [--nbins 72] [--margin 0.01]
+"""
+import argparse
+import time
+import numpy as np
+from dtpr.utils.functions import color_msg
+from filter_studies.filter_matching_functions import ray_seg_matching_matrix, ray_seg_matching_indexed
+
+_STATIONS_RADII = np.array([430., 520., 620., 720.]) # cm, approximate
+
+
+def barrel_geometry(rng, ntps, nshowers):
+    station = rng.integers(0, 4)
+    phi = rng.uniform(-np.pi, np.pi, nshowers)
+    r = np.full(nshowers, _STATIONS_RADII[station]) + rng.normal(0, 5, nshowers)
+    center = np.stack([r * np.cos(phi), r * np.sin(phi)], axis=1)
+    tangent = np.stack([-np.sin(phi), np.cos(phi)], axis=1)
+    half_length = rng.uniform(5, 75, (nshowers, 1))
+    a, b = center - tangent * half_length, center + tangent * half_length
+
+    phi = rng.uniform(-np.pi, np.pi, ntps)
+    r = np.delete(_STATIONS_RADII, station)[rng.integers(0, 3, ntps)]
+    p = np.stack([r * np.cos(phi), r * np.sin(phi)], axis=1)
+    angle = phi + rng.normal(0, 0.5, ntps)
+    d = np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    return p, d, a, b
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ntps", type=int, nargs="+", default=[20, 100, 1000])
+    parser.add_argument("--nshowers", type=int, nargs="+", default=[2, 10, 100, 1000])
+    parser.add_argument("--nbins", type=int, default=72)
+    parser.add_argument("--margin", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for ntps in args.ntps:
+        for nshowers in args.nshowers:
+            timings, mismatches, nmatches = {"exhaustive": 0., "indexed": 0.}, 0, 0
+            for _ in range(args.repeat):
+                p, d, a, b = barrel_geometry(rng, ntps, nshowers)
+                start = time.perf_counter()
+                exhaustive = ray_seg_matching_matrix(p, d, a, b)
+                timings["exhaustive"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                indexed = ray_seg_matching_indexed(p, d, a, b, nbins=args.nbins, margin=args.margin)
+                timings["indexed"] += time.perf_counter() - start
+
+                mismatches += int(np.count_nonzero(exhaustive != indexed))
+                nmatches += int(np.count_nonzero(exhaustive))
+            color_msg(
+                f"TPs={ntps:<5} showers={nshowers:<5} exhaustive: {1e3 * timings['exhaustive'] / args.repeat:8.3f} ms  "
+                f"indexed: {1e3 * timings['indexed'] / args.repeat:8.3f} ms  "
+                f"speedup: {timings['exhaustive'] / max(timings['indexed'], 1e-12):6.2f}x  matches: {nmatches}  mismatches: {mismatches}",
+                color="blue" if not mismatches else "red", indentLevel=1,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Regression check and timing of the TP-shower matching: per pair ``ray_seg_matching`` against the batch
+``ray_seg_matching_matrix`` (see ``filter_studies/filter_matching_functions.py``).
+
+Microbenchmark over random rays and segments for N, M in (1, 10, 100, 1000). For the largest sizes the per pair
+reference is timed and checked on a random subset of the pairs. With ``-i``/``-cf`` (run from the filter_studies
+folder), the barrel filter analyzer is run over the events and every batch matching is checked pair by pair.
+
+Usage:
+    python benchmarks/ray_matching_benchmark.py [--sizes 1 10 100 1000] [--max-pairs 20000]
+    cd filter_studies && python ../benchmarks/ray_matching_benchmark.py -i NTUPLE -cf ./run_config.yaml [-n NEVENTS]
+"""
+import argparse
+import time
+import numpy as np
+from dtpr.utils.functions import color_msg
+from filter_studies.filter_matching_functions import ray_seg_matching, ray_seg_matching_matrix
+
+
+def random_geometry(rng, n, m):
+    """Rays starting around the origin and segments around them, in cm."""
+    p, d = rng.uniform(-700, 700, (n, 2)), rng.normal(size=(n, 2))
+    a = rng.uniform(-700, 700, (m, 2))
+    b = a + rng.uniform(-150, 150, (m, 2))
+    return p, d, a, b
+
+
+def microbenchmark(sizes, max_pairs, seed):
+    rng = np.random.default_rng(seed)
+    for n in sizes:
+        for m in sizes:
+            p, d, a, b = random_geometry(rng, n, m)
+            start = time.perf_counter()
+            matrix = ray_seg_matching_matrix(p, d, a, b)
+            t_matrix = time.perf_counter() - start
+
+            pairs = [(i, j) for i in range(n) for j in range(m)] if n * m <= max_pairs else \
+                list(zip(rng.integers(0, n, max_pairs), rng.integers(0, m, max_pairs)))
+            start = time.perf_counter()
+            ref = [ray_seg_matching(p[i], d[i], a[j], b[j]) for i, j in pairs]
+            t_pairs = (time.perf_counter() - start) * n * m / len(pairs)
+            mismatches = sum(ref_ij != matrix[i, j] for ref_ij, (i, j) in zip(ref, pairs))
+
+            color_msg(
+                f"N={n:<5} M={m:<5} per pair: {1e3 * t_pairs:10.3f} ms  matrix: {1e3 * t_matrix:8.3f} ms  "
+                f"speedup: {t_pairs / max(t_matrix, 1e-12):8.1f}x  mismatches: {mismatches}/{len(pairs)}",
+                color="blue" if not mismatches else "red", indentLevel=1,
+            )
+
+
+def events_check(inpath, config, nevents):
+    import filter_main
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+
+    batch_matching, stats = filter_main.match_tps_to_showers, {"pairs": 0, "mismatches": 0}
+
+    def checked_matching(positions, directions, showers):
+        matrix = batch_matching(positions, directions, showers)
+        ref = [[ray_seg_matching(p, d, shower[0, :-1], shower[1, :-1]) for shower in showers] for p, d in zip(positions, directions)]
+        stats["pairs"] += matrix.size
+        stats["mismatches"] += int(np.count_nonzero(np.array(ref, dtype=bool).reshape(matrix.shape) != matrix))
+        return matrix
+
+    filter_main.match_tps_to_showers = checked_matching
+    RUN_CONFIG.change_config_file(config_path=config)
+    ntuple = NTuple(inputFolder=inpath)
+    for iev, ev in enumerate(ntuple.events):
+        if iev >= nevents:
+            break
+    color_msg(f"{stats['pairs']} TP-shower pairs, {stats['mismatches']} mismatches", color="green" if not stats["mismatches"] else "red")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--max-pairs", type=int, default=20000, help="Maximum number of pairs checked with the per pair function")
+    parser.add_argument("-i", "--inpath", default=None, help="DTNTuple file/folder to check the matching on events")
+    parser.add_argument("-cf", "--config", default=None, help="Run config YAML with the filter_matching preprocessor (needed with -i)")
+    parser.add_argument("-n", "--nevents", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.inpath:
+        events_check(args.inpath, args.config, args.nevents)
+    else:
+        microbenchmark(args.sizes, args.max_pairs, args.seed)
+
+
+if __name__ == "__main__":
+    main()
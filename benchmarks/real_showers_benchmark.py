@@ -0,0 +1,178 @@
+"""
+Regression check and timing of ``utils.shower_functions.build_real_showers`` against the DataFrame
+based implementation it replaced (kept here as ``dataframe_build_real_showers``), exiting with an error if
+they differ. Its outputs are also pinned in ``tests/test_real_showers.py``.
+
+Events are either read from a DTNTuple (``-i``/``-cf``, the config must define digis, simhits and
+genmuons) or generated synthetically.
+
+Usage:
+    python benchmarks/real_showers_benchmark.py [-n NEVENTS] [-i NTUPLE -cf CONFIG] [--thr 8]
+"""
+import sys
+import argparse
+import time
+import warnings
+import numpy as np
+from pandas import DataFrame
+from typing import Optional
+from dtpr.base import Event, Particle
+from dtpr.utils.functions import color_msg, get_unique_locs
+from utils.functions import get_particles_by_loc
+from utils.shower_functions import build_real_showers
+
+_FIELDS = ["index", "wh", "sc", "st", "sl", "shower_type", "nsimhits", "ndigis", "min_wire", "max_wire"]
+
+
+def dataframe_build_real_showers(ev: Event, threshold: Optional[int] = None,Filtersimhits:Optional[bool] = True, debug: Optional[bool] = False) -> None:
+    """
+    build_real_showers as it was, with a DataFrame per superlayer (the commented out digis only
+    showers are dropped)
+    """
+
+    if not hasattr(ev, "simhits"):
+        warnings.warn("'simhits' is not included in _PARTICLE_TYPES. Please check the config YAML file. Skipping real shower building.")
+        return
+
+    ev.realshowers = []
+    thr = 8 if threshold is None else threshold
+
+    simhits_locs = get_unique_locs(particles=ev.simhits, loc_ids=["wh", "sc", "st", "sl"])
+    digis_locs = get_unique_locs(particles=ev.digis, loc_ids=["wh", "sc", "st", "sl"])
+    indexs = simhits_locs.union(digis_locs)
+
+    for wh, sc, st, sl in indexs:
+        simhits_sdf = DataFrame([simhit.__dict__ for simhit in get_particles_by_loc(ev, "simhits", wh=wh, sc=sc, st=st, sl=sl)])
+        digis_sdf = DataFrame([digi.__dict__ for digi in get_particles_by_loc(ev, "digis", wh=wh, sc=sc, st=st, sl=sl)])
+        
+        # Filter simhits to only include those that have a corresponding digi at the same (l, w) location
+        if Filtersimhits:
+            if not simhits_sdf.empty and not digis_sdf.empty:
+                # Create sets of (l, w) coordinates for efficient lookup
+                digi_coords = set(zip(digis_sdf['l'], digis_sdf['w']))
+                simhits_sdf = simhits_sdf[simhits_sdf.apply(lambda row: (row['l'], row['w']) in digi_coords, axis=1)]
+            elif digis_sdf.empty:
+                # If there are no digis, clear simhits_sdf as there are no matching coordinates
+                simhits_sdf = DataFrame()
+
+        _build_shower = False
+
+        if not simhits_sdf.empty:
+            simhits_sdf = simhits_sdf[["l", "w", "particle_type"]].drop_duplicates()
+            # conditions...
+            # pass the threshold of hits
+            pass_thr = len(simhits_sdf.drop_duplicates(["l", "w"])) >= thr
+            # at least 3 muon hits
+            are_muons_hits = len(simhits_sdf.loc[simhits_sdf["particle_type"].abs() == 13]) >= 3
+            # at least 1 electron hit
+            are_electron_hits = len(simhits_sdf.loc[simhits_sdf["particle_type"].abs() == 11]) > 0
+            # hits are spread out in the chamber
+            spread = simhits_sdf["w"].std()**2 > 1
+            # are duplicated matched segments
+            matched_segments = [seg for gm in ev.genmuons for seg in getattr(gm, 'matched_segments', [])]
+            if matched_segments:
+                are_duplicated_segments = len(matched_segments) > len(get_unique_locs(matched_segments, loc_ids=["wh", "sc", "st"]))
+            else:
+                are_duplicated_segments = False # -- for G4 DTNtuples there are no segments
+
+            if pass_thr:
+                if debug: color_msg(f'spread: {spread} --> {simhits_sdf["w"].std()**2}', "purple", indentLevel=2)
+                if are_muons_hits and are_electron_hits and spread:
+                    shower_type = 1
+                elif are_electron_hits and spread:
+                    shower_type = 2
+                elif are_duplicated_segments:
+                    shower_type = 3
+                else:
+                    continue
+                _build_shower = True
+
+        if _build_shower:
+            _index = ev.realshowers[-1].index + 1 if ev.realshowers else 0
+            _shower = Particle(index=_index, wh=wh, sc=sc, st=st, name="Shower") 
+            _shower.shower_type = shower_type
+            _shower.sl = sl
+            _shower.nsimhits = len(simhits_sdf.drop_duplicates(["l", "w"])) if not simhits_sdf.empty else 0
+            _shower.ndigis = len(digis_sdf.drop_duplicates(["l", "w"])) if not digis_sdf.empty else 0
+            _shower.min_wire = int(min(simhits_sdf["w"].min(), digis_sdf["w"].min())) if not simhits_sdf.empty and not digis_sdf.empty else (int(simhits_sdf["w"].min()) if not simhits_sdf.empty else int(digis_sdf["w"].min()))
+            _shower.max_wire = int(max(simhits_sdf["w"].max(), digis_sdf["w"].max())) if not simhits_sdf.empty and not digis_sdf.empty else (int(simhits_sdf["w"].max()) if not simhits_sdf.empty else int(digis_sdf["w"].max()))
+            ev.realshowers.append(_shower)
+            if debug:
+                color_msg(
+                    f'Realshower detected in (wh, sc, st, sl): ({wh}, {sc}, {st}, {sl}) - type: {shower_type}',
+                    "green",
+                    indentLevel=2,
+                )
+
+
+def synthetic_event(rng, ndigis=600, nsimhits=400):
+    """Random digis over a few chambers, simhits on (or next to) the digis cells."""
+    ev = Event(index=0)
+    ev.digis = [
+        Particle(index=i, wh=int(rng.integers(-1, 1)), sc=int(rng.integers(1, 3)), st=int(rng.integers(1, 3)),
+                 sl=int(rng.integers(1, 4)), l=int(rng.integers(1, 5)), w=int(rng.integers(0, 30)), name="Digi")
+        for i in range(ndigis)
+    ]
+    ev.simhits = [
+        Particle(index=i, wh=d.wh, sc=d.sc, st=d.st, sl=d.sl, l=d.l, w=d.w + int(rng.integers(0, 2)),
+                 particle_type=int(rng.choice([13, -13, 11, -11, 22, 211])), name="SimHit")
+        for i, d in enumerate(rng.choice(ev.digis, nsimhits))
+    ]
+    ev.genmuons = []
+    return ev
+
+
+def ntuple_events(inpath, config, nevents):
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+
+    RUN_CONFIG.change_config_file(config_path=config)
+    ntuple = NTuple(inputFolder=inpath)
+    for iev, ev in enumerate(ntuple.events):
+        if iev >= nevents:
+            break
+        if ev is not None:
+            yield ev
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--nevents", type=int, default=50)
+    parser.add_argument("-i", "--inpath", default=None, help="DTNTuple file/folder. If not set, synthetic events are used")
+    parser.add_argument("-cf", "--config", default=None, help="Run config YAML (needed with -i)")
+    parser.add_argument("--thr", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.inpath:
+        events = ntuple_events(args.inpath, args.config, args.nevents)
+    else:
+        rng = np.random.default_rng(args.seed)
+        events = (synthetic_event(rng) for _ in range(args.nevents))
+
+    timings, nevents, nshowers, mismatches = {"DataFrame": 0., "sets/arrays": 0.}, 0, 0, 0
+    for ev in events:
+        start = time.perf_counter()
+        dataframe_build_real_showers(ev, threshold=args.thr)
+        timings["DataFrame"] += time.perf_counter() - start
+        ref = [[getattr(shower, f) for f in _FIELDS] for shower in ev.realshowers]
+
+        start = time.perf_counter()
+        build_real_showers(ev, threshold=args.thr)
+        timings["sets/arrays"] += time.perf_counter() - start
+        new = [[getattr(shower, f) for f in _FIELDS] for shower in ev.realshowers]
+
+        nevents += 1
+        nshowers += len(ref)
+        mismatches += ref != new
+
+    color_msg(f"{nevents} events, {nshowers} real showers, {mismatches} events with differences", color="green" if not mismatches else "red")
+    for label, t in timings.items():
+        color_msg(f"{label:>12}: {1e3 * t / max(nevents, 1):.3f} ms/event", color="blue", indentLevel=1)
+    color_msg(f"speedup: {timings['DataFrame'] / max(timings['sets/arrays'], 1e-12):.1f}x", color="blue", indentLevel=1)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Time of ``agreement_functions.compute_agreement`` (interval join of ``match_showers``: reference showers sorted by
+each key and ``searchsorted`` tolerance windows) against the row by row ``match_shower`` it replaces (a scan of all
+the reference showers per shower), on streams of showers with increasing length, checking that both give the same
+agreement ratio. The row by row matching is only timed up to ``--max-loop`` showers.
+
+Usage (from the repository root):
+    python benchmarks/shower_matching_benchmark.py [--nshowers 100 1000 10000 1000000] [--by bxsend:30 bx:2]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from dtpr.utils.functions import color_msg
+
+# the agreement scripts import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agreement"))
+from agreement_functions import compute_agreement, match_shower, match_showers  # noqa: E402
+
+
+def make_showers(nshowers, rng):
+    """A stream of showers (one every ~50 bxsends) and its reference, with ~10% of the showers lost in each one."""
+    bxsend = np.cumsum(rng.integers(20, 80, nshowers))
+    bx = rng.integers(0, 30, nshowers)
+    showers = pd.DataFrame({"bxsend": bxsend, "bx": bx})
+    ref = pd.DataFrame({"bxsend": bxsend + rng.integers(-3, 4, nshowers), "bx": bx + rng.integers(-1, 2, nshowers)})
+    return showers.loc[rng.random(nshowers) > 0.1], ref.loc[rng.random(nshowers) > 0.1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nshowers", type=int, nargs="+", default=[100, 1000, 10000, 1000000], help="Showers of the streams")
+    parser.add_argument("--by", nargs="+", default=["bxsend:30"], help="Matching keys and tolerances, key:tolerance")
+    parser.add_argument("--max-loop", type=int, default=10000, help="Largest stream matched row by row")
+    args = parser.parse_args()
+
+    by = {key: int(tolerance) for key, tolerance in (item.split(":") for item in args.by)}
+    rng = np.random.default_rng(0)
+    for nshowers in args.nshowers:
+        showers, ref = make_showers(nshowers, rng)
+
+        start = time.perf_counter()
+        ratio, pairs, unmatched = compute_agreement(showers, ref, by=by, return_matches=True)
+        join_time = time.perf_counter() - start
+        msg = f"{nshowers:>8} showers: agreement {ratio:.3f} ({len(pairs)} pairs, {len(unmatched)} unmatched), interval join {1e3 * join_time:8.1f} ms"
+
+        if nshowers <= args.max_loop:
+            start = time.perf_counter()
+            matches = showers.apply(match_shower, args=(ref, by), axis=1)
+            loop_time = time.perf_counter() - start
+            assert np.array_equal(matches.to_numpy(dtype=bool), match_showers(showers, ref, by=by)[0]), "different matches"
+            assert matches.sum() / matches.size == ratio, "different agreement"
+            msg += f", row by row {1e3 * loop_time:9.1f} ms (x{loop_time / join_time:.0f})"
+        color_msg(msg, color="blue", indentLevel=1)
+    color_msg("Same agreements with both matchers", color="green")
+
+
+if __name__ == "__main__":
+    main()
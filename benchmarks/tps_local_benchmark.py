@@ -0,0 +1,85 @@
+"""
+Regression check and timing of the TP local coordinates: per TP ``src`` functions (``compute_x0`` and
+``compute_psi_local``) against the geometry lookup table preprocessor (``compute_tps_local_coordinates``).
+
+Events are either read from a DTNTuple (``-i``/``-cf``, the config must define tps) or generated synthetically.
+
+Usage:
+    python benchmarks/tps_local_benchmark.py [-n NEVENTS] [-i NTUPLE -cf CONFIG] [--ref-frame SL13Center]
+"""
+import argparse
+import time
+import numpy as np
+from dtpr.base import Event, Particle
+from dtpr.utils.functions import color_msg
+from utils.tps_functions import compute_x0, compute_psi_local, compute_tps_local_coordinates, tp_geometry_table
+
+
+def synthetic_event(rng, ntps=100):
+    ev = Event(index=0)
+    ev.tps = []
+    for i in range(ntps):
+        st = int(rng.integers(1, 5))
+        ev.tps.append(Particle(
+            index=i, wh=int(rng.integers(-2, 3)), sc=int(rng.integers(1, 15 if st == 4 else 13)), st=st, sl=int(rng.choice([0, 1, 3])),
+            phi=int(rng.integers(-30000, 30000)), phiB=int(rng.integers(-1000, 1000)), phires_conv=65536.0 / 0.5, phiBres_conv=4096.0 / 2.0,
+            name="AMTP",
+        ))
+    return ev
+
+
+def ntuple_events(inpath, config, nevents):
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+
+    RUN_CONFIG.change_config_file(config_path=config)
+    ntuple = NTuple(inputFolder=inpath)
+    for iev, ev in enumerate(ntuple.events):
+        if iev >= nevents:
+            break
+        if ev is not None:
+            yield ev
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--nevents", type=int, default=200)
+    parser.add_argument("-i", "--inpath", default=None, help="DTNTuple file/folder. If not set, synthetic events are used")
+    parser.add_argument("-cf", "--config", default=None, help="Run config YAML (needed with -i)")
+    parser.add_argument("--ref-frame", default="SL13Center", choices=["SL13Center", "Station", "SectorRef"])
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.inpath:
+        events = list(ntuple_events(args.inpath, args.config, args.nevents))
+    else:
+        rng = np.random.default_rng(args.seed)
+        events = [synthetic_event(rng) for _ in range(args.nevents)]
+
+    start = time.perf_counter()
+    tp_geometry_table(args.ref_frame)
+    color_msg(f"Lookup table built in {1e3 * (time.perf_counter() - start):.1f} ms", color="blue")
+
+    timings, ntps, max_dx, max_dpsi = {"per TP": 0., "lookup table": 0.}, 0, 0., 0.
+    for ev in events:
+        start = time.perf_counter()
+        ref = [(compute_x0(tp, ref_frame=args.ref_frame), compute_psi_local(tp)) for tp in ev.tps]
+        timings["per TP"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        compute_tps_local_coordinates(ev, ref_frame=args.ref_frame)
+        timings["lookup table"] += time.perf_counter() - start
+
+        if ref:
+            diffs = np.abs(np.array(ref) - np.array([(tp.posLoc_x, tp.dirLoc_phi) for tp in ev.tps]))
+            max_dx, max_dpsi = max(max_dx, diffs[:, 0].max()), max(max_dpsi, diffs[:, 1].max())
+        ntps += len(ev.tps)
+
+    color_msg(f"{len(events)} events, {ntps} TPs, max |dx| = {max_dx:.2e} cm, max |dpsi| = {max_dpsi:.2e} deg", color="green")
+    for label, t in timings.items():
+        color_msg(f"{label:>12}: {1e6 * t / max(ntps, 1):.2f} us/TP", color="blue", indentLevel=1)
+    color_msg(f"speedup: {timings['per TP'] / max(timings['lookup table'], 1e-12):.1f}x", color="blue", indentLevel=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import ROOT as r
 from functools import partial
 from dtpr.utils.functions import get_unique_locs
 from utils.genmuon_functions import analyze_genmuon_showers, stations
+from utils.functions import get_particles_by_loc
 
 # Histograms defined here...
 # --- for genmuons -----
@@ -74,11 +75,11 @@ histos.update({
 def get_locs_to_check(reader, station=1, opt=1, by_sl=False):
     loc_ids = ["wh", "sc", "st", "sl"] if by_sl else ["wh", "sc", "st"]
     if opt == 3:
-        indexs = get_unique_locs(particles=reader.filter_particles("digis", st=station), loc_ids=loc_ids)
+        indexs = get_unique_locs(particles=get_particles_by_loc(reader, "digis", st=station), loc_ids=loc_ids)
         return indexs
 
-    fwshowers_locs = get_unique_locs(particles=reader.filter_particles("fwshowers", st=station), loc_ids=loc_ids)
-    realshowers_locs = get_unique_locs(particles=reader.filter_particles("realshowers", st=station), loc_ids=loc_ids)
+    fwshowers_locs = get_unique_locs(particles=get_particles_by_loc(reader, "fwshowers", st=station), loc_ids=loc_ids)
+    realshowers_locs = get_unique_locs(particles=get_particles_by_loc(reader, "realshowers", st=station), loc_ids=loc_ids)
 
     if opt == 1: #every chamber with showers, and traversed by genmuons
         _gm_seg_locs = get_unique_locs(particles=[seg for gm in reader.genmuons for seg in gm.matched_segments if seg.st==station], loc_ids=["wh", "sc", "st"])
@@ -123,8 +124,8 @@ def compute_tpfptnfn(reader, station=1, opt=1, by_sl=False):
             wh, sc, st = index
             kargs = {"wh": wh, "sc": sc, "st": st}
 
-        real_showers = reader.filter_particles("realshowers", **kargs)
-        fwshowers = reader.filter_particles("fwshowers", **kargs)
+        real_showers = get_particles_by_loc(reader, "realshowers", **kargs)
+        fwshowers = get_particles_by_loc(reader, "fwshowers", **kargs)
 
         if real_showers:
             if fwshowers:
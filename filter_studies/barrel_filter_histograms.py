@@ -4,7 +4,7 @@ import sys
 sys.path.append("..")  # Adjust the path to include the parent directory
 
 from dtpr.utils.functions import get_unique_locs
-from utils.functions import stations, get_best_matches
+from utils.functions import stations, get_best_matches, get_particles_by_loc
 # Histogram defined here
 # - shower_nhits_dist: Distribution of number of hits for all FW showers
 # - tp_shower_nhits_dist: Distribution of number of hits for true positive showers  
@@ -125,8 +125,8 @@ histos.update({
 
 def get_locs_to_check(reader, station=1):
     loc_ids = ["wh", "sc", "st"]
-    fwshowers_locs = get_unique_locs(particles=reader.filter_particles("fwshowers_ff", st=station), loc_ids=loc_ids)
-    realshowers_locs = get_unique_locs(particles=reader.filter_particles("realshowers", st=station), loc_ids=loc_ids)
+    fwshowers_locs = get_unique_locs(particles=get_particles_by_loc(reader, "fwshowers_ff", st=station), loc_ids=loc_ids)
+    realshowers_locs = get_unique_locs(particles=get_particles_by_loc(reader, "realshowers", st=station), loc_ids=loc_ids)
 
     _gm_seg_locs = get_unique_locs(particles=[seg for gm in reader.genmuons for seg in gm.matched_segments if seg.st==station], loc_ids=["wh", "sc", "st"])
     indexs = fwshowers_locs.union(realshowers_locs).union(_gm_seg_locs)
@@ -156,8 +156,8 @@ def compute_tpfptnfn(reader, station=1):
         wh, sc, st = index
         kargs = {"wh": wh, "sc": sc, "st": st}
 
-        real_showers = reader.filter_particles("realshowers", **kargs)
-        fwshowers = reader.filter_particles("fwshowers_ff", **kargs)
+        real_showers = get_particles_by_loc(reader, "realshowers", **kargs)
+        fwshowers = get_particles_by_loc(reader, "fwshowers_ff", **kargs)
 
         if real_showers:
             if fwshowers:
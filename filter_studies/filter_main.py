@@ -9,8 +9,9 @@ from mpldts.patches import DTStationPatch, MultiDTSegmentsPatch
 from dtpr.base import NTuple
 from dtpr.utils.functions import color_msg, get_unique_locs
 from dtpr.base.config import RUN_CONFIG
-from filter_matching_functions import  ray_rect_matching, ray_seg_matching
-from functools import partial, cache
+from utils.functions import append_to_matched_list
+from filter_matching_functions import  ray_rect_matching, ray_seg_matching, ray_seg_matching_matrix, ray_seg_matching_indexed
+from functools import cache
 
 # ----------- Auxiliary functions and variables ---------------
 cell_patch_kwargs = {"facecolor": "none", "edgecolor": "none"}
@@ -23,6 +24,9 @@ segs_kwargs = {
     "norm": segs_norm,
 }
 
+# The phi-bin index of the showers only pays off for large groups of TP-shower pairs (see benchmarks/phi_index_benchmark.py)
+PHI_INDEX_MIN_PAIRS = 50000
+
 # Cache for built Station objects to avoid redundant constructions
 Station = StationsCache().get 
 _built_stations_patches = {}
@@ -40,6 +44,12 @@ for sector in range(1, 13):
         neighbors_sec.append(14)
     BF_neighbor_sectors[f"BF{sector}"] = neighbors_sec
 
+# BF boards that see each sector, as a bit mask (bit s set for BFs)
+BF_boards_mask = {}
+for sector in range(1, 13):
+    for sc in BF_neighbor_sectors[f"BF{sector}"]:
+        BF_boards_mask[sc] = BF_boards_mask.get(sc, 0) | (1 << sector)
+
 
 def plot_rectangle(ax, rect, color='r', alpha=0.2):
     """Plot a rectangle (polygon) on the given axes."""
@@ -155,72 +165,164 @@ def match_tp_to_shower(segment, shower):
     # return ray_rect_matching(p, d, rect)
     return ray_seg_matching(p, d, a, b)
 
-def _analyzer(showers, tps, shower_seg_version=2, debug=False, plot=False, cover_full_cells=False):
+def match_tps_to_showers(positions, directions, showers, phi_bins=None, phi_margin=0.01):
+    """Match AM TPs, given by their global positions and directions, to showers, all the TP-shower pairs at once.
+    If phi_bins is given, each TP is only tested against the showers in the phi bins it can cross (for groups of at
+    least PHI_INDEX_MIN_PAIRS pairs). Returns a (n TPs, n showers) boolean matrix"""
+    showers = np.asarray(showers)
+    # Check if the rays from TPs intersect with the shower segments
+    if phi_bins and len(positions) * len(showers) >= PHI_INDEX_MIN_PAIRS:
+        return ray_seg_matching_indexed(positions, directions, showers[:, 0, :-1], showers[:, 1, :-1], nbins=phi_bins, margin=phi_margin)
+    return ray_seg_matching_matrix(positions, directions, showers[:, 0, :-1], showers[:, 1, :-1])
+
+def _tps_segments_info(tps):
+    """Build the dicts with the TPs information needed by AMDTSegments"""
+    return [
+        {
+            "parent": Station(_tp.wh, _tp.sc, _tp.st),  # parent station of the TP
+            "index": _tp.index,
+            "sl": _tp.sl,
+            "angle": getattr(_tp, "dirLoc_phi"),
+            "position": getattr(_tp, "posLoc_x"),
+            "tp_obj": _tp,  # store the TP object for later use
+        }
+        for _tp in tps
+    ]
+
+def build_tps_geometry(tps):
+    """Get the global positions and directions of the TPs in the phi view, as (n, 2) arrays, and the row of each TP (by id)"""
+    _tps_geo = AMDTSegments(segs_info=_tps_segments_info(tps)) # geometrically objects that allow to get global coordinates of TPs
+    positions = np.array([segment.global_center[:-1] for segment in _tps_geo.segments], dtype=float).reshape(-1, 2)
+    directions = np.array([segment.global_direction[:-1] for segment in _tps_geo.segments], dtype=float).reshape(-1, 2)
+    return positions, directions, {id(_tp): row for row, _tp in enumerate(tps)}
+
+def get_tps_geometry(ev):
+    """Get the TPs geometry of the event (see build_tps_geometry), computed once per event and cached on it"""
+    cached = getattr(ev, "_tps_geometry", None)
+    if cached is None or cached[0] is not ev.tps or cached[1] != len(ev.tps):
+        cached = (ev.tps, len(ev.tps), build_tps_geometry(ev.tps))
+        ev._tps_geometry = cached
+    return cached[2]
+
+def _analyzer(showers, tps, shower_seg_version=2, debug=False, plot=False, cover_full_cells=False, tps_geometry=None, phi_bins=None, phi_margin=0.01):
     """Analyze showers and TPs for a given event, optionally plotting results."""
     if plot:
         _things_to_plot = {"dts": {}, "showers": [], "tps": None}
 
+    positions, directions, rows = tps_geometry if tps_geometry is not None else build_tps_geometry(tps)
+
+    # showers in the same wheel and station see the same TPs, so those are matched in one batch
+    _showers_groups = {}
     for shower in showers:
-        wh, sc, st = shower.wh, shower.sc, shower.st
+        _showers_groups.setdefault((shower.wh, shower.st), []).append(shower)
 
+    _matches = {} # shower id -> (TPs, matched TPs mask, TPs geometry to plot)
+    for (wh, st), _showers in _showers_groups.items():
         _tps2use = [tp for tp in tps if tp.wh == wh and tp.st!= st] # Just take TPs from the same wheel as the shower, but different station
         if not _tps2use:
             continue  # skip if no TPs in the same wheel as the shower --> THIS DEFINES THAT THIS MATCHING IS LIMITED TO THE PHI VIEW
 
-        # to avoid building the same station multiple times
-        _dt = Station(wh, sc, st)
-        if plot and (wh, sc, st) not in _things_to_plot["dts"]:
-            _things_to_plot["dts"][(wh, sc, st)] = _dt
+        _shower_segs = []
+        for shower in _showers:
+            # to avoid building the same station multiple times
+            _dt = Station(shower.wh, shower.sc, shower.st)
+            if plot and (shower.wh, shower.sc, shower.st) not in _things_to_plot["dts"]:
+                _things_to_plot["dts"][(shower.wh, shower.sc, shower.st)] = _dt
 
-        # get the rectangle for the shower
-        # _rect = get_shower_rectangle(_dt, shower)
-        _shower_seg = get_shower_segment(_dt, shower, version=shower_seg_version,cover_full_cells=cover_full_cells)
+            # get the rectangle for the shower
+            # _rect = get_shower_rectangle(_dt, shower)
+            _shower_segs.append(get_shower_segment(_dt, shower, version=shower_seg_version,cover_full_cells=cover_full_cells))
 
+        _tps_geo = None
         if plot:
             # _things_to_plot["showers"].append(_rect)
-            _things_to_plot["showers"].append(_shower_seg)
-
-        # build dicts with tps information
-        _tps_info = []
-        for _tp in _tps2use:
-            _parent_dt = Station(_tp.wh, _tp.sc, _tp.st)
-            _tps_info.append({
-                "parent": _parent_dt,  # parent station of the TP
-                "index": _tp.index,
-                "sl": _tp.sl,
-                "angle": getattr(_tp, "dirLoc_phi"),
-                "position": getattr(_tp, "posLoc_x"),
-                "tp_obj": _tp,  # store the TP object for later use
-            })
-            if plot and (_tp.wh, _tp.sc, _tp.st) not in _things_to_plot["dts"]:
-                _things_to_plot["dts"][(_tp.wh, _tp.sc, _tp.st)] = _parent_dt
-
-        _tps_geo = AMDTSegments(segs_info=_tps_info) # geometrically objects that allow to get global coordinates of TPs
-
-        # match TPs to the shower
-        match_results = map(partial(match_tp_to_shower, shower=_shower_seg), _tps_geo.segments)
-
-        for matched, _tp_seg in zip(match_results, _tps_geo.segments):
-            if plot:
+            _things_to_plot["showers"].extend(_shower_segs)
+            for _tp in _tps2use:
+                if (_tp.wh, _tp.sc, _tp.st) not in _things_to_plot["dts"]:
+                    _things_to_plot["dts"][(_tp.wh, _tp.sc, _tp.st)] = Station(_tp.wh, _tp.sc, _tp.st)
+            _tps_geo = AMDTSegments(segs_info=_tps_segments_info(_tps2use))
+
+        # match TPs to the showers, reusing the TPs global coordinates
+        _rows = [rows[id(_tp)] for _tp in _tps2use]
+        match_results = match_tps_to_showers(positions[_rows], directions[_rows], _shower_segs, phi_bins=phi_bins, phi_margin=phi_margin)
+        for shower, matched in zip(_showers, match_results.T):
+            _matches[id(shower)] = (_tps2use, matched, _tps_geo)
+
+    # fill the matched lists in the order of the showers
+    for shower in showers:
+        if id(shower) not in _matches:
+            continue
+        _tps2use, match_results, _tps_geo = _matches[id(shower)]
+
+        if plot:
+            for matched, _tp_seg in zip(match_results.tolist(), _tps_geo.segments):
                 _tp_seg.matched = int(matched)  # store the match result for plotting
+            _things_to_plot["tps"] = _tps_geo
+
+        for matched, _tp in zip(match_results.tolist(), _tps2use):
             if not matched:
                 continue
-            # Add the TP to the shower matched TPs
-            if _tp_seg.tp_obj not in shower.matched_tps:
-                shower.matched_tps.append(_tp_seg.tp_obj)
-            # Add the shower to the TP matched showers
-            if shower not in _tp_seg.tp_obj.matched_showers:
-                _tp_seg.tp_obj.matched_showers.append(shower)
+            # Add the TP to the shower matched TPs and the shower to the TP matched showers
+            append_to_matched_list(shower, "matched_tps", _tp)
+            append_to_matched_list(_tp, "matched_showers", shower)
             if debug:
-                color_msg(f"TP: {_tp_seg.tp_obj.index} match with shower: {shower.index}", color="purple", indentLevel=2)
-
-        if plot:
-            _things_to_plot["tps"] = _tps_geo
+                color_msg(f"TP: {_tp.index} match with shower: {shower.index}", color="purple", indentLevel=2)
     if plot:
         make_plot(_things_to_plot)
 
-def barrel_filter_analyzer(ev, only4true_showers=False, shower_seg_version=2, debug=False, plot=False,cover_full_cells=False):
-    """Divide event into sectors and analyze showers/TPs for each sector."""
+def _unique_pairs_analyzer(ev, showers, shower_seg_version=2, debug=False, cover_full_cells=False, phi_bins=None, phi_margin=0.01):
+    """Match each (shower, TP) pair seen by at least one BF board a single time, instead of once per board. The
+    matched lists are filled in the same order as the loop over the boards, and the boards that see each match are
+    stored in ev.bf_matches ({BF sector: [(shower, TP), ...]})"""
+    tps = ev.tps
+    positions, directions, _ = get_tps_geometry(ev) # rows follow the order of ev.tps
+    tps_boards = np.array([BF_boards_mask.get(tp.sc, 0) for tp in tps], dtype=np.int64)
+
+    _showers_groups = {}
+    for ishower, shower in enumerate(showers):
+        _showers_groups.setdefault((shower.wh, shower.st), []).append(ishower)
+
+    _pairs = [] # (first board, shower position, TP position, boards mask) of the matched pairs
+    for (wh, st), ishowers in _showers_groups.items():
+        showers_boards = np.array([BF_boards_mask.get(showers[i].sc, 0) for i in ishowers], dtype=np.int64)
+        any_board = np.bitwise_or.reduce(showers_boards)
+        # TPs from the same wheel, different station, and seen by a board that also sees one of the showers
+        _rows = [row for row, tp in enumerate(tps) if tp.wh == wh and tp.st != st and tps_boards[row] & any_board]
+        if not _rows:
+            continue
+
+        _shower_segs = [
+            get_shower_segment(Station(showers[i].wh, showers[i].sc, showers[i].st), showers[i], version=shower_seg_version, cover_full_cells=cover_full_cells)
+            for i in ishowers
+        ]
+        boards = tps_boards[_rows][:, None] & showers_boards[None, :] # boards that see both, per pair
+        match_results = match_tps_to_showers(positions[_rows], directions[_rows], _shower_segs, phi_bins=phi_bins, phi_margin=phi_margin)
+        for itp, ish in zip(*np.nonzero(match_results & (boards != 0))):
+            mask = int(boards[itp, ish])
+            _pairs.append(((mask & -mask).bit_length() - 1, ishowers[ish], _rows[itp], mask))
+        if debug:
+            color_msg(f"Wh{wh} MB{st}: {int((boards != 0).sum())} unique TP-shower pairs analyzed", indentLevel=1)
+
+    # the board loop finds each pair first in its lowest board, and then goes over the showers and the TPs in order
+    for _, ishower, itp, _ in sorted(_pairs):
+        shower, _tp = showers[ishower], tps[itp]
+        append_to_matched_list(shower, "matched_tps", _tp)
+        append_to_matched_list(_tp, "matched_showers", shower)
+        if debug:
+            color_msg(f"TP: {_tp.index} match with shower: {shower.index}", color="purple", indentLevel=2)
+
+    bf_matches = {}
+    for _, ishower, itp, mask in sorted(_pairs, key=lambda pair: pair[1:3]):
+        for sector in range(1, 13):
+            if mask >> sector & 1:
+                bf_matches.setdefault(sector, []).append((showers[ishower], tps[itp]))
+    ev.bf_matches = bf_matches
+
+def barrel_filter_analyzer(ev, only4true_showers=False, shower_seg_version=2, debug=False, plot=False,cover_full_cells=False, phi_bins=None, phi_margin=0.01, unique_pairs=False):
+    """Divide event into sectors and analyze showers/TPs for each sector. With phi_bins, TPs are only matched to the
+    showers in the phi bins they can cross (phi_margin in radians), which speeds up high occupancy events. With
+    unique_pairs, the pairs seen by several boards are analyzed only once (see _unique_pairs_analyzer), except when
+    plotting, which is done per board."""
     # simple filter in case only true showers are needed, or to avoid analyzing events without showers
     _showers = ev.filter_particles("fwshowers", is_true_shower=True) if only4true_showers else ev.fwshowers
     if not _showers:
@@ -228,6 +330,9 @@ def barrel_filter_analyzer(ev, only4true_showers=False, shower_seg_version=2, de
             color_msg("No showers found in the event", color="red", indentLevel=1)
         return None
 
+    if unique_pairs and not plot:
+        return _unique_pairs_analyzer(ev, _showers, shower_seg_version, debug, cover_full_cells=cover_full_cells, phi_bins=phi_bins, phi_margin=phi_margin)
+
     # first divide the problem as a BF board can see (3 adjacent sectors and all wheels)
     for sector in range (1, 13):
         neighbors_sec = BF_neighbor_sectors[f"BF{sector}"]
@@ -260,7 +365,7 @@ def barrel_filter_analyzer(ev, only4true_showers=False, shower_seg_version=2, de
             continue
         if debug:
             color_msg("Analyzing...", color="yellow", indentLevel=1)
-        _analyzer(showers, tps, shower_seg_version, debug, plot, cover_full_cells=cover_full_cells) # this only analyze in Phi view
+        _analyzer(showers, tps, shower_seg_version, debug, plot, cover_full_cells=cover_full_cells, tps_geometry=get_tps_geometry(ev), phi_bins=phi_bins, phi_margin=phi_margin) # this only analyze in Phi view
 
 def main():
     """Main entry point for running the filter analysis."""
@@ -37,6 +37,156 @@ def ray_seg_matching(p, d, a, b):
         return True
     return False
 
+def _ray_seg_crossing(p, d, a, b):
+    """Cramer's rule test of ``ray_seg_matching`` on broadcastable arrays of points/directions (..., 2), with the
+    determinants written as 2D cross products."""
+    v1 = b - a
+    v2 = p - a
+    denom = d[..., 0] * v1[..., 1] - d[..., 1] * v1[..., 0] # det([v1, -d]^T)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u = (d[..., 0] * v2[..., 1] - d[..., 1] * v2[..., 0]) / denom # det([v2, -d]^T) / denom
+
+    # parallel rays and segments (denom == 0) never match
+    return (denom != 0) & (u >= 0) & (u <= 1)
+
+def ray_seg_matching_matrix(p, d, a, b):
+    """
+    Batch version of ``ray_seg_matching``: check which of the N rays, defined by the points p and directions d,
+    intersect with which of the M segments, defined by the points a and b, in one vectorized call.
+
+    :param p: Points from which the rays start.
+    :type p: numpy.ndarray(shape=(N, 2))
+    :param d: Directions of the rays.
+    :type d: numpy.ndarray(shape=(N, 2))
+    :param a: Start points of the segments.
+    :type a: numpy.ndarray(shape=(M, 2))
+    :param b: End points of the segments.
+    :type b: numpy.ndarray(shape=(M, 2))
+    :return: Matrix with True where the ray (row) intersects with the segment (column).
+    :rtype: numpy.ndarray(shape=(N, M), dtype=bool)
+    .. note:: The determinants of the Cramer's rule are written as 2D cross products, broadcast over the N x M pairs.
+    """
+    p = np.asarray(p, dtype=float).reshape(-1, 2)
+    d = np.asarray(d, dtype=float).reshape(-1, 2)
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    return _ray_seg_crossing(p[:, None, :], d[:, None, :], a[None, :, :], b[None, :, :])
+
+def segments_phi_index(a, b, nbins=72, margin=0.01):
+    """
+    Build an angular index of segments (e.g. the shower segments of a wheel): the phi range of each segment,
+    widened by a safety margin, is registered in the phi bins it covers.
+
+    :param a: Start points of the segments.
+    :type a: numpy.ndarray(shape=(M, 2))
+    :param b: End points of the segments.
+    :type b: numpy.ndarray(shape=(M, 2))
+    :param nbins: Number of phi bins.
+    :type nbins: int
+    :param margin: Safety margin, in radians, added to the phi ranges of the segments and of the rays.
+    :type margin: float
+    :return: The index: segments ids sorted by bin (``ids``) with the offsets of each bin (``offsets``), and the
+        radial range of the segments (``rmin``, ``rmax``).
+    :rtype: dict
+    """
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    bin_width = 2 * np.pi / nbins
+
+    # phi range of each segment, as its start angle and (non negative) width
+    phi_a, phi_b = np.arctan2(a[:, 1], a[:, 0]), np.arctan2(b[:, 1], b[:, 0])
+    span = (phi_b - phi_a + np.pi) % (2 * np.pi) - np.pi
+    start = np.where(span >= 0, phi_a, phi_b) - margin
+    first_bin = np.floor(start / bin_width).astype(np.int64)
+    nsegbins = np.minimum(np.floor((start + np.abs(span) + 2 * margin) / bin_width).astype(np.int64) - first_bin + 1, nbins)
+
+    seg_ids = np.repeat(np.arange(len(a)), nsegbins)
+    seg_bins = (np.repeat(first_bin, nsegbins) + np.arange(nsegbins.sum()) - np.repeat(np.cumsum(nsegbins) - nsegbins, nsegbins)) % nbins
+    order = np.argsort(seg_bins, kind="stable")
+
+    # radial range: the closest point of the segment to the origin and the farthest endpoint
+    v = b - a
+    t = np.clip(-np.einsum("ij,ij->i", a, v) / np.maximum(np.einsum("ij,ij->i", v, v), 1e-300), 0, 1)
+    return {
+        "nbins": nbins,
+        "margin": margin,
+        "ids": seg_ids[order],
+        "offsets": np.concatenate([[0], np.cumsum(np.bincount(seg_bins, minlength=nbins))]),
+        "rmin": np.linalg.norm(a + t[:, None] * v, axis=1).min() if len(a) else 0.,
+        "rmax": np.maximum(np.linalg.norm(a, axis=1), np.linalg.norm(b, axis=1)).max() if len(a) else 0.,
+    }
+
+def _rays_phi_arcs(p, d, rmin, rmax, margin):
+    """
+    Phi arcs where the lines defined by points p and directions d cross the annulus rmin <= r <= rmax. A line at
+    distance rho of the origin, with its closest point at angle phi0, reaches radius r at phi0 +- arccos(rho / r).
+    Returns the start angle and width of the two arcs of each line (width < 0 if the line misses the annulus).
+    """
+    d = d / np.linalg.norm(d, axis=1, keepdims=True)
+    normal = np.stack([d[:, 1], -d[:, 0]], axis=1)
+    cross = p[:, 0] * d[:, 1] - p[:, 1] * d[:, 0] # signed distance of the line to the origin
+    rho = np.abs(cross)
+    foot = np.where(cross[:, None] >= 0, normal, -normal) # direction of the closest point of the line
+    phi0 = np.arctan2(foot[:, 1], foot[:, 0])
+
+    alpha_lo = np.arccos(np.clip(rho / max(rmin, 1e-300), 0, 1))
+    alpha_hi = np.arccos(np.clip(rho / max(rmax, 1e-300), 0, 1))
+    width = np.where(rho <= rmax, alpha_hi - alpha_lo, -1.)
+    starts = np.concatenate([phi0 + alpha_lo, phi0 - alpha_hi]) - margin
+    widths = np.concatenate([width, width]) + np.where(np.concatenate([width, width]) >= 0, 2 * margin, 0)
+    return starts, widths
+
+def ray_seg_matching_indexed(p, d, a, b, nbins=72, margin=0.01, index=None):
+    """
+    Same as ``ray_seg_matching_matrix``, but each ray is only tested against the segments in the phi bins it
+    can geometrically cross (see ``segments_phi_index``), which pays off for high ray and segment multiplicities.
+
+    :param p: Points from which the rays start.
+    :type p: numpy.ndarray(shape=(N, 2))
+    :param d: Directions of the rays.
+    :type d: numpy.ndarray(shape=(N, 2))
+    :param a: Start points of the segments.
+    :type a: numpy.ndarray(shape=(M, 2))
+    :param b: End points of the segments.
+    :type b: numpy.ndarray(shape=(M, 2))
+    :param nbins: Number of phi bins of the index (if not given).
+    :type nbins: int
+    :param margin: Safety margin of the index, in radians (if not given).
+    :type margin: float
+    :param index: The index of the segments, built if not given.
+    :type index: dict
+    :return: Matrix with True where the ray (row) intersects with the segment (column).
+    :rtype: numpy.ndarray(shape=(N, M), dtype=bool)
+    """
+    p = np.asarray(p, dtype=float).reshape(-1, 2)
+    d = np.asarray(d, dtype=float).reshape(-1, 2)
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    index = segments_phi_index(a, b, nbins, margin) if index is None else index
+    nbins, bin_width = index["nbins"], 2 * np.pi / index["nbins"]
+    result = np.zeros((len(p), len(a)), dtype=bool)
+    if not len(p) or not len(a):
+        return result
+
+    # phi bins crossed by each ray (two arcs per ray)
+    starts, widths = _rays_phi_arcs(p, d, index["rmin"], index["rmax"], index["margin"])
+    rays = np.tile(np.arange(len(p)), 2)
+    crossing = widths >= 0
+    rays, starts, widths = rays[crossing], starts[crossing], widths[crossing]
+    first_bin = np.floor(starts / bin_width).astype(np.int64)
+    nraybins = np.minimum(np.floor((starts + widths) / bin_width).astype(np.int64) - first_bin + 1, nbins)
+    ray_bins = (np.repeat(first_bin, nraybins) + np.arange(nraybins.sum()) - np.repeat(np.cumsum(nraybins) - nraybins, nraybins)) % nbins
+    rays = np.repeat(rays, nraybins)
+
+    # candidate (ray, segment) pairs from the segments of those bins, pairs found in several bins are just tested again
+    offsets = index["offsets"]
+    nsegs = offsets[ray_bins + 1] - offsets[ray_bins]
+    j = index["ids"][np.repeat(offsets[ray_bins], nsegs) + np.arange(nsegs.sum()) - np.repeat(np.cumsum(nsegs) - nsegs, nsegs)]
+    i = np.repeat(rays, nsegs)
+
+    result[i, j] = _ray_seg_crossing(p[i], d[i], a[j], b[j])
+    return result
+
 def ray_rect_matching(p, d, verts):
     """
     Check if the ray defined by point p and direction d intersects with the rectangle defined by its 4 vertices.
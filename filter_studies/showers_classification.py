@@ -1,6 +1,7 @@
 from dtpr.base import NTuple
 from dtpr.base.config import RUN_CONFIG
 from dtpr.utils.functions import color_msg
+from utils.functions import MatchedList, append_to_matched_list
 from pandas import DataFrame
 from tqdm import tqdm
 import matplotlib.pyplot as plt
@@ -10,13 +11,10 @@ def match_shower_genmuons(shower, highpt_threshold=100):
     """
     Matches the shower with genmuons and returns the matched genmuons.
     """
-    matched_genmuons = [gm for tp in shower.matched_tps for gm in tp.matched_genmuons]
+    matched_genmuons = MatchedList(gm for tp in shower.matched_tps for gm in tp.matched_genmuons)
     shower.matched_genmuons = matched_genmuons
     for gm in matched_genmuons:
-        if hasattr(gm, 'matched_showers') and shower not in gm.matched_showers:
-            gm.matched_showers.append(shower)
-        else:
-            gm.matched_showers = [shower]
+        append_to_matched_list(gm, 'matched_showers', shower)
 
     shower.is_highpt_shower = True if any(gm.pt > highpt_threshold for gm in matched_genmuons) else False
     shower.comes_from_showered_genmuon = any(gm.showered for gm in matched_genmuons)
@@ -0,0 +1,79 @@
+import os
+import time
+import argparse
+import numpy as np
+import uproot
+from dtpr.utils.functions import color_msg, create_outfolder, stations
+from utils.columnar import iterate_particles, emulate_fwshowers, wheel_counts, load_run_config
+from utils.functions import tps_good_bx, ntuple_shower_good_bx, emulated_shower_good_bx
+
+# Columnar (uproot + awkward) filling of the shower rate histograms of shower_rates_histos.py
+# (Rate_{goodBX,allBX}_MB{st}_FwShower), without building the python events. Only the branches
+# of the needed particle types are read, in chunks of events. If the config defines tps, the AM
+# rate histograms of dtpr's am_histos (Rate_{goodBX,allBX}_MB{st}_AM) are written to every file too.
+#   - by default, the showers stored in the ntuple (fwshowers) are used -> histograms{tag}.root
+#   - with --emulate, showers are emulated from the digis for each threshold of --thr in a single
+#     emulation at the loosest one -> histograms{tag}_thr{thr}.root. With the AM rates, these are the
+#     files make_rate_plots_thrscan.py plots
+
+_WHEEL_EDGES = np.linspace(-2.5, 2.5, 6)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the shower rate histograms in columnar mode")
+    parser.add_argument("-i", "--inpath", required=True, help="Input ROOT file or folder")
+    parser.add_argument("-o", "--outfolder", default=".", help="Output folder")
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML file (for the particle types)")
+    parser.add_argument("--tag", default="", help="Tag of the output file(s)")
+    parser.add_argument("--emulate", action="store_true", help="Emulate the showers from the digis instead of reading them")
+    parser.add_argument("--thr", type=int, nargs="+", default=[6, 12, 14, 24], help="Thresholds of the emulation")
+    parser.add_argument("--step-size", default="100 MB", help="Chunk size (number of events or memory size)")
+    parser.add_argument("--good-bx", type=int, default=None, help=f"Good BX of the showers ({ntuple_shower_good_bx} for the ntuple showers, {emulated_shower_good_bx} for the emulated ones if not set)")
+    args = parser.parse_args()
+
+    step_size = int(args.step_size) if args.step_size.isdigit() else args.step_size
+    names = ["digis"] if args.emulate else ["fwshowers"]
+    with_am = "tps" in load_run_config(args.config)["particle_types"]
+    if with_am:
+        names.append("tps")
+    else:
+        color_msg("No tps in the config, the AM rate histograms are not written", color="yellow")
+    thresholds = sorted(args.thr) if args.emulate else [None]
+    good_bx = args.good_bx if args.good_bx is not None else (emulated_shower_good_bx if args.emulate else ntuple_shower_good_bx)
+    counts = {
+        (thr, goodbx, st): np.zeros(5, dtype=np.int64)
+        for thr in thresholds for goodbx in (True, False) for st in stations
+    }
+    am_counts = {(goodbx, st): np.zeros(5, dtype=np.int64) for goodbx in (True, False) for st in stations}
+
+    color_msg(f"Filling shower rates from {args.inpath}", color="green")
+    start, nevents = time.time(), 0
+    for chunk in iterate_particles(args.inpath, args.config, names=names, step_size=step_size):
+        if args.emulate:
+            showers = emulate_fwshowers(chunk["digis"], threshold=[thresholds[0]] * 4)
+            by_thr = {thr: showers[showers.nDigis >= thr] for thr in thresholds}
+        else:
+            showers = chunk["fwshowers"]
+            by_thr = {None: showers}
+        nevents += len(showers)
+        for (thr, goodbx, st), hist in counts.items():
+            hist += wheel_counts(by_thr[thr], station=st, goodbx=goodbx, good_bx=good_bx)
+        if with_am:
+            for (goodbx, st), hist in am_counts.items():
+                hist += wheel_counts(chunk["tps"], station=st, goodbx=goodbx, good_bx=tps_good_bx)
+    color_msg(f"{nevents} events done in {time.time() - start:.1f} s", color="blue", indentLevel=1)
+
+    outfolder = os.path.join(args.outfolder, "histograms")
+    create_outfolder(outfolder)
+    for thr in thresholds:
+        outpath = os.path.join(outfolder, f"histograms{args.tag}.root" if thr is None else f"histograms{args.tag}_thr{thr}.root")
+        with uproot.recreate(outpath) as outfile:
+            for goodbx in (True, False):
+                for st in stations:
+                    name = f"Rate_{'goodBX' if goodbx else 'allBX'}_MB{st}_FwShower"
+                    outfile[name] = (counts[(thr, goodbx, st)].astype(np.float64), _WHEEL_EDGES)
+                    if with_am:
+                        outfile[f"Rate_{'goodBX' if goodbx else 'allBX'}_MB{st}_AM"] = (am_counts[(goodbx, st)].astype(np.float64), _WHEEL_EDGES)
+        color_msg(f"Histograms saved in {outpath}", color="green")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import numpy as np
+import uproot
+from dtpr.utils.functions import color_msg, stations
+
+# Comparison of the shower rates of a threshold of the single-pass threshold scan (showers emulated from the
+# digis, histograms_thr{thr}.root of run_thrscan.sh or columnar_rates.py --emulate) with the ones of the same
+# threshold from run_4thr.sh (showers of the CMSSW ntuple, histograms_sbxfix_thr{thr}.root). The allBX rates
+# check the emulation, the goodBX ones (and their fraction of the allBX ones) the good BX of the emulated
+# showers (emulated_shower_good_bx in utils/functions.py).
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the shower rates of the threshold scan with the ones of run_4thr.sh")
+    parser.add_argument("-r", "--reference", default="./histograms/histograms_sbxfix_thr6.root", help="Histograms of run_4thr.sh for a threshold")
+    parser.add_argument("-i", "--input", default="./histograms/histograms_thr6.root", help="Histograms of the threshold scan for the same threshold")
+    args = parser.parse_args()
+
+    with uproot.open(args.reference) as ref_file, uproot.open(args.input) as new_file:
+        for st in stations:
+            counts = {}
+            for bx in ("goodBX", "allBX"):
+                name = f"Rate_{bx}_MB{st}_FwShower"
+                if name not in ref_file or name not in new_file:
+                    color_msg(f"{name} not found in both files, skipping", color="yellow", indentLevel=1)
+                    continue
+                ref, new = ref_file[name].values(), new_file[name].values()
+                counts[bx] = (ref, new)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    ratio = new / ref
+                color_msg(f"{name}: ntuple {ref.tolist()}, emulated {new.tolist()}, ratio {np.round(ratio, 3).tolist()}", color="blue", indentLevel=1)
+            if len(counts) == 2:
+                (ref_good, new_good), (ref_all, new_all) = counts["goodBX"], counts["allBX"]
+                color_msg(
+                    f"MB{st} goodBX fraction: ntuple {ref_good.sum() / max(ref_all.sum(), 1):.3f}, emulated {new_good.sum() / max(new_all.sum(), 1):.3f}",
+                    color="green", indentLevel=1,
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#!/bin/bash
+
+# Threshold scan in a single pass: the showers of all the thresholds are emulated from the digis
+# (see run_config_thrscan.yaml) and the histograms are then split into histograms_thr{thr}.root files,
+# as consumed by make_rate_plots_thrscan.py. The goodBX rates of the emulated showers use emulated_shower_good_bx
+# (utils/functions.py), not validated yet: compare a threshold with the run_4thr.sh histograms using
+# python compare_thrscan_histos.py -r histograms/histograms_sbxfix_thr6.root -i histograms/histograms_thr6.root
+
+# Define the base input directory and output options (optionally given as first argument)
+base_input_dir=${1:-"/lustrefs/hdd_pool_dir/L1T/Filter/ThresholdScan_Zprime_DY/last/MinBias_PU200/"}
+output_dir="."
+tag="_thrscan"
+
+# Search for an input file (any threshold, only digis are used)
+input_file=$(find "$base_input_dir" -type f -path "*/0000/*.root" | head -n 1)
+
+# Check if the input file exists
+if [[ -z "$input_file" ]]; then
+    echo "No input file found in $base_input_dir. Exiting..."
+    exit 1
+fi
+
+# Extract the directory path up to 0000/
+input_dir=$(dirname "$input_file")
+
+# Execute the dtpr fill-histos command
+dtpr fill-histos -i "$input_dir/" -o "$output_dir" -cf ./run_config_thrscan.yaml --tag="${tag}" || exit 1
+
+# Split the histograms per threshold
+python split_thrscan_histos.py -i "$output_dir/histograms/histograms${tag}.root" -o "$output_dir/histograms"
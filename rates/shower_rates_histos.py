@@ -1,4 +1,5 @@
 from dtpr.utils.functions import stations
+from utils.functions import ntuple_shower_good_bx, emulated_shower_good_bx
 import ROOT as r
 
 # Histograms defined here...
@@ -10,14 +11,27 @@ import ROOT as r
 # - fwshower_rate_allBX_MB2
 # - fwshower_rate_allBX_MB3
 # - fwshower_rate_allBX_MB4
+# --- threshold scan (needs ev.fwshowers_by_thr, see utils.shower_functions.build_fwshowers_by_thr) ---
+# - fwshower_rate_goodBX_MB{1,2,3,4}_thr{6,12,14,24}
+# - fwshower_rate_allBX_MB{1,2,3,4}_thr{6,12,14,24}
 
 histos= {}
 
-def get_showers_rate(reader, station, goodbx=True):
+# thresholds of the threshold scan, they should match the ones given to build_fwshowers_by_thr
+thrscan_thresholds = [6, 12, 14, 24]
+
+def get_showers_rate(reader, station, goodbx=True, good_bx=ntuple_shower_good_bx):
     return [
         shower
         for shower in reader.filter_particles("fwshowers", st=station)
-        if (shower.BX == 20 if goodbx else 1)
+        if (shower.BX == good_bx if goodbx else 1)
+    ]
+
+def get_showers_rate_by_thr(reader, station, thr, goodbx=True, good_bx=emulated_shower_good_bx):
+    return [
+        shower
+        for shower in reader.fwshowers_by_thr[thr]
+        if shower.st == station and (shower.BX == good_bx if goodbx else 1)
     ]
 
 # ------------------------------ Shower rates -------------------------------
@@ -39,3 +53,25 @@ for st in stations:
             ],
         },
     })
+
+# ------------------------ Shower rates for the threshold scan ------------------------
+# histograms of each threshold are split into histograms_thr{thr}.root files by split_thrscan_histos.py
+
+for thr in thrscan_thresholds:
+    for st in stations:
+        histos.update({
+            f"fwshower_rate_goodBX_MB{st}_thr{thr}": { # ----- good BX -----
+                "type": "distribution",
+                "histo": r.TH1D(f"Rate_goodBX_MB{st}_FwShower_thr{thr}", r';Wheel; Events', 5, -2.5, 2.5),
+                "func": lambda reader, st=st, thr=thr: [
+                    shower.wh for shower in get_showers_rate_by_thr(reader, station=st, thr=thr, goodbx=True)
+                ],
+            },
+            f"fwshower_rate_allBX_MB{st}_thr{thr}": { # ----- all BX -----
+                "type": "distribution",
+                "histo": r.TH1D(f"Rate_allBX_MB{st}_FwShower_thr{thr}", r';Wheel; Events', 5, -2.5, 2.5),
+                "func": lambda reader, st=st, thr=thr: [
+                    shower.wh for shower in get_showers_rate_by_thr(reader, station=st, thr=thr, goodbx=False)
+                ],
+            },
+        })
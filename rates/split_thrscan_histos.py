@@ -0,0 +1,43 @@
+import os
+import re
+import argparse
+import ROOT as r
+from dtpr.utils.functions import color_msg
+
+# Split the histograms of a single-pass threshold scan (run_config_thrscan.yaml) into one file per
+# threshold, histograms/histograms_thr{thr}.root, as produced before by running once per threshold.
+# Histograms named "<name>_thr{thr}" are stored as "<name>" in the file of their threshold, and those
+# without threshold (e.g. AM rates) are copied to every file.
+
+_THR_PATTERN = re.compile(r"^(.*)_thr(\d+)$")
+
+def main():
+    parser = argparse.ArgumentParser(description="Split threshold scan histograms into one file per threshold")
+    parser.add_argument("-i", "--input", default="./histograms/histograms_thrscan.root", help="Histograms file of the threshold scan")
+    parser.add_argument("-o", "--outfolder", default="./histograms", help="Folder to store the histograms_thr{thr}.root files")
+    args = parser.parse_args()
+
+    infile = r.TFile.Open(args.input)
+    by_thr, common = {}, []
+    for key in infile.GetListOfKeys():
+        histo = key.ReadObj()
+        match = _THR_PATTERN.match(histo.GetName())
+        if match:
+            name, thr = match.groups()
+            by_thr.setdefault(int(thr), []).append((name, histo))
+        else:
+            common.append((histo.GetName(), histo))
+
+    os.makedirs(args.outfolder, exist_ok=True)
+    for thr, histos in sorted(by_thr.items()):
+        outpath = os.path.join(args.outfolder, f"histograms_thr{thr}.root")
+        outfile = r.TFile(outpath, "RECREATE")
+        for name, histo in histos + common:
+            histo.Clone(name).Write()
+        outfile.Close()
+        color_msg(f"{len(histos) + len(common)} histograms saved in {outpath}", color="green")
+
+    infile.Close()
+
+if __name__ == "__main__":
+    main()
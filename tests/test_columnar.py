@@ -0,0 +1,88 @@
+"""
+Tests of the columnar shower emulation (``utils/columnar.py``) against the per event one.
+
+Run from the repository root with ``python -m pytest tests`` (dtpr must be installed).
+"""
+import numpy as np
+import pytest
+
+ak = pytest.importorskip("awkward")
+pytest.importorskip("dtpr")
+from utils.columnar import emulate_fwshowers  # noqa: E402
+from utils.shower_functions import _emulate_fwshowers  # noqa: E402
+
+FIELDS = ("wh", "sc", "st", "sl", "w", "BX")
+THRESHOLD = [5, 5, 5, 5]
+
+
+def random_digis(nevents=50, seed=1):
+    rng = np.random.default_rng(seed)
+    events = []
+    for _ in range(nevents):
+        n = rng.integers(1, 60)
+        events.append({
+            "wh": np.zeros(n, dtype=np.int64), "sc": np.ones(n, dtype=np.int64), "st": rng.integers(1, 3, n),
+            "sl": rng.choice([1, 3], n), "w": rng.integers(0, 20, n), "BX": np.sort(rng.integers(0, 40, n)),
+        })
+    return events
+
+
+def test_emulate_fwshowers():
+    events = random_digis()
+    digis = ak.zip({field: ak.Array([event[field].tolist() for event in events]) for field in FIELDS})
+    showers = emulate_fwshowers(digis, THRESHOLD)
+    for field in ("BX", "BXM1", "BXM2", "min_wire", "max_wire", "nDigis"):
+        assert ak.to_numpy(ak.drop_none(ak.flatten(showers[field]))).dtype == np.int64
+
+    def key(shower):
+        return shower["wh"], shower["sc"], shower["st"], shower["sl"]
+
+    nshowers = 0
+    for event, new in zip(events, showers.to_list()):
+        ref = sorted(_emulate_fwshowers(*(event[field] for field in FIELDS), THRESHOLD), key=key)
+        new = sorted(new, key=key)
+        assert [key(shower) for shower in new] == [key(shower) for shower in ref]
+        for ref_shower, new_shower in zip(ref, new):
+            assert new_shower["nDigis"] == ref_shower["nhits"]
+            for field in ("BX", "BXM1", "BXM2", "min_wire", "max_wire"):
+                assert new_shower[field] == ref_shower[field]
+            assert new_shower["average_BX_hits"] == pytest.approx(ref_shower["average_BX_hits"])
+            np.testing.assert_array_equal(new_shower["shower_profile"], ref_shower["shower_profile"])
+        nshowers += len(ref)
+    assert nshowers > 0
+
+
+def test_columnar_rates(tmp_path, monkeypatch):
+    # the emulated rates files hold the AM rates too, as the dtpr threshold scan ones
+    uproot = pytest.importorskip("uproot")
+    from rates import columnar_rates
+
+    events = random_digis(nevents=20, seed=2)
+    tps_wh, tps_st, tps_bx = [[-2, 0], [1], []] * 6 + [[2], [2]], [[1, 1], [3], []] * 6 + [[4], [1]], [[20, 21], [20], []] * 6 + [[19], [20]]
+    digis = {
+        "wheel": [e["wh"].tolist() for e in events], "sector": [e["sc"].tolist() for e in events],
+        "station": [e["st"].tolist() for e in events], "superLayer": [e["sl"].tolist() for e in events],
+        "wire": [e["w"].tolist() for e in events], "layer": [[1] * len(e["w"]) for e in events],
+        "time": [(25 * e["BX"] + 3).tolist() for e in events],
+    }
+    tps = {
+        "wheel": tps_wh, "sector": [[1] * len(wh) for wh in tps_wh], "station": tps_st, "BX": tps_bx,
+        "quality": [[1] * len(wh) for wh in tps_wh], "phi": [[0] * len(wh) for wh in tps_wh],
+        "phiB": [[0] * len(wh) for wh in tps_wh], "rpcFlag": [[0] * len(wh) for wh in tps_wh],
+    }
+    tree = {f"digi_{name}": ak.Array(values) for name, values in digis.items()}
+    tree.update({f"ph2TpgPhiEmuAm_{name}": ak.Array(values) for name, values in tps.items()})
+    inpath = str(tmp_path / "ntuple.root")
+    with uproot.recreate(inpath) as f:
+        f["dtNtupleProducer/DTTREE"] = tree
+    monkeypatch.setattr("sys.argv", ["columnar_rates.py", "-i", inpath, "-o", str(tmp_path), "-cf", "rates/run_config.yaml", "--emulate", "--thr", "5", "8"])
+    columnar_rates.main()
+
+    for thr in (5, 8):
+        with uproot.open(str(tmp_path / "histograms" / f"histograms_thr{thr}.root")) as f:
+            assert f["Rate_allBX_MB1_AM"].values().tolist() == [6, 0, 6, 0, 1]
+            assert f["Rate_goodBX_MB1_AM"].values().tolist() == [6, 0, 0, 0, 1]
+            assert f["Rate_allBX_MB3_AM"].values().tolist() == [0, 0, 0, 6, 0]
+            assert f["Rate_goodBX_MB4_AM"].values().tolist() == [0, 0, 0, 0, 0]
+            assert f["Rate_allBX_MB4_AM"].values().tolist() == [0, 0, 0, 0, 1]
+            assert "Rate_allBX_MB1_FwShower" in f
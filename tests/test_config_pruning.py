@@ -0,0 +1,54 @@
+"""
+Tests of the branch selection of the config pruning (``utils/config_pruning.py``).
+
+Run from the repository root with ``python -m pytest tests``.
+"""
+from utils.config_pruning import activate_branches, particle_branches
+
+PARTICLE_TYPES = {
+    "digis": {
+        "amount": "digi_nDigis",
+        "attributes": {
+            "wh": {"branch": "digi_wheel"},
+            "w": {"branch": "digi_wire"},
+            "time": {"branch": "digi_time"},
+            "BX": {"expr": "time // 25 if time is not None else None"},
+        },
+        "filter": "ev.digi_layer > 0",
+        "sorter": {"by": "p.BX"},
+    },
+    "fwshowers": {
+        "amount": "ph2Shower_station",
+        "attributes": {"st": {"branch": "ph2Shower_station"}, "nDigis": {"branch": "ph2Shower_ndigis"}},
+    },
+}
+
+
+class FakeTree:
+    """Branch status of a ROOT tree, with the same wildcard for all branches."""
+
+    def __init__(self, branches):
+        self.status = dict.fromkeys(branches, 1)
+
+    def GetBranch(self, name):
+        return name in self.status
+
+    def SetBranchStatus(self, name, status):
+        for branch in self.status if name == "*" else [name]:
+            self.status[branch] = status
+
+
+def test_particle_branches():
+    assert particle_branches(PARTICLE_TYPES) == {
+        "digi_nDigis", "digi_wheel", "digi_wire", "digi_time", "digi_layer", "ph2Shower_station", "ph2Shower_ndigis",
+    }
+    assert particle_branches(PARTICLE_TYPES, names=["fwshowers"], amounts=False) == {"ph2Shower_station", "ph2Shower_ndigis"}
+
+
+def test_activate_branches():
+    tree = FakeTree(["digi_nDigis", "digi_wheel", "digi_wire", "digi_time", "digi_layer", "digi_superLayer", "ph2Shower_station", "seg_nSegments"])
+    missing = activate_branches(tree, PARTICLE_TYPES)
+    assert missing == ["ph2Shower_ndigis"]
+    assert {name for name, status in tree.status.items() if status} == {
+        "digi_nDigis", "digi_wheel", "digi_wire", "digi_time", "digi_layer", "ph2Shower_station",
+    }
@@ -0,0 +1,106 @@
+"""
+Tests of the firmware shower emulation (``utils.shower_functions.build_fwshowers``), with the outputs of the
+original emulation (dense per event arrays, before the sparse and vectorized engines) pinned on synthetic digis.
+
+Run from the repository root with ``python -m pytest tests`` (dtpr must be installed).
+"""
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+pytest.importorskip("dtpr")
+from dtpr.base import Particle  # noqa: E402
+from utils.shower_functions import build_fwshowers, build_fwshowers_by_thr  # noqa: E402
+
+# digis as (wh, sc, st, sl, w, BX), in the event order, and the threshold per station
+CASES = {
+    # a SL with 10 hits in 4 BXs, a SL below the threshold and a MB3 SL of a negative wheel with its own threshold
+    "basic": (
+        [(0, 4, 1, 1, w, 20 + w // 3) for w in range(10)] + [(0, 4, 1, 3, 5, 21), (0, 4, 1, 3, 6, 22)]
+        + [(-2, 12, 3, 3, 90 - w, 30) for w in range(5)],
+        [8, 8, 5, 8],
+    ),
+    # hits of the same wire in the same BX (and in BX 0) are rejected, in the next BX they are not
+    "hot_wire": (
+        [(1, 1, 2, 1, 0, 0), (1, 1, 2, 1, 1, 0)] + [(1, 1, 2, 1, 7, 10)] * 3 + [(1, 1, 2, 1, 7, 11), (1, 1, 2, 1, 7, 12)]
+        + [(1, 1, 2, 1, w, 12) for w in range(8, 12)],
+        [7, 7, 7, 7],
+    ),
+    # more than 4 BXs in the peak window: BXM1 (first 4 BXs) and BXM2 (first 2 and last 2) differ from BX
+    "bxm": ([(0, 7, 4, 3, w, bx) for w, bx in zip(range(30, 40), (17, 18, 20, 23, 26, 29, 30, 31, 31, 32))], [9, 9, 9, 9]),
+    # peaks before BX 16: the [peak-16, peak] slice wraps around the end of the BX axis. With a late BX in
+    # the event (MB1) the window is empty, with BXs up to 10 (MB2) it covers the whole BX axis
+    "window_wrap": ([(0, 1, 1, 1, w, 2 + w % 3) for w in range(6)] + [(0, 1, 1, 3, 50, 60)], [5, 5, 5, 5]),
+    "window_wrap_short": ([(0, 2, 2, 1, w, 2 + w % 3) for w in range(6)] + [(0, 2, 2, 3, 50, 10)], [5, 5, 5, 5]),
+    # unsorted BXs, with a wire firing again one BX before its last fired BX (rejected)
+    "unsorted": ([(0, 3, 1, 1, 4, 25), (0, 3, 1, 1, 4, 24)] + [(0, 3, 1, 1, w, 30 - w) for w in range(8)] + [(0, 3, 1, 1, 9, 20)], [6, 6, 6, 6]),
+    # a negative BX
+    "negative_bx": ([(0, 5, 1, 1, 3, -1)] + [(0, 5, 1, 1, w, 5 + w) for w in range(8)], [6, 6, 6, 6]),
+}
+
+# showers of the original emulation, by location: (wh, sc, st, sl), the accepted hits at the peak, the BX
+# summaries, the wires span, the non zero bins of the shower profile and the indices of the shower digis
+EXPECTED = {
+    "basic": [
+        dict(loc=(-2, 12, 3, 3), nDigis=5, BX=30, average_BX_hits=30.0, BXM1=30, BXM2=30, min_wire=86, max_wire=90, profile={86: 1, 87: 1, 88: 1, 89: 1, 90: 1}, digis=[12, 13, 14, 15, 16]),
+        dict(loc=(0, 4, 1, 1), nDigis=10, BX=20, average_BX_hits=21.2, BXM1=21, BXM2=21, min_wire=0, max_wire=9, profile={0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1, 8: 1, 9: 1}, digis=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]),
+    ],
+    "hot_wire": [
+        dict(loc=(1, 1, 2, 1), nDigis=7, BX=10, average_BX_hits=11.571428571428571, BXM1=11, BXM2=11, min_wire=7, max_wire=11, profile={7: 3, 8: 1, 9: 1, 10: 1, 11: 1}, digis=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]),
+    ],
+    "bxm": [
+        dict(loc=(0, 7, 4, 3), nDigis=10, BX=17, average_BX_hits=25.7, BXM1=19, BXM2=24, min_wire=30, max_wire=39, profile={30: 1, 31: 1, 32: 1, 33: 1, 34: 1, 35: 1, 36: 1, 37: 1, 38: 1, 39: 1}, digis=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]),
+    ],
+    "window_wrap": [
+        dict(loc=(0, 1, 1, 1), nDigis=6, BX=None, average_BX_hits=None, BXM1=None, BXM2=None, min_wire=0, max_wire=5, profile={}, digis=[0, 1, 2, 3, 4, 5]),
+    ],
+    "window_wrap_short": [
+        dict(loc=(0, 2, 2, 1), nDigis=6, BX=2, average_BX_hits=3.0, BXM1=3, BXM2=3, min_wire=0, max_wire=5, profile={0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1}, digis=[0, 1, 2, 3, 4, 5]),
+    ],
+    "unsorted": [
+        dict(loc=(0, 3, 1, 1), nDigis=10, BX=20, average_BX_hits=25.7, BXM1=23, BXM2=25, min_wire=0, max_wire=9, profile={0: 1, 1: 1, 2: 1, 3: 1, 4: 2, 5: 1, 6: 1, 7: 1, 9: 1}, digis=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]),
+    ],
+    "negative_bx": [
+        dict(loc=(0, 5, 1, 1), nDigis=8, BX=9, average_BX_hits=10.5, BXM1=10, BXM2=10, min_wire=0, max_wire=7, profile={4: 1, 5: 1, 6: 1, 7: 1}, digis=[0, 1, 2, 3, 4, 5, 6, 7, 8]),
+    ],
+}
+
+
+def make_event(rows):
+    digis = [Particle(index=i, wh=wh, sc=sc, st=st, sl=sl, l=1, w=w, BX=bx, name="Digi") for i, (wh, sc, st, sl, w, bx) in enumerate(rows)]
+    return SimpleNamespace(digis=digis)
+
+
+def summary(ev, shower):
+    profile = np.asarray(shower.shower_profile)
+    return dict(
+        loc=(shower.wh, shower.sc, shower.st, shower.sl), nDigis=shower.nDigis, BX=shower.BX,
+        average_BX_hits=shower.average_BX_hits, BXM1=shower.BXM1, BXM2=shower.BXM2,
+        min_wire=shower.min_wire, max_wire=shower.max_wire,
+        profile={int(w): int(profile[w]) for w in np.flatnonzero(profile)},
+        digis=sorted(ev.digis.index(digi) for digi in shower.digis),
+    )
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "loop"])
+@pytest.mark.parametrize("case", list(CASES))
+def test_build_fwshowers(case, engine):
+    rows, threshold = CASES[case]
+    ev = make_event(rows)
+    build_fwshowers(ev, threshold=threshold, use_NN_filter=False, engine=engine)
+    showers = sorted((summary(ev, shower) for shower in ev.fwshowers), key=lambda shower: shower["loc"])
+    assert len(showers) == len(EXPECTED[case])
+    for shower, expected in zip(showers, EXPECTED[case]):
+        assert shower["average_BX_hits"] == pytest.approx(expected["average_BX_hits"])
+        shower["average_BX_hits"] = expected["average_BX_hits"]
+        assert shower == expected
+    assert all(len(shower.shower_profile) == 97 for shower in ev.fwshowers)
+    assert all(shower.isnot_dropped for shower in ev.fwshowers)
+
+
+def test_build_fwshowers_by_thr():
+    rows, _ = CASES["basic"]
+    ev = make_event(rows)
+    build_fwshowers_by_thr(ev, thresholds=[5, (8, 8, 5, 8), 10], use_NN_filter=False)
+    locs = {thr: sorted((s.wh, s.sc, s.st, s.sl) for s in showers) for thr, showers in ev.fwshowers_by_thr.items()}
+    assert locs == {5: [(-2, 12, 3, 3), (0, 4, 1, 1)], (8, 8, 5, 8): [(-2, 12, 3, 3), (0, 4, 1, 1)], 10: [(0, 4, 1, 1)]}
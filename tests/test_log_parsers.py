@@ -0,0 +1,103 @@
+"""
+Tests of the agreement log parsers (``agreement/log_parsers.py``).
+
+Run from the repository root with ``python -m pytest tests``.
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+# the agreement scripts import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agreement"))
+from log_parsers import iter_hits, read_hits  # noqa: E402
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_read_hits_emu(tmp_path):
+    path = write(tmp_path, "digis_wh0_sc1_st1.txt", "1 1 2 3 4 5 6 7\n\n8 3 9 10 11 12 13 14\n15 1 16 17 18 19 20 21")
+    hits = read_hits(path)
+    np.testing.assert_array_equal(hits["bxsend"], [1, 8, 15])
+    np.testing.assert_array_equal(hits["event"], [7, 14, 21])
+
+
+def test_read_hits_fpga(tmp_path):
+    path = write(tmp_path, "Hitlog_wh0_sc1_st1_SL0.txt", "ID: 1 | BX: 2 | TDC: 3 | Layer: 4 | Wire: 5\n")
+    hits = read_hits(path, "fpga")
+    assert {column: int(values[0]) for column, values in hits.items()} == {"id": 1, "bx": 2, "tdc": 3, "l": 4, "w": 5}
+
+
+@pytest.mark.parametrize("text", [
+    # the chunk has the right number of values, but not per line
+    "1 1 1 1 1 1 1 1 1\n2 2 2 2 2 2 2\n",
+    "1 1 1 1 1 1 1 1 1\n2 2 2 2 2 2 2",
+    "1 1 1 1 1 1 1 1\n1 1 1 1 1 1 1 1 1\n2 2 2 2 2 2 2\n",
+])
+def test_misaligned_lines(tmp_path, text):
+    path = write(tmp_path, "digis_wh0_sc1_st1.txt", text)
+    with pytest.raises(ValueError):
+        list(iter_hits(path))
+    good = [data for data in iter_hits(path, strict=False)]
+    assert all(np.all(data == 1) for data in good)
+
+
+def test_misaligned_fpga_lines(tmp_path):
+    path = write(
+        tmp_path, "Hitlog_wh0_sc1_st1_SL0.txt",
+        "ID: 1 | BX: 2 | TDC: 3 | Layer: 4 | Wire: 5 6\nID: 1 | BX: 2 | TDC: 3 | Layer: 4\n",
+    )
+    with pytest.raises(ValueError):
+        list(iter_hits(path, "fpga"))
+
+
+def test_chunks(tmp_path):
+    hits = np.arange(8 * 1000).reshape(-1, 8)
+    path = str(tmp_path / "digis_wh0_sc1_st1.txt")
+    np.savetxt(path, hits, fmt="%d")
+    np.testing.assert_array_equal(np.concatenate(list(iter_hits(path, chunk_size=100))), hits)
+
+
+def test_resolve_log_path(tmp_path):
+    from log_parsers import resolve_log_path, text_to_binary
+
+    hits = np.arange(8 * 10).reshape(-1, 8)
+    path = str(tmp_path / "digis_wh0_sc1_st1.txt")
+    np.savetxt(path, hits, fmt="%d")
+    assert resolve_log_path(path, "hits") == path
+    binary_path = text_to_binary(path, "hits")
+    assert resolve_log_path(path, "hits") == binary_path
+    np.testing.assert_array_equal(read_hits(binary_path)["event"], hits[:, 7])
+
+    # digis appended to the text log after the conversion, even with the same modification time
+    stat = os.stat(binary_path)
+    with open(path, "a") as f:
+        f.write("1 1 1 1 1 1 1 1\n")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert resolve_log_path(path, "hits") == path
+    text_to_binary(path, "hits")
+    assert resolve_log_path(path, "hits") == binary_path
+    os.remove(path)
+    assert resolve_log_path(path, "hits") == binary_path
+
+
+def test_resolve_showers_log_path(tmp_path):
+    from log_parsers import resolve_log_path, text_to_binary, read_showers
+
+    shower = "sl: 1\nnDigis: 8\nBX: 3\nminW: 3\nmaxW: 60\navgPos: 31.5\navgTime: 12.25\nwires_profile: [0, 1, 2]\n"
+    path = str(tmp_path / "showers_wh0_sc1_st1.txt")
+    with open(path, "w") as f:
+        f.write(f"# Event 0\n{shower}# Event 2\n{shower}")
+    binary_path = text_to_binary(path, "showers")
+    assert resolve_log_path(path, "showers") == binary_path
+    assert read_showers(binary_path)["wires"] == [[0, 1, 2], [0, 1, 2]]
+
+    stat = os.stat(binary_path)
+    with open(path, "a") as f:
+        f.write(f"# Event 5\n{shower}")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert resolve_log_path(path, "showers") == path
@@ -0,0 +1,118 @@
+"""
+Tests of the histogram filling and comparison of the parallel runner (``utils/parallel_fill_histos.py``).
+
+Run from the repository root with ``python -m pytest tests``.
+"""
+import sys
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+import utils.parallel_fill_histos as parallel
+from utils.parallel_fill_histos import fill_histos, compare_histos
+
+# histo source of the shard tests, imported by load_histos from the folder of the config
+_SHARD_HISTOS = """
+class FakeHisto:
+    def __init__(self):
+        self.fills = []
+
+    def Fill(self, *values):
+        self.fills.append(values)
+
+    def Reset(self):
+        self.fills = []
+
+histos = {
+    "values": {"type": "distribution", "func": lambda ev: ev.values, "histo": FakeHisto()},
+    "eff": {"type": "eff", "func": lambda ev: ev.values, "numdef": lambda ev: [v % 2 == 0 for v in ev.values], "histoNum": FakeHisto(), "histoDen": FakeHisto()},
+}
+"""
+
+
+class FakeHisto:
+    def __init__(self):
+        self.fills = []
+
+    def Fill(self, *values):
+        self.fills.append(values)
+
+    def Reset(self):
+        self.fills = []
+
+
+def test_fill_histos():
+    histos = {
+        "dist": {"type": "distribution", "func": lambda ev: ev["values"], "histo": FakeHisto()},
+        "scalar": {"type": "distribution", "func": lambda ev: len(ev["values"]), "histo": FakeHisto()},
+        "dist2d": {"type": "distribution2d", "func": lambda ev: list(zip(ev["values"], ev["passed"])), "histo": FakeHisto()},
+        "eff": {"type": "eff", "func": lambda ev: ev["values"], "numdef": lambda ev: ev["passed"], "histoNum": FakeHisto(), "histoDen": FakeHisto()},
+    }
+    fill_histos({"values": [1, 2, 3], "passed": [True, False, True]}, histos)
+    assert histos["dist"]["histo"].fills == [(1,), (2,), (3,)]
+    assert histos["scalar"]["histo"].fills == [(3,)]
+    assert histos["dist2d"]["histo"].fills == [(1, True), (2, False), (3, True)]
+    assert histos["eff"]["histoDen"].fills == [(1,), (2,), (3,)]
+    assert histos["eff"]["histoNum"].fills == [(1,), (3,)]
+
+    with pytest.raises(ValueError):
+        fill_histos({}, {"bad": {"type": "unknown"}})
+
+
+def test_compare_histos(tmp_path):
+    uproot = pytest.importorskip("uproot")
+    values = np.random.default_rng(0).normal(size=1000)
+    h1 = np.histogram(values, bins=10, range=(-3, 3))
+    h2 = np.histogram2d(values, values ** 2, bins=5)
+    paths = {name: str(tmp_path / f"{name}.root") for name in ("ref", "same", "other")}
+    for name in ("ref", "same"):
+        with uproot.recreate(paths[name]) as f:
+            f["h1"], f["h2"] = h1, h2
+    with uproot.recreate(paths["other"]) as f:
+        f["h1"] = (h1[0] + (np.arange(10) == 3), h1[1])
+        f["h3"] = h1
+
+    assert compare_histos(paths["ref"], paths["same"]) == []
+    assert compare_histos(paths["ref"], paths["other"]) == [
+        "h1: 1 bins with different contents", f"h2: only in {paths['ref']}", f"h3: only in {paths['other']}",
+    ]
+
+
+def test_fill_shards_of_a_worker(tmp_path, monkeypatch):
+    # one worker filling more shards (files) than there are workers: each partial file must hold only the
+    # events of its own shard, so that their merge is the serial fill
+    pytest.importorskip("dtpr")
+    import dtpr.base
+    import dtpr.base.config
+
+    files = {f"file{i}.root": [SimpleNamespace(values=[i, 10 * i + j]) for j in range(3)] + [None] for i in range(4)}
+    monkeypatch.setattr(dtpr.base, "NTuple", lambda inputFolder: SimpleNamespace(events=iter(files[inputFolder])), raising=False)
+    monkeypatch.setattr(dtpr.base.config, "RUN_CONFIG", SimpleNamespace(change_config_file=lambda config_path: None))
+    saved = {}
+    monkeypatch.setattr(parallel, "save_histos", lambda histos, outpath: saved.update({
+        outpath: {f"{name}.{key}": list(info[key].fills) for name, info in histos.items() for key in ("histo", "histoNum", "histoDen") if key in info}
+    }))
+    (tmp_path / "shard_histos.py").write_text(_SHARD_HISTOS)
+    config_path = tmp_path / "run_config.yaml"
+    config_path.write_text("histo_sources: [shard_histos]\nhisto_names: [values, eff]\n")
+    monkeypatch.delitem(sys.modules, "shard_histos", raising=False)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+
+    for i, path in enumerate(files):
+        parallel._fill_shard((i, [path], str(config_path), str(config_path), f"part{i}.root", None, False))
+    merged = {}
+    for part in saved.values():
+        for key, fills in part.items():
+            merged.setdefault(key, []).extend(fills)
+
+    serial = {
+        "values": {"type": "distribution", "func": lambda ev: ev.values, "histo": FakeHisto()},
+        "eff": {"type": "eff", "func": lambda ev: ev.values, "numdef": lambda ev: [v % 2 == 0 for v in ev.values], "histoNum": FakeHisto(), "histoDen": FakeHisto()},
+    }
+    for events in files.values():
+        for ev in events:
+            if ev is not None:
+                fill_histos(ev, serial)
+    assert saved["part1.root"]["values.histo"] == [(1,), (10,), (1,), (11,), (1,), (12,)]
+    assert merged == {f"{name}.{key}": info[key].fills for name, info in serial.items() for key in ("histo", "histoNum", "histoDen") if key in info}
+    sys.modules.pop("shard_histos", None)
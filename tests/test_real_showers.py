@@ -0,0 +1,77 @@
+"""
+Tests of the real shower building (``utils.shower_functions.build_real_showers``), with the outputs of the
+original DataFrame based implementation pinned on a synthetic event.
+
+Run from the repository root with ``python -m pytest tests`` (dtpr must be installed).
+"""
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("dtpr")
+from dtpr.base import Particle  # noqa: E402
+from utils.shower_functions import build_real_showers  # noqa: E402
+
+# simhits as (wh, sc, st, sl, l, w, particle_type) and digis as (wh, sc, st, sl, l, w), by superlayer:
+# type 1: 3 muon and 6 electron cells (one cell with both) spread over the wires, digis on all of them plus two wider ones
+TYPE1 = [(0, 1, 1, 1, 1, w, 13) for w in (10, 11, 12)] + [(0, 1, 1, 1, 2, w, 11) for w in range(12, 18)] + [(0, 1, 1, 1, 1, 12, -11)]
+TYPE1_DIGIS = [(0, 1, 1, 1, 1, w) for w in (10, 11, 12)] + [(0, 1, 1, 1, 2, w) for w in range(12, 18)] + [(0, 1, 1, 1, 3, 4), (0, 1, 1, 1, 4, 40)]
+# type 2: electrons (and only 2 muons) spread over the wires, in a negative wheel
+TYPE2 = [(-2, 7, 2, 3, 1, w, -11) for w in range(20, 36, 2)] + [(-2, 7, 2, 3, 3, w, 13) for w in (21, 23)]
+TYPE2_DIGIS = [(-2, 7, 2, 3, l, w) for _, _, _, _, l, w, _ in TYPE2]
+# photons and pions on 8 cells: only a shower (type 3) with duplicated segments
+OTHERS = [(1, 3, 4, 1, 1 + i % 4, 50 + i, 22 if i % 2 else 211) for i in range(8)]
+OTHERS_DIGIS = [(1, 3, 4, 1, l, w) for _, _, _, _, l, w, _ in OTHERS]
+# 8 electron cells but only 5 with digis: a shower only without Filtersimhits (and a superlayer with only digis)
+NODIGIS = [(2, 9, 3, 1, 2, w, 11) for w in range(60, 68)]
+NODIGIS_DIGIS = [(2, 9, 3, 1, 2, w) for w in range(60, 65)] + [(2, 9, 3, 3, 1, w) for w in range(10)]
+# 7 cells, below the threshold
+BELOW = [(0, 4, 1, 3, 1, w, 11) for w in range(0, 14, 2)]
+BELOW_DIGIS = [(0, 4, 1, 3, 1, w) for w in range(0, 14, 2)]
+
+SIMHITS = TYPE1 + TYPE2 + OTHERS + NODIGIS + BELOW
+DIGIS = TYPE1_DIGIS + TYPE2_DIGIS + OTHERS_DIGIS + NODIGIS_DIGIS + BELOW_DIGIS
+# (wh, sc, st) of the segments matched to the generator muon
+SEGMENTS = {"unique": [(0, 1, 1), (1, 3, 4)], "duplicated": [(0, 1, 1), (1, 3, 4), (1, 3, 4)]}
+
+# real showers of the original implementation, by location
+_TYPE1_SHOWER = dict(loc=(0, 1, 1, 1), shower_type=1, nsimhits=9, ndigis=11, min_wire=4, max_wire=40)
+_TYPE2_SHOWER = dict(loc=(-2, 7, 2, 3), shower_type=2, nsimhits=10, ndigis=10, min_wire=20, max_wire=34)
+_TYPE3_SHOWER = dict(loc=(1, 3, 4, 1), shower_type=3, nsimhits=8, ndigis=8, min_wire=50, max_wire=57)
+_NODIGIS_SHOWER = dict(loc=(2, 9, 3, 1), shower_type=2, nsimhits=8, ndigis=5, min_wire=60, max_wire=67)
+EXPECTED = {
+    ("unique", True): [_TYPE2_SHOWER, _TYPE1_SHOWER],
+    ("unique", False): [_TYPE2_SHOWER, _TYPE1_SHOWER, _NODIGIS_SHOWER],
+    ("duplicated", True): [_TYPE2_SHOWER, _TYPE1_SHOWER, _TYPE3_SHOWER],
+    ("duplicated", False): [_TYPE2_SHOWER, _TYPE1_SHOWER, _TYPE3_SHOWER, _NODIGIS_SHOWER],
+}
+
+
+def make_event(segments):
+    genmuon = Particle(index=0, name="GenMuon")
+    genmuon.matched_segments = [Particle(index=i, wh=wh, sc=sc, st=st, name="Segment") for i, (wh, sc, st) in enumerate(segments)]
+    return SimpleNamespace(
+        simhits=[Particle(index=i, wh=wh, sc=sc, st=st, sl=sl, l=l, w=w, particle_type=pt, name="SimHit") for i, (wh, sc, st, sl, l, w, pt) in enumerate(SIMHITS)],
+        digis=[Particle(index=i, wh=wh, sc=sc, st=st, sl=sl, l=l, w=w, name="Digi") for i, (wh, sc, st, sl, l, w) in enumerate(DIGIS)],
+        genmuons=[genmuon],
+    )
+
+
+@pytest.mark.parametrize("filter_simhits", [True, False])
+@pytest.mark.parametrize("segments", list(SEGMENTS))
+def test_build_real_showers(segments, filter_simhits):
+    ev = make_event(SEGMENTS[segments])
+    build_real_showers(ev, threshold=8, Filtersimhits=filter_simhits)
+    showers = sorted((
+        dict(loc=(s.wh, s.sc, s.st, s.sl), shower_type=s.shower_type, nsimhits=s.nsimhits, ndigis=s.ndigis, min_wire=s.min_wire, max_wire=s.max_wire)
+        for s in ev.realshowers
+    ), key=lambda shower: shower["loc"])
+    assert showers == EXPECTED[(segments, filter_simhits)]
+    assert sorted(shower.index for shower in ev.realshowers) == list(range(len(ev.realshowers)))
+
+
+def test_build_real_showers_threshold():
+    ev = make_event(SEGMENTS["unique"])
+    build_real_showers(ev, threshold=7)
+    assert (0, 4, 1, 3) in {(s.wh, s.sc, s.st, s.sl) for s in ev.realshowers}
+    build_real_showers(ev, threshold=10)
+    assert [(s.wh, s.sc, s.st, s.sl) for s in ev.realshowers] == [(-2, 7, 2, 3)]
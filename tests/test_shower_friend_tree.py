@@ -0,0 +1,66 @@
+"""
+Tests of the shower friend tree writer (``utils/shower_friend_tree.py``) and of its deferred NN scoring stage.
+
+Run from the repository root with ``python -m pytest tests`` (dtpr must be installed).
+"""
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import uproot
+
+pytest.importorskip("dtpr")
+from dtpr.base import Particle  # noqa: E402
+from utils.shower_functions import predict_shower_probs  # noqa: E402
+from utils.shower_friend_tree import score_chunk_fwshowers, write_shower_friend  # noqa: E402
+
+COLUMNS = {"fwshowers": {"wh": "int32", "prediction_value": "float32", "shower_profile": "array"}}
+
+
+def make_events(nentries, seed=1234):
+    """Selected events (every other entry) with 0 to 3 fwshowers with random profiles."""
+    rng = np.random.default_rng(seed)
+    events = []
+    for index in range(0, nentries, 2):
+        showers = [
+            Particle(index=i, wh=int(rng.integers(-2, 3)), name="Shower", shower_profile=rng.poisson(0.3, 97).astype(np.float32))
+            for i in range(int(rng.integers(0, 4)))
+        ]
+        events.append(SimpleNamespace(index=index, fwshowers=showers))
+    return events
+
+
+@pytest.mark.parametrize("batch_size", [None, 3])
+def test_nn_score_across_events(tmp_path, batch_size):
+    nentries, chunk_size = 25, 7
+    events = make_events(nentries)
+    chunks = []
+
+    def chunk_stage(chunk):
+        chunks.append(len(chunk))
+        score_chunk_fwshowers(chunk, batch_size=batch_size)
+
+    outpath = str(tmp_path / "friend.root")
+    write_shower_friend(iter(events), outpath, nentries, COLUMNS, chunk_size=chunk_size, chunk_stage=chunk_stage)
+    assert chunks == [7, 7, 7, 4]
+
+    with uproot.open(outpath) as f:
+        arrays = f["SHOWERS"].arrays(["entry", "selected", "fwshower_prediction_value", "fwshower_shower_profile"])
+    assert arrays.entry.tolist() == list(range(nentries))
+    assert arrays.selected.tolist() == [entry % 2 == 0 for entry in range(nentries)]
+
+    # the scores do not depend on how the showers are batched
+    profiles = np.stack([shower.shower_profile for ev in events for shower in ev.fwshowers])
+    expected = predict_shower_probs(profiles)
+    written = np.concatenate([np.asarray(values, dtype=np.float32) for values in arrays.fwshower_prediction_value])
+    np.testing.assert_allclose(written, expected, rtol=1e-6)
+    np.testing.assert_array_equal(np.asarray(arrays.fwshower_shower_profile[0]), np.concatenate([s.shower_profile for s in events[0].fwshowers] + [np.zeros(0, np.float32)]))
+    assert all(shower.isnot_dropped == (shower.prediction_value > 0.5) for ev in events for shower in ev.fwshowers)
+
+
+def test_without_stage(tmp_path):
+    events = make_events(6)
+    outpath = str(tmp_path / "friend.root")
+    write_shower_friend(iter(events), outpath, 6, COLUMNS)
+    with uproot.open(outpath) as f:
+        values = f["SHOWERS"]["fwshower_prediction_value"].array()
+    assert all(np.isnan(value) for event_values in values.tolist() for value in event_values)
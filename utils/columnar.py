@@ -0,0 +1,350 @@
+"""
+Columnar access to the DTNTuples with uproot and awkward, as an alternative to ``dtpr.base.NTuple`` for
+studies that do not need a python ``Particle`` per digi/simhit/tp.
+
+Particles are built from the ``particle_types`` block of a run config, reading only the branches their
+attributes (``branch``/``expr``), ``filter`` and ``sorter`` refer to, in chunks of events. Each particle
+type is returned as a jagged awkward array of records (one list per event) with an ``index`` field, the
+position of the particle in the ntuple. Attributes computed by a ``src`` function need the python objects
+and are skipped, as well as the non-branch attributes (e.g. ``matched_tps: []``).
+
+The shower builders of ``utils.shower_functions`` have here their columnar versions, working on a whole
+chunk of events at once.
+"""
+import os
+import re
+import warnings
+import numpy as np
+import awkward as ak
+import uproot
+import yaml
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.config_pruning import particle_branches
+from utils.functions import ntuple_shower_good_bx
+from utils.shower_functions import _emulate_fwshowers_loop
+
+# "value if condition else None" expressions, used to guard None values in the python objects
+_OPTIONAL_EXPR = re.compile(r"^(?P<value>.+?)\s+if\s+.+\s+else\s+None\s*$")
+_IDENTIFIER = re.compile(r"\b[A-Za-z_]\w*\b")
+_EXPR_GLOBALS = {"abs": abs, "np": np, "ak": ak}
+
+# number of (wh, sc, st, sl) superlayers, used to build a flat superlayer id
+_NSL = 5 * 15 * 5 * 3
+
+
+def load_run_config(config_path: str) -> Dict[str, Any]:
+    """
+    Load a run config YAML file.
+
+    :param config_path: The path to the run config YAML file
+    :type config_path: str
+    :return: The run config
+    :rtype: Dict[str, Any]
+    """
+    with open(config_path) as f:
+        return yaml.safe_load(f)
+
+
+def _columnar_expr(expr: str) -> str:
+    """Drop the None guard of an expression, arrays have no None values."""
+    match = _OPTIONAL_EXPR.match(expr.strip())
+    return match.group("value") if match else expr
+
+
+def _eval_expr(expr: str, namespace: Dict[str, Any], reference: ak.Array) -> ak.Array:
+    """Evaluate an expression over the arrays of the namespace, broadcasting constants to the reference."""
+    value = eval(_columnar_expr(expr), _EXPR_GLOBALS, namespace)
+    if not isinstance(value, ak.Array):
+        value = ak.ones_like(reference, dtype=np.float64) * value
+    return value
+
+
+def build_particles(arrays: ak.Array, spec: Dict[str, Any]) -> ak.Array:
+    """
+    Build the jagged array of particles of a type from the branches arrays of a chunk of events.
+
+    :param arrays: The branches of a chunk of events
+    :type arrays: ak.Array
+    :param spec: The particle type definition, from the particle_types block of a run config
+    :type spec: Dict[str, Any]
+    :return: The particles, one list per event
+    :rtype: ak.Array
+    """
+    fields = {}
+    for name, attr in spec.get("attributes", {}).items():
+        if not isinstance(attr, dict):
+            continue
+        if "branch" in attr:
+            fields[name] = arrays[attr["branch"]]
+        elif "expr" in attr and fields:
+            try:
+                fields[name] = _eval_expr(attr["expr"], dict(fields), next(iter(fields.values())))
+            except Exception as err:
+                warnings.warn(f"Attribute '{name}' could not be computed in columnar mode ({err}). Skipping it.")
+    if not fields:
+        raise ValueError("Particle type has no branch attributes, it can not be built in columnar mode")
+
+    fields["index"] = ak.local_index(next(iter(fields.values())), axis=1)
+    # records at the particle level, nested branches (e.g. wires profiles) are kept as lists
+    particles = ak.zip(fields, depth_limit=2)
+
+    if "filter" in spec:
+        particles = particles[eval(spec["filter"], _EXPR_GLOBALS, {"p": particles, "ev": arrays})]
+    if "sorter" in spec:
+        key = eval(spec["sorter"]["by"], _EXPR_GLOBALS, {"p": particles, "ev": arrays})
+        order = ak.argsort(key, axis=1, ascending=not spec["sorter"].get("reverse", False), stable=True)
+        particles = particles[order]
+    return particles
+
+
+def iterate_particles(inpath: str, config_path: str, names: Optional[List[str]] = None,
+                      step_size: Optional[str] = "100 MB", tree_name: Optional[str] = None) -> Iterator[Dict[str, ak.Array]]:
+    """
+    Iterate over the input ntuples in chunks of events, building the requested particle types.
+
+    :param inpath: The input ROOT file or folder (searched recursively)
+    :type inpath: str
+    :param config_path: The path to the run config YAML file
+    :type config_path: str
+    :param names: The particle types to build. All the ones in the config if None
+    :type names: Optional[List[str]]
+    :param step_size: The chunk size, as number of events or memory size (see ``uproot.iterate``)
+    :type step_size: Optional[str]
+    :param tree_name: The tree name. The ntuple_tree_name of the config if None
+    :type tree_name: Optional[str]
+    :return: Dictionaries from the particle types to their arrays, one per chunk
+    :rtype: Iterator[Dict[str, ak.Array]]
+    """
+    config = load_run_config(config_path)
+    particle_types = config["particle_types"]
+    names = list(particle_types) if names is None else names
+    tree_name = (tree_name or config.get("ntuple_tree_name", "/dtNtupleProducer/DTTREE")).strip("/")
+
+    if os.path.isfile(inpath):
+        files = [inpath]
+    else:
+        files = sorted(os.path.join(root, f) for root, _, fs in os.walk(inpath) for f in fs if f.endswith(".root"))
+
+    for arrays in uproot.iterate(
+        [{path: tree_name} for path in files], expressions=sorted(particle_branches(particle_types, names, amounts=False)),
+        step_size=step_size, library="ak",
+    ):
+        yield {name: build_particles(arrays, particle_types[name]) for name in names}
+
+
+def _unflatten_showers(columns: Dict[str, np.ndarray], ev: np.ndarray, nevents: int) -> ak.Array:
+    """Build the jagged array of showers (one list per event) from their flat columns."""
+    order = np.argsort(ev, kind="stable")
+    records = ak.zip({name: col[order] for name, col in columns.items()}, depth_limit=1)
+    return ak.unflatten(records, np.bincount(ev, minlength=nevents))
+
+
+def emulate_fwshowers(digis: ak.Array, threshold: List[int]) -> ak.Array:
+    """
+    Columnar version of the firmware shower emulation (see ``utils.shower_functions._emulate_fwshowers``)
+    over a chunk of events: the hot wire rejection, the 16-BX sliding window and the peak search are done
+    for all the superlayers of all the events at once. Events with negative or unsorted BXs go through the
+    hit by hit emulation.
+
+    :param digis: The digis of the events, with wh, sc, st, sl, w and BX fields, sorted by BX
+    :type digis: ak.Array
+    :param threshold: The threshold per station for shower building
+    :type threshold: List[int]
+    :return: The showers of each event, with wh, sc, st, sl, nDigis, BX, average_BX_hits, BXM1, BXM2,
+        min_wire, max_wire and shower_profile fields. BX-like fields are None for empty peak windows
+    :rtype: ak.Array
+    """
+    nevents = len(digis)
+    ev = np.repeat(np.arange(nevents), ak.to_numpy(ak.num(digis)))
+    wh, sc, st, sl, w, BX = (ak.to_numpy(ak.flatten(digis[f])).astype(np.int64) for f in ("wh", "sc", "st", "sl", "w", "BX"))
+    threshold = np.asarray(threshold)
+    columns = {name: [] for name in ("wh", "sc", "st", "sl", "nDigis", "BX", "average_BX_hits", "BXM1", "BXM2", "min_wire", "max_wire", "shower_profile")}
+    shower_ev = []
+
+    # events not suitable for the columnar emulation
+    unsorted = (np.diff(BX) < 0) & (ev[1:] == ev[:-1])
+    fallback = np.zeros(nevents, dtype=bool)
+    fallback[ev[BX < 0]] = True
+    fallback[ev[1:][unsorted]] = True
+    for iev in np.flatnonzero(fallback):
+        in_ev = ev == iev
+        for shower in _emulate_fwshowers_loop(wh[in_ev], sc[in_ev], st[in_ev], sl[in_ev], w[in_ev], BX[in_ev], threshold=threshold.tolist()):
+            shower_ev.append(iev)
+            for name in columns:
+                columns[name].append(shower["nhits" if name == "nDigis" else name])
+
+    keep = ~fallback[ev]
+    ev, wh, sc, st, sl, w, BX = (col[keep] for col in (ev, wh, sc, st, sl, w, BX))
+    if BX.size:
+        maxbx = np.zeros(nevents, dtype=np.int64)
+        np.maximum.at(maxbx, ev, BX)
+        nbx = int(BX.max()) + 1
+        group = ev * _NSL + (((wh + 2) * 15 + sc) * 5 + st) * 3 + (sl - 1)
+
+        # hot wire rejection: first hit of each (SL, wire) per BX, never in BX 0
+        _, first_idx = np.unique((group * 128 + w) * nbx + BX, return_index=True)
+        accepted = np.zeros(BX.size, dtype=bool)
+        accepted[first_idx] = True
+        acc_idx = np.flatnonzero(accepted & (BX > 0))
+        order = acc_idx[np.lexsort((BX[acc_idx], group[acc_idx]))]
+        hit_group, hit_bx, hit_w = group[order], BX[order], w[order]
+
+        # sliding window counts and peak per superlayer
+        keys = hit_group * nbx + hit_bx
+        in_window = np.searchsorted(keys, keys, side="right") - np.searchsorted(keys, keys - np.minimum(hit_bx, 15), side="left")
+        groups, starts, nhits_group = np.unique(hit_group, return_index=True, return_counts=True)
+        gi = np.repeat(np.arange(groups.size), nhits_group)
+        nhits = np.maximum.reduceat(in_window, starts) if groups.size else np.zeros(0, dtype=np.int64)
+        is_peak = in_window == nhits[gi]
+        peak = hit_bx[is_peak][np.unique(gi[is_peak], return_index=True)[1]]
+
+        # peak window [peak-16, peak], with the python slicing semantics of the firmware emulation
+        g_ev, g_sl = groups // _NSL, groups % _NSL
+        g_st = (g_sl // 3) % 5
+        lo = peak - 16
+        lo = np.where(lo < 0, np.maximum(lo + maxbx[g_ev] + 1, 0), lo)
+        win = (hit_bx >= lo[gi]) & (hit_bx <= peak[gi])
+        nwin = np.bincount(gi, weights=win, minlength=groups.size)
+        # unique BXs in the window and their rank inside the superlayer
+        new_bx = np.ones(hit_bx.size, dtype=bool)
+        new_bx[1:] = (gi[1:] != gi[:-1]) | (hit_bx[1:] != hit_bx[:-1])
+        uniq = win & new_bx
+        cum = np.cumsum(uniq)
+        rank = cum - 1 - (cum[starts] - uniq[starts])[gi]
+        nuniq = np.bincount(gi, weights=uniq, minlength=groups.size)
+        first4 = np.bincount(gi, weights=hit_bx * (uniq & (rank < 4)), minlength=groups.size)
+        ends2 = np.bincount(gi, weights=hit_bx * (uniq & (rank < 2)), minlength=groups.size) \
+            + np.bincount(gi, weights=hit_bx * (uniq & (rank >= nuniq[gi] - 2)), minlength=groups.size)
+        has_bxs = nwin > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            win_bx = np.where(win, hit_bx, np.iinfo(np.int64).max)
+            profile = np.zeros((groups.size, 97), dtype=np.int64)
+            np.add.at(profile, (gi[win], hit_w[win]), 1)
+            summary = {
+                "BX": np.minimum.reduceat(win_bx, starts) if groups.size else np.zeros(0, dtype=np.int64),
+                "average_BX_hits": np.bincount(gi, weights=hit_bx * win, minlength=groups.size) / nwin,
+                # int(np.mean(...)) of the loop version, 0 (then None) for the superlayers without BXs
+                "BXM1": np.where(has_bxs, np.trunc(first4 / np.minimum(nuniq, 4)), 0).astype(np.int64),
+                "BXM2": np.where(has_bxs, np.trunc(ends2 / (2 * np.minimum(nuniq, 2))), 0).astype(np.int64),
+            }
+
+        passed = nhits >= threshold[g_st - 1]
+        for iev, (_wh, _sc, _st, _sl), ig in zip(
+            g_ev[passed], zip(*(col[passed] for col in ((g_sl // 225) - 2, (g_sl // 15) % 15, g_st, g_sl % 3 + 1))), np.flatnonzero(passed)
+        ):
+            shower_ev.append(iev)
+            for name, val in (("wh", _wh), ("sc", _sc), ("st", _st), ("sl", _sl), ("nDigis", nhits[ig]),
+                              ("min_wire", hit_w[starts[ig]:starts[ig] + nhits_group[ig]].min()),
+                              ("max_wire", hit_w[starts[ig]:starts[ig] + nhits_group[ig]].max()),
+                              ("shower_profile", profile[ig])):
+                columns[name].append(val)
+            for name in ("BX", "average_BX_hits", "BXM1", "BXM2"):
+                columns[name].append(summary[name][ig] if has_bxs[ig] else None)
+
+    flat = {}
+    for name, values in columns.items():
+        if name == "shower_profile":
+            flat[name] = ak.Array(np.array(values, dtype=np.int64).reshape(-1, 97))
+        else:
+            flat[name] = ak.Array(values) if any(v is None for v in values) else ak.Array(np.array(values))
+    return _unflatten_showers(flat, np.array(shower_ev, dtype=np.int64), nevents)
+
+
+def build_real_showers(simhits: ak.Array, digis: ak.Array, threshold: Optional[int] = 8, filter_simhits: Optional[bool] = True,
+                       duplicated_segments: Optional[np.ndarray] = None) -> ak.Array:
+    """
+    Columnar version of ``utils.shower_functions.build_real_showers`` over a chunk of events.
+
+    :param simhits: The simhits of the events, with wh, sc, st, sl, l, w and particle_type fields
+    :type simhits: ak.Array
+    :param digis: The digis of the events, with wh, sc, st, sl, l and w fields
+    :type digis: ak.Array
+    :param threshold: The threshold for shower building
+    :type threshold: Optional[int]
+    :param filter_simhits: Whether to filter simhits based on corresponding digis
+    :type filter_simhits: Optional[bool]
+    :param duplicated_segments: Per event flag of generator muons with more than one matched segment in
+        the same chamber (needed for type 3 showers). False for all the events if None
+    :type duplicated_segments: Optional[np.ndarray]
+    :return: The real showers of each event, with wh, sc, st, sl, shower_type, nsimhits, ndigis, min_wire
+        and max_wire fields
+    :rtype: ak.Array
+    """
+    nevents = len(simhits)
+    duplicated_segments = np.zeros(nevents, dtype=bool) if duplicated_segments is None else np.asarray(duplicated_segments, dtype=bool)
+
+    def flat(particles, fields):
+        ev = np.repeat(np.arange(nevents), ak.to_numpy(ak.num(particles)))
+        cols = {f: ak.to_numpy(ak.flatten(particles[f])).astype(np.int64) for f in fields}
+        group = ev * _NSL + (((cols["wh"] + 2) * 15 + cols["sc"]) * 5 + cols["st"]) * 3 + (cols["sl"] - 1)
+        return group, (group * 8 + cols["l"]) * 128 + cols["w"], cols
+
+    d_group, d_cell, d_cols = flat(digis, ("wh", "sc", "st", "sl", "l", "w"))
+    s_group, s_cell, s_cols = flat(simhits, ("wh", "sc", "st", "sl", "l", "w", "particle_type"))
+    if filter_simhits:
+        keep = np.isin(s_cell, d_cell)
+        s_group, s_cell, s_cols = s_group[keep], s_cell[keep], {f: c[keep] for f, c in s_cols.items()}
+
+    # unique (l, w, particle_type) hits per superlayer
+    _, first = np.unique(np.stack([s_cell, s_cols["particle_type"]]), axis=1, return_index=True)
+    first = np.sort(first)
+    h_group, h_cell, h_w, h_pt = s_group[first], s_cell[first], s_cols["w"][first], np.abs(s_cols["particle_type"][first])
+
+    groups, gi = np.unique(h_group, return_inverse=True)
+    ng = groups.size
+    ncells = np.bincount(np.unique(np.stack([gi, h_cell]), axis=1)[0], minlength=ng)
+    nrows = np.bincount(gi, minlength=ng)
+    nmuons = np.bincount(gi, weights=h_pt == 13, minlength=ng)
+    electrons = np.bincount(gi, weights=h_pt == 11, minlength=ng) > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_w = np.bincount(gi, weights=h_w, minlength=ng) / nrows
+        var_w = np.bincount(gi, weights=(h_w - mean_w[gi]) ** 2, minlength=ng) / (nrows - 1)
+    spread = (nrows > 1) & (var_w > 1)
+    g_ev = groups // _NSL
+
+    shower_type = np.select(
+        [(nmuons >= 3) & electrons & spread, electrons & spread, duplicated_segments[g_ev] if ng else np.zeros(0, dtype=bool)],
+        [1, 2, 3], default=0,
+    )
+    passed = (ncells >= threshold) & (shower_type > 0)
+
+    # digis of the same superlayers
+    d_in = np.isin(d_group, groups)
+    d_gi = np.searchsorted(groups, d_group[d_in])
+    ndigis = np.bincount(np.unique(np.stack([d_gi, d_cell[d_in]]), axis=1)[0], minlength=ng) if d_in.any() else np.zeros(ng, dtype=np.int64)
+    min_wire = np.full(ng, np.iinfo(np.int64).max)
+    max_wire = np.full(ng, np.iinfo(np.int64).min)
+    for g, wires in ((gi, h_w), (d_gi, d_cols["w"][d_in])):
+        np.minimum.at(min_wire, g, wires)
+        np.maximum.at(max_wire, g, wires)
+
+    g_sl = groups % _NSL
+    columns = {
+        "wh": g_sl // 225 - 2, "sc": (g_sl // 15) % 15, "st": (g_sl // 3) % 5, "sl": g_sl % 3 + 1,
+        "shower_type": shower_type, "nsimhits": ncells, "ndigis": ndigis, "min_wire": min_wire, "max_wire": max_wire,
+    }
+    return _unflatten_showers({name: col[passed] for name, col in columns.items()}, g_ev[passed], nevents)
+
+
+def wheel_counts(showers: ak.Array, station: int, goodbx: Optional[bool] = False, good_bx: Optional[int] = ntuple_shower_good_bx) -> np.ndarray:
+    """
+    Number of showers per wheel (-2 to 2) in a station, as the shower rate histograms of
+    ``rates/shower_rates_histos.py``. Also used for the TPs of the AM rate histograms.
+
+    :param showers: The showers (or TPs) of a chunk of events, with wh, st and BX fields
+    :type showers: ak.Array
+    :param station: The station
+    :type station: int
+    :param goodbx: Whether to count only the showers in the good BX
+    :type goodbx: Optional[bool]
+    :param good_bx: The good BX
+    :type good_bx: Optional[int]
+    :return: The counts per wheel
+    :rtype: np.ndarray
+    """
+    showers = ak.flatten(showers)
+    mask = showers.st == station
+    if goodbx:
+        mask = mask & ak.fill_none(showers.BX == good_bx, False)
+    return np.bincount(ak.to_numpy(showers.wh[mask]).astype(np.int64) + 2, minlength=5)[:5]
@@ -0,0 +1,297 @@
+"""
+Static dependency analysis of a run config, to build only the particle types and attributes that the selected
+``histo_names``, ``ntuple_preprocessors`` and ``ntuple_selectors`` actually use.
+
+The columnar readers (``utils.columnar``) then only read the branches of the pruned config, and
+``parallel_fill_histos.py --prune`` deactivates the other branches of the tree of each NTuple
+(``activate_branches``), so ROOT does not read them. ``dtpr fill-histos`` with a pruned config only builds
+less of each event: it reads the tree entries as for any config. See ``benchmarks/branch_pruning_benchmark.py``
+to measure the time and bytes read by each of them.
+
+The names used by the histogram functions, preprocessors and selectors are collected from their bytecode
+(attribute names, global names and string constants, such as ``ev.tps``, ``shower.wh`` or
+``filter_particles("fwshowers", st=st)``), following the functions they call from the same packages.
+A particle type is kept if its name is used, and an attribute of a kept type if its name is used or a
+kept ``expr``/``filter``/``sorter`` refers to it. The analysis is conservative: any use of a name keeps
+it, whatever the object it is accessed on. Attributes accessed through computed names
+(``getattr(p, var)``) can not be seen, those can be forced with ``keep``.
+
+Usage (from the study folder, as with dtpr):
+    python ../utils/config_pruning.py -cf ./run_config.yaml [-o ./run_config_pruned.yaml]
+"""
+import os
+import re
+import sys
+import types
+import argparse
+import importlib
+import yaml
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+_IDENTIFIER = re.compile(r"\b[A-Za-z_]\w*\b")
+_EV_BRANCH = re.compile(r"\bev\.(\w+)")
+
+
+def _import_object(src: str) -> Any:
+    """Import an object from its dotted path (e.g. 'utils.shower_functions.build_fwshowers')."""
+    module, name = src.rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)
+
+
+def _const_tokens(const: Any, tokens: Set[str], codes: List[types.CodeType]) -> None:
+    """Collect the strings of a constant (nested in tuples/frozensets) and the code objects (lambdas, comprehensions)."""
+    if isinstance(const, str):
+        tokens.update(_IDENTIFIER.findall(const))
+    elif isinstance(const, (tuple, frozenset, list, set)):
+        for item in const:
+            _const_tokens(item, tokens, codes)
+    elif isinstance(const, dict):
+        for item in const.values():
+            _const_tokens(item, tokens, codes)
+    elif isinstance(const, types.CodeType):
+        codes.append(const)
+
+
+def function_tokens(funcs: Iterable[Callable], packages: Iterable[str]) -> Set[str]:
+    """
+    Collect the names used by functions and by the functions they call from the given packages.
+
+    :param funcs: The functions to analyze
+    :type funcs: Iterable[Callable]
+    :param packages: The top level packages whose functions are followed (e.g. 'utils')
+    :type packages: Iterable[str]
+    :return: The attribute names, global names and identifiers in string constants used by the functions
+    :rtype: Set[str]
+    """
+    packages = set(packages)
+    tokens, seen = set(), set()
+    stack = list(funcs)
+    while stack:
+        func = stack.pop()
+        func = getattr(func, "func", func)  # functools.partial
+        if not isinstance(func, types.FunctionType) or id(func) in seen:
+            continue
+        seen.add(id(func))
+
+        names, codes = set(), [func.__code__]
+        _const_tokens(func.__defaults__ or (), tokens, codes)
+        _const_tokens(func.__kwdefaults__ or {}, tokens, codes)
+        while codes:
+            code = codes.pop()
+            names.update(code.co_names)
+            for const in code.co_consts:
+                _const_tokens(const, tokens, codes)
+        tokens.update(names)
+
+        # callees: globals, closure variables and defaults (e.g. lambda reader, st=st, func=func: ...)
+        callees = [func.__globals__.get(name) for name in names]
+        callees += [cell.cell_contents for cell in func.__closure__ or ()]
+        callees += list(func.__defaults__ or ())
+        for callee in callees:
+            callee = getattr(callee, "func", callee)
+            if isinstance(callee, types.FunctionType) and callee.__module__.split(".")[0] in packages:
+                stack.append(callee)
+    return tokens
+
+
+def config_functions(config: Dict[str, Any], config_dir: str = ".") -> List[Callable]:
+    """
+    Get the functions a run config calls on the events: the histogram functions of the selected
+    histo_names, the preprocessors and the selectors.
+
+    :param config: The run config
+    :type config: Dict[str, Any]
+    :param config_dir: The folder of the config, to import the histogram sources relative to it
+    :type config_dir: str
+    :return: The functions
+    :rtype: List[Callable]
+    """
+    for path in (os.path.abspath(config_dir), os.getcwd()):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    funcs = []
+    available = {}
+    for source in config.get("histo_sources", None) or []:
+        available.update(importlib.import_module(source).histos)
+    for name in config.get("histo_names", None) or []:
+        funcs += [available[name][key] for key in ("func", "numdef") if key in available[name]]
+    for section in ("ntuple_preprocessors", "ntuple_selectors"):
+        funcs += [_import_object(info["src"]) for info in (config.get(section, None) or {}).values()]
+    return funcs
+
+
+def used_names(config: Dict[str, Any], config_dir: str = ".") -> Set[str]:
+    """
+    Get the names used by the histograms, preprocessors and selectors of a run config, including the
+    string arguments given to preprocessors and selectors.
+
+    :param config: The run config
+    :type config: Dict[str, Any]
+    :param config_dir: The folder of the config, to import the histogram sources relative to it
+    :type config_dir: str
+    :return: The used names
+    :rtype: Set[str]
+    """
+    funcs = config_functions(config, config_dir)
+    packages = {"utils"}
+    packages.update(source.split(".")[0] for source in config.get("histo_sources", None) or [])
+    for section in ("ntuple_preprocessors", "ntuple_selectors"):
+        packages.update(info["src"].split(".")[0] for info in (config.get(section, None) or {}).values())
+
+    tokens = function_tokens(funcs, packages)
+    for section in ("ntuple_preprocessors", "ntuple_selectors"):
+        for info in (config.get(section, None) or {}).values():
+            _const_tokens(info.get("kwargs", None) or {}, tokens, [])
+    return tokens
+
+
+def prune_particle_types(particle_types: Dict[str, Any], tokens: Set[str], keep: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Drop the particle types and attributes not used.
+
+    :param particle_types: The particle_types block of a run config
+    :type particle_types: Dict[str, Any]
+    :param tokens: The names used by the run config functions (see ``used_names``)
+    :type tokens: Set[str]
+    :param keep: Particle types or attributes ('ptype' or 'ptype.attr') to keep anyway
+    :type keep: Optional[Iterable[str]]
+    :return: The pruned particle_types block
+    :rtype: Dict[str, Any]
+    """
+    tokens = set(tokens)
+    for item in keep or []:
+        tokens.update(item.split("."))
+
+    pruned = {}
+    for ptype, spec in particle_types.items():
+        if ptype not in tokens:
+            continue
+        attributes = spec.get("attributes", {})
+        needed = set(tokens)
+        for key in ("filter", "sorter"):
+            if key in spec:
+                needed.update(_IDENTIFIER.findall(str(spec[key])))
+        # expr and src attributes can depend on other attributes, iterate until nothing is added
+        kept = set()
+        while True:
+            new = {
+                name for name, attr in attributes.items()
+                if name not in kept and (name in needed or not isinstance(attr, dict) or not attr.keys() & {"branch", "expr", "src"})
+            }
+            if not new:
+                break
+            kept |= new
+            for name in new:
+                attr = attributes[name]
+                if isinstance(attr, dict) and "expr" in attr:
+                    needed.update(_IDENTIFIER.findall(attr["expr"]))
+                if isinstance(attr, dict) and "src" in attr:
+                    needed |= function_tokens([_import_object(attr["src"])], {attr["src"].split(".")[0]})
+        pruned[ptype] = dict(spec, attributes={name: attr for name, attr in attributes.items() if name in kept})
+    return pruned
+
+
+def particle_branches(particle_types: Dict[str, Any], names: Optional[List[str]] = None, amounts: bool = True) -> Set[str]:
+    """
+    Get the branches needed to build the particle types: their amount, attributes, filters and sorters.
+
+    :param particle_types: The particle_types block of a run config
+    :type particle_types: Dict[str, Any]
+    :param names: The particle types to build. All if None
+    :type names: Optional[List[str]]
+    :param amounts: Whether to include the amount branches
+    :type amounts: bool
+    :return: The branch names
+    :rtype: Set[str]
+    """
+    branches = set()
+    for name in names if names is not None else particle_types:
+        spec = particle_types[name]
+        if amounts and isinstance(spec.get("amount", None), str):
+            branches.add(spec["amount"])
+        for attr in spec.get("attributes", {}).values():
+            if isinstance(attr, dict) and "branch" in attr:
+                branches.add(attr["branch"])
+        expressions = [spec.get("filter", ""), spec.get("sorter", {}).get("by", "")]
+        branches.update(branch for expr in expressions for branch in _EV_BRANCH.findall(expr))
+    return branches
+
+
+def activate_branches(tree: Any, particle_types: Dict[str, Any]) -> List[str]:
+    """
+    Deactivate the branches of a ROOT tree (or chain) not needed to build the particle types, so that they are
+    not read from the file. The names used by the functions of ``src`` attributes are kept too if they are
+    branches, since those functions can read any branch of the entry.
+
+    :param tree: The TTree or TChain the events are read from
+    :type tree: Any
+    :param particle_types: The (pruned) particle_types block of a run config
+    :type particle_types: Dict[str, Any]
+    :return: The needed branches not found in the tree
+    :rtype: List[str]
+    """
+    branches = particle_branches(particle_types)
+    names = set()
+    for spec in particle_types.values():
+        for attr in spec.get("attributes", {}).values():
+            if isinstance(attr, dict) and "src" in attr:
+                names |= function_tokens([_import_object(attr["src"])], {attr["src"].split(".")[0]})
+
+    tree.SetBranchStatus("*", 0)
+    missing = []
+    for name in sorted(branches | names):
+        if tree.GetBranch(name):
+            tree.SetBranchStatus(name, 1)
+        elif name in branches:
+            missing.append(name)
+    return missing
+
+
+def prune_config(config_path: str, keep: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Load a run config and prune its particle types to those used by its histograms, preprocessors and selectors.
+
+    :param config_path: The path to the run config YAML file
+    :type config_path: str
+    :param keep: Particle types or attributes ('ptype' or 'ptype.attr') to keep anyway
+    :type keep: Optional[Iterable[str]]
+    :return: The pruned run config
+    :rtype: Dict[str, Any]
+    """
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    tokens = used_names(config, os.path.dirname(os.path.abspath(config_path)))
+    return dict(config, particle_types=prune_particle_types(config["particle_types"], tokens, keep))
+
+
+def main():
+    from dtpr.utils.functions import color_msg
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML file")
+    parser.add_argument("-o", "--output", default=None, help="Path to save the pruned config (not saved if not set)")
+    parser.add_argument("--keep", nargs="*", default=[], help="Particle types or attributes ('ptype.attr') to keep anyway")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        particle_types = yaml.safe_load(f)["particle_types"]
+    pruned = prune_config(args.config, args.keep)
+
+    for ptype, spec in particle_types.items():
+        if ptype not in pruned["particle_types"]:
+            color_msg(f"{ptype}: dropped", color="yellow")
+            continue
+        dropped = [name for name in spec.get("attributes", {}) if name not in pruned["particle_types"][ptype]["attributes"]]
+        color_msg(f"{ptype}: kept" + (f", dropped attributes {dropped}" if dropped else ""), color="green")
+    all_branches, branches = particle_branches(particle_types), particle_branches(pruned["particle_types"])
+    color_msg(f"Branches used: {len(branches)} of {len(all_branches)}", color="blue")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            yaml.safe_dump(pruned, f, sort_keys=False)
+        color_msg(f"Pruned config saved in {args.output}", color="green")
+
+
+if __name__ == "__main__":
+    main()
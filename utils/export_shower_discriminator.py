@@ -0,0 +1,45 @@
+"""
+Export the shower discriminator (``shower_discriminator.pth``) and its scaler (``scaler.pkl``) to the
+plain ``shower_discriminator.npz`` used by the NumPy inference of ``utils.shower_functions``, and check
+that both implementations agree. Needs torch, joblib and scikit-learn; run it again after retraining.
+
+Usage:
+    python utils/export_shower_discriminator.py
+"""
+import os
+import numpy as np
+import torch
+import joblib
+from dtpr.utils.functions import color_msg
+
+_utils_dir = os.path.dirname(os.path.abspath(__file__))
+# indices of the Linear layers in the nn.Sequential of _ShowerNet
+_LINEAR_LAYERS = [0, 3, 6, 8]
+
+
+def main():
+    state_dict = torch.load(os.path.join(_utils_dir, "shower_discriminator.pth"), map_location="cpu")
+    scaler = joblib.load(os.path.join(_utils_dir, "scaler.pkl"))
+
+    params = {"scaler_mean": scaler.mean_, "scaler_scale": scaler.scale_}
+    for i, layer in enumerate(_LINEAR_LAYERS):
+        params[f"W{i}"] = state_dict[f"network.{layer}.weight"].numpy().astype(np.float32)
+        params[f"b{i}"] = state_dict[f"network.{layer}.bias"].numpy().astype(np.float32)
+
+    out_path = os.path.join(_utils_dir, "shower_discriminator.npz")
+    np.savez(out_path, **params)
+    color_msg(f"Shower discriminator exported to {out_path}", color="green")
+
+    # validate against torch
+    from utils import shower_functions
+    shower_functions._nn_params = params
+    profiles = np.random.default_rng(0).poisson(1.5, size=(2048, 97))
+    diff = np.abs(
+        shower_functions.predict_shower_probs(profiles, backend="numpy")
+        - shower_functions.predict_shower_probs(profiles, backend="torch")
+    ).max()
+    color_msg(f"max |p_numpy - p_torch| = {diff:.2e}", color="green" if diff < 1e-6 else "red", indentLevel=1)
+
+
+if __name__ == "__main__":
+    main()
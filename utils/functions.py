@@ -1,10 +1,25 @@
-from typing import List, Any
+from typing import List, Any, Optional, Dict, Tuple
 import numpy as np
 
 stations = range(1, 5)
 sectors = range(1, 15)
 wheels = range(-2, 3)
 
+# good BX of the rate histograms (rates/shower_rates_histos.py, rates/columnar_rates.py):
+# - TPs, whose BX is centered at 0 with '_BX - 20' in the run configs
+tps_good_bx = 0
+# - showers read from the ntuple, whose BX is defined as '_BX - 18' in the run configs
+ntuple_shower_good_bx = 20
+# - showers emulated from the digis (build_fwshowers_by_thr), whose BX is the BX (time // 25) of the first hit of
+#   the shower window. In-time hits start at BX 20 of the digis, the scale of the raw BX of the TPs. Not validated
+#   yet against the ntuple showers of run_4thr.sh: compare the histograms of a threshold with
+#   rates/compare_thrscan_histos.py before using the goodBX ones
+emulated_shower_good_bx = 20
+
+# particle types and location keys indexed by default by the index_particles preprocessor
+_INDEXED_PARTICLES = ["digis", "simhits", "fwshowers", "realshowers", "tps"]
+_INDEXED_LOCS = [("wh", "sc", "st"), ("wh", "sc", "st", "sl")]
+
 def get_best_matches(reader: Any, station: int = 1) -> List[Any]:
     """
     Returns the best matching segments for each generator muon.
@@ -64,3 +79,177 @@ def correct_g4digi_time(g4digi: Any) -> float:
     time_offset = 400
     delay = np.random.normal(loc=mean, scale=stddev)
     return g4digi._time + abs(delay) + time_offset # why abs ?
+
+
+def _build_particles_index(particles: List[Any], loc_ids: Tuple[str, ...]) -> Dict[Tuple, List[Any]]:
+    """
+    Group particles by their location, keeping their order.
+
+    :param particles: The particles to group
+    :type particles: List[Any]
+    :param loc_ids: The attribute names defining the location, e.g. ("wh", "sc", "st")
+    :type loc_ids: Tuple[str, ...]
+    :return: Dictionary from the location values to the particles in that location
+    :rtype: Dict[Tuple, List[Any]]
+    """
+    index = {}
+    for particle in particles:
+        index.setdefault(tuple(getattr(particle, loc_id, None) for loc_id in loc_ids), []).append(particle)
+    return index
+
+
+def _get_particles_indexes(ev: Any) -> Dict[Tuple[str, Tuple[str, ...]], Tuple]:
+    """
+    Get (or create) the location indexes stored in the event, keyed by (particle type, location keys).
+    Each entry holds the indexed particle list, its length at indexing time and the index itself.
+    """
+    indexes = getattr(ev, "_particles_index", None)
+    if indexes is None:
+        indexes = {}
+        setattr(ev, "_particles_index", indexes)
+    return indexes
+
+
+def get_particles_by_loc(ev: Any, particle_type: str, **loc: Any) -> List[Any]:
+    """
+    Drop-in replacement of ``ev.filter_particles(particle_type, **loc)`` for location queries, e.g.
+    ``get_particles_by_loc(ev, "digis", wh=0, sc=1, st=1, sl=1)``. The first query of a particle type
+    with a given set of location keys groups its particles by location, so the following ones are
+    dictionary lookups. The index is rebuilt if the particle list is replaced or changes its length.
+
+    :param ev: The event containing the particles
+    :type ev: Any
+    :param particle_type: The particle type, e.g. "digis"
+    :type particle_type: str
+    :param loc: The location values to look for, by attribute name
+    :type loc: Any
+    :return: The particles in that location, in their original order
+    :rtype: List[Any]
+    """
+    particles = getattr(ev, particle_type, None)
+    if not isinstance(particles, list):
+        return ev.filter_particles(particle_type, **loc)
+
+    loc_ids = tuple(loc)
+    indexes = _get_particles_indexes(ev)
+    cached = indexes.get((particle_type, loc_ids))
+    if cached is None or cached[0] is not particles or cached[1] != len(particles):
+        cached = (particles, len(particles), _build_particles_index(particles, loc_ids))
+        indexes[(particle_type, loc_ids)] = cached
+    return cached[2].get(tuple(loc.values()), [])
+
+
+def index_particles(ev: Any, particle_types: Optional[List[str]] = None, loc_ids: Optional[List[List[str]]] = None) -> None:
+    """
+    Preprocessor to build, once per event, the location indexes used by ``get_particles_by_loc``.
+    Particle types not present in the event (yet) are skipped, they are indexed at their first query.
+
+    :param ev: The event to index
+    :type ev: Any
+    :param particle_types: The particle types to index. Default: digis, simhits, fwshowers, realshowers and tps
+    :type particle_types: Optional[List[str]]
+    :param loc_ids: The sets of location keys to index. Default: (wh, sc, st) and (wh, sc, st, sl)
+    :type loc_ids: Optional[List[List[str]]]
+    :return: None, modifies the event by adding the _particles_index attribute
+    :rtype: None
+    """
+    particle_types = _INDEXED_PARTICLES if particle_types is None else particle_types
+    loc_ids = _INDEXED_LOCS if loc_ids is None else [tuple(ids) for ids in loc_ids]
+    indexes = _get_particles_indexes(ev)
+    for particle_type in particle_types:
+        particles = getattr(ev, particle_type, None)
+        if not isinstance(particles, list):
+            continue
+        for ids in loc_ids:
+            indexes[(particle_type, ids)] = (particles, len(particles), _build_particles_index(particles, ids))
+
+
+_list_append = list.append
+
+class MatchedList(list):
+    """
+    List of matched particles, e.g. ``shower.matched_tps``. It keeps the insertion order, as the histogram
+    functions expect, but membership is checked by identity in O(1) and ``append``/``extend`` skip the
+    particles already in it, so it can be filled without ``if x not in matched`` list scans.
+    """
+    __slots__ = ("_ids",)
+
+    def __init__(self, items: Any = ()) -> None:
+        super().__init__()
+        self._ids = set()
+        self.extend(items)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+    def __contains__(self, item: Any) -> bool:
+        return id(item) in self._ids
+
+    def _reindex(self) -> None:
+        self._ids = {id(item) for item in self}
+
+    def append(self, item: Any) -> None:
+        key = id(item)
+        if key not in self._ids:
+            self._ids.add(key)
+            _list_append(self, item)
+
+    def extend(self, items: Any) -> None:
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items: Any) -> "MatchedList":
+        self.extend(items)
+        return self
+
+    def insert(self, index: int, item: Any) -> None:
+        if id(item) not in self._ids:
+            self._ids.add(id(item))
+            super().insert(index, item)
+
+    def remove(self, item: Any) -> None:
+        for i, _item in enumerate(self):
+            if _item is item:
+                del self[i]
+                return
+        raise ValueError("MatchedList.remove(x): x not in list")
+
+    def pop(self, index: int = -1) -> Any:
+        item = super().pop(index)
+        self._ids.discard(id(item))
+        return item
+
+    def clear(self) -> None:
+        super().clear()
+        self._ids.clear()
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        super().__setitem__(index, value)
+        self._reindex()
+
+    def __delitem__(self, index: Any) -> None:
+        super().__delitem__(index)
+        self._reindex()
+
+
+def append_to_matched_list(obj: Any, attr: str, item: Any) -> None:
+    """
+    Add a particle to a matched list of an object if it is not already there, as
+    ``dtpr.utils.functions.append_to_matched_list`` but with a ``MatchedList``. Missing attributes and plain
+    lists (e.g. the ``matched_tps: []`` attributes of the run configs) are replaced by a ``MatchedList``
+    with their content.
+
+    :param obj: The object holding the matched list, e.g. a segment
+    :type obj: Any
+    :param attr: The name of the matched list attribute, e.g. "matched_tps"
+    :type attr: str
+    :param item: The matched particle
+    :type item: Any
+    :return: None, modifies the object matched list
+    :rtype: None
+    """
+    matched = getattr(obj, attr, None)
+    if not isinstance(matched, MatchedList):
+        matched = MatchedList(matched or ())
+        setattr(obj, attr, matched)
+    matched.append(item)
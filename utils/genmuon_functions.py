@@ -1,10 +1,11 @@
 # functions to analyze generator level muons
 
 from dtpr.base import Event, Particle
-from utils.segment_functions import match_offline_AMtp
-from dtpr.utils.functions import append_to_matched_list, get_unique_locs
-from utils.functions import phiConv
+from utils.segment_functions import match_offline_AMtps, get_tps_by_chamber
+from dtpr.utils.functions import get_unique_locs
+from utils.functions import phiConv, get_particles_by_loc, append_to_matched_list
 import math
+import numpy as np
 from itertools import combinations
 from typing import List, Optional
 
@@ -47,9 +48,39 @@ def match_genmuon_offline_segment(gm: Particle, seg: Particle, max_dPhi: float,
         append_to_matched_list(seg, 'matched_genmuons', gm)
 
 
+def match_genmuons_offline_segments(genmuons: List[Particle], segments: List[Particle], max_dPhi: float, max_dEta: float) -> np.ndarray:
+    """
+    Vectorized version of ``match_genmuon_offline_segment``: evaluates the matching criteria for all the
+    generator muon - segment pairs at once, without modifying the particles.
+
+    :param genmuons: The generator muons
+    :type genmuons: List[Particle]
+    :param segments: The segments
+    :type segments: List[Particle]
+    :param max_dPhi: The maximum dPhi for matching
+    :type max_dPhi: float
+    :param max_dEta: The maximum dEta for matching
+    :type max_dEta: float
+    :return: Boolean matrix of shape (n genmuons, n segments), True for the matching pairs
+    :rtype: np.ndarray
+    """
+    gm_phi = np.array([gm.phi for gm in genmuons], dtype=float)
+    gm_eta = np.array([gm.eta for gm in genmuons], dtype=float)
+    seg_phi = np.array([seg.phi for seg in segments], dtype=float)
+    seg_eta = np.array([seg.eta for seg in segments], dtype=float)
+    seg_quality = np.array([(seg.nHits_phi >= 4) and (seg.nHits_z >= 4 or seg.st == 4) for seg in segments], dtype=bool)
+
+    dphi = np.abs(np.arccos(np.cos(gm_phi[:, None] - seg_phi[None, :])))
+    deta = np.abs(gm_eta[:, None] - seg_eta[None, :])
+    return (dphi < max_dPhi) & (deta < max_dEta) & seg_quality[None, :]
+
+
 def analyze_genmuon_matches(ev: Event) -> None:
     """
-    Match generator muons to segments and TPs in a broad dPhi/dEta window.
+    Match generator muons to segments and TPs in a broad dPhi/dEta window. The criteria are evaluated for all
+    the pairs at once (see ``match_genmuons_offline_segments`` and ``utils.segment_functions.match_offline_AMtps``,
+    which only compares each segment to the TPs of its chamber), and the matched lists are filled in the same
+    order as matching the pairs one by one.
     
     :param ev: The event containing genmuons, segments, and TPs
     :type ev: Event
@@ -69,15 +100,31 @@ def analyze_genmuon_matches(ev: Event) -> None:
             "Event does not have 'tps' they are required to analyze matches."
         )
 
-    for gm in ev.genmuons:
-        # Match segments to generator muons
-        for seg in ev.segments:
-            # gm.match_segment(seg, math.pi / 6., 0.8)\
-            match_genmuon_offline_segment(gm, seg, 0.1, 0.3)
+    genmuons, segments, tps = ev.genmuons, ev.segments, ev.tps
+    if not genmuons or not segments:
+        return
+
+    # Match segments to generator muons
+    gm_seg_matches = match_genmuons_offline_segments(genmuons, segments, 0.1, 0.3)
+    # Match TPs to the segments matched to any generator muon
+    matched_segs = np.flatnonzero(gm_seg_matches.any(axis=0))
+    seg_tps = {}
+    if matched_segs.size and tps:
+        _segs = [segments[iseg] for iseg in matched_segs]
+        seg_tps = {id(seg): _tps for seg, _tps in zip(_segs, match_offline_AMtps(_segs, get_tps_by_chamber(ev), max_dPhi=0.1))}
+
+    for gm, row in zip(genmuons, gm_seg_matches):
+        for iseg in np.flatnonzero(row):
+            append_to_matched_list(gm, 'matched_segments', segments[iseg])
+            append_to_matched_list(segments[iseg], 'matched_genmuons', gm)
         # Now re-match with TPs
         for _seg in getattr(gm, 'matched_segments', []):
-            for tp in ev.tps:
-                match_offline_AMtp(_seg, tp, max_dPhi=0.1)
+            for tp in seg_tps.get(id(_seg), []):
+                append_to_matched_list(_seg, 'matched_tps', tp)
+                append_to_matched_list(tp, 'matched_segments', _seg)
+                for _gm in getattr(_seg, 'matched_genmuons', []):
+                    append_to_matched_list(_gm, 'matched_tps', tp)
+                    append_to_matched_list(tp, 'matched_genmuons', _gm)
 
 
 def analyze_genmuon_showers(ev: Event, method: Optional[int] = 1, simhits_threshold: Optional[int] = 8) -> None:
@@ -107,7 +154,7 @@ def analyze_genmuon_showers(ev: Event, method: Optional[int] = 1, simhits_thresh
         for gm in ev.genmuons:
             locs = get_unique_locs(getattr(gm, 'matched_segments', []), ("wh", "sc", "st"))
             for wh, sc, st in locs:
-                simhits = ev.filter_particles("simhits", wh=wh, sc=sc, st=st)
+                simhits = get_particles_by_loc(ev, "simhits", wh=wh, sc=sc, st=st)
                 if len([simhit for simhit in simhits if abs(simhit.particle_type) == 11]) >= simhits_threshold:
                     gm.showered = True
                     break
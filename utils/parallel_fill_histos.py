@@ -0,0 +1,332 @@
+"""
+Parallel version of ``dtpr fill-histos``: the input ROOT files are sharded across a process pool, each
+worker runs the configured preprocessors and fills the configured histograms for its files, and the
+partial outputs are merged at the end (in shard order) into ``<outfolder>/histograms/histograms<tag>.root``.
+
+Bin contents should be the same as those of the serial run (histograms are filled with unit weights and merged
+by addition), while running at about one file per core. The filling itself (``fill_histos``) follows the dtpr
+histogram dictionary types but is not dtpr's own routine, so the outputs of a config must be compared bin by bin
+with those of ``dtpr fill-histos`` (``--compare-to``, or ``compare_histos``) before relying on them.
+
+Usage (from the study folder, as with dtpr):
+    python ../utils/parallel_fill_histos.py -i INPUT_FOLDER -o . -cf ./run_config.yaml --tag=_mytag -j 16 \
+        [--compare-to histograms/histograms_serial.root]
+"""
+import os
+import sys
+import argparse
+import importlib
+import multiprocessing
+import time
+import warnings
+import yaml
+from typing import Any, Dict, List, Optional
+
+
+def list_root_files(inpath: str, maxfiles: Optional[int] = None) -> List[str]:
+    """
+    List the ROOT files of the input (a file or a folder, searched recursively), sorted by path.
+
+    :param inpath: The input file or folder
+    :type inpath: str
+    :param maxfiles: Maximum number of files to use. All if None
+    :type maxfiles: Optional[int]
+    :return: The paths of the ROOT files
+    :rtype: List[str]
+    """
+    if os.path.isfile(inpath):
+        return [inpath]
+    files = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(inpath)
+        for name in names if name.endswith(".root")
+    )
+    return files[:maxfiles] if maxfiles else files
+
+
+def load_histos(config_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Import the ``histo_sources`` modules of the config and select its ``histo_names`` histograms.
+
+    :param config_path: The path to the run config YAML file
+    :type config_path: str
+    :return: The histograms to fill, by name
+    :rtype: Dict[str, Dict[str, Any]]
+    """
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    # histo sources can be given relative to the study folder (where the config usually is)
+    for path in (os.path.dirname(os.path.abspath(config_path)), os.getcwd()):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    available = {}
+    for source in config.get("histo_sources", []):
+        available.update(importlib.import_module(source).histos)
+    missing = [name for name in config.get("histo_names", []) if name not in available]
+    if missing:
+        raise KeyError(f"Histograms {missing} not found in the histo_sources of {config_path}")
+    return {name: available[name] for name in config.get("histo_names", [])}
+
+
+def _as_list(val: Any) -> List[Any]:
+    return val if isinstance(val, list) else [val]
+
+
+def fill_histos(ev: Any, histos: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Fill the histograms with the event, following the dtpr histogram dictionary types.
+
+    :param ev: The event
+    :type ev: Any
+    :param histos: The histograms to fill, by name
+    :type histos: Dict[str, Dict[str, Any]]
+    :return: None, fills the histograms
+    :rtype: None
+    """
+    for name, info in histos.items():
+        htype = info["type"]
+        if htype == "distribution":
+            for val in _as_list(info["func"](ev)):
+                info["histo"].Fill(val)
+        elif htype == "distribution2d":
+            for valx, valy in _as_list(info["func"](ev)):
+                info["histo"].Fill(valx, valy)
+        elif htype == "eff":
+            vals, passes = _as_list(info["func"](ev)), _as_list(info["numdef"](ev))
+            for val, passed in zip(vals, passes):
+                info["histoDen"].Fill(val)
+                if passed:
+                    info["histoNum"].Fill(val)
+        else:
+            raise ValueError(f"Unknown type '{htype}' of histogram '{name}'")
+
+
+def reset_histos(histos: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Reset the histograms (numerator and denominator for efficiencies). The histogram objects of the
+    ``histo_sources`` modules are shared by all the shards a worker fills, so each shard starts from empty ones.
+
+    :param histos: The histograms, by name
+    :type histos: Dict[str, Dict[str, Any]]
+    :return: None, resets the histograms
+    :rtype: None
+    """
+    for info in histos.values():
+        for key in ("histo", "histoNum", "histoDen"):
+            if key in info:
+                info[key].Reset()
+
+
+def save_histos(histos: Dict[str, Dict[str, Any]], outpath: str) -> None:
+    """
+    Save the histograms (numerator and denominator for efficiencies) into a ROOT file.
+
+    :param histos: The histograms, by name
+    :type histos: Dict[str, Dict[str, Any]]
+    :param outpath: The path of the output ROOT file
+    :type outpath: str
+    :return: None
+    :rtype: None
+    """
+    import ROOT as r
+
+    outfile = r.TFile(outpath, "RECREATE")
+    for info in histos.values():
+        for key in ("histo", "histoNum", "histoDen"):
+            if key in info:
+                info[key].Write()
+    outfile.Close()
+
+
+def _fill_shard(args) -> str:
+    """Worker: fill the histograms with the events of a set of files and save them into a partial file."""
+    ishard, files, config_path, run_config_path, outpath, cache, prune = args
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+
+    histos = load_histos(config_path)
+    # the modules (and their histograms) are imported once per worker, but each shard is saved on its own
+    reset_histos(histos)
+    if cache is None:
+        RUN_CONFIG.change_config_file(config_path=run_config_path)
+    else:
+        # events are built without preprocessors and selectors, their results come from (or go to) the cache
+        from utils.preprocessor_cache import open_cache, cached_events
+
+        cache_path, stripped_config_path = cache
+        with open(run_config_path) as f:
+            run_config = yaml.safe_load(f)
+        conn = open_cache(cache_path)
+        RUN_CONFIG.change_config_file(config_path=stripped_config_path)
+    if prune:
+        from utils.config_pruning import activate_branches
+
+        with open(run_config_path) as f:
+            particle_types = yaml.safe_load(f)["particle_types"]
+    for path in files:
+        ntuple = NTuple(inputFolder=path)
+        if prune:
+            # only the branches of the pruned particle types are read from the file
+            missing = activate_branches(ntuple.tree, particle_types)
+            if missing:
+                warnings.warn(f"Branches {missing} not found in {path}")
+        events = ntuple.events if cache is None else cached_events(ntuple.events, path, run_config, conn)
+        for ev in events:
+            if ev is None:
+                continue
+            fill_histos(ev, histos)
+    save_histos(histos, outpath)
+    return outpath
+
+
+def compare_histos(ref_path: str, new_path: str, rtol: float = 0.) -> List[str]:
+    """
+    Compare bin by bin (contents and errors, including the under and overflow bins) the histograms of two
+    ROOT files, e.g. the outputs of ``dtpr fill-histos`` and of ``parallel_fill_histos`` for the same config.
+
+    :param ref_path: The reference ROOT file
+    :type ref_path: str
+    :param new_path: The ROOT file to check
+    :type new_path: str
+    :param rtol: Relative tolerance of the comparison. Histograms filled with unit weights are exact
+    :type rtol: float
+    :return: The differences found (histograms missing in one of the files, or with different binning or
+        contents), empty if the files agree
+    :rtype: List[str]
+    """
+    import numpy as np
+    import uproot
+
+    def read(path):
+        with uproot.open(path) as f:
+            return {
+                key.split(";")[0]: (tuple(axis.edges(flow=False).tolist() for axis in obj.axes), obj.values(flow=True), obj.variances(flow=True))
+                for key, obj in f.items(cycle=False, filter_classname=["TH1*", "TH2*", "TH3*", "TProfile*"])
+            }
+
+    ref, new = read(ref_path), read(new_path)
+    differences = [f"{name}: only in {ref_path}" for name in ref if name not in new]
+    differences += [f"{name}: only in {new_path}" for name in new if name not in ref]
+    for name in ref.keys() & new.keys():
+        (ref_edges, ref_values, ref_variances), (new_edges, new_values, new_variances) = ref[name], new[name]
+        if ref_edges != new_edges:
+            differences.append(f"{name}: different binning")
+        elif not np.allclose(new_values, ref_values, rtol=rtol, atol=0):
+            differences.append(f"{name}: {np.count_nonzero(~np.isclose(new_values, ref_values, rtol=rtol, atol=0))} bins with different contents")
+        elif not np.allclose(new_variances, ref_variances, rtol=rtol, atol=0):
+            differences.append(f"{name}: different bin errors")
+    return sorted(differences)
+
+
+def parallel_fill_histos(inpath: str, outfolder: str, config_path: str, tag: str = "", nworkers: Optional[int] = None,
+                         maxfiles: Optional[int] = None, prune: bool = False, cache_path: Optional[str] = None) -> str:
+    """
+    Fill the histograms of a run config over all the input files using a process pool.
+
+    :param inpath: The input file or folder
+    :type inpath: str
+    :param outfolder: The output folder, histograms are saved into its histograms subfolder
+    :type outfolder: str
+    :param config_path: The path to the run config YAML file
+    :type config_path: str
+    :param tag: The tag of the output file name, histograms<tag>.root
+    :type tag: str
+    :param nworkers: Number of worker processes. Number of cores if None
+    :type nworkers: Optional[int]
+    :param maxfiles: Maximum number of files to process. All if None
+    :type maxfiles: Optional[int]
+    :param prune: Whether to build only the particle types and attributes used by the histograms, preprocessors
+        and selectors of the config, and to read only their branches (see ``utils.config_pruning``)
+    :type prune: bool
+    :param cache_path: SQLite file where the results of the preprocessors are cached (see ``utils.preprocessor_cache``).
+        Not used if None
+    :type cache_path: Optional[str]
+    :return: The path of the output ROOT file
+    :rtype: str
+    """
+    import ROOT as r
+    from dtpr.utils.functions import color_msg, create_outfolder
+
+    config_path = os.path.abspath(config_path)
+    files = list_root_files(inpath, maxfiles)
+    if not files:
+        raise FileNotFoundError(f"No ROOT files found in {inpath}")
+    nworkers = min(nworkers or os.cpu_count(), len(files))
+
+    histos_folder = os.path.join(outfolder, "histograms")
+    parts_folder = os.path.join(histos_folder, f".parts{tag}")
+    create_outfolder(parts_folder)
+    run_config_path = config_path
+    if prune:
+        from utils.config_pruning import prune_config
+
+        run_config_path = os.path.join(parts_folder, "run_config_pruned.yaml")
+        with open(run_config_path, "w") as f:
+            yaml.safe_dump(prune_config(config_path), f, sort_keys=False)
+    cache = None
+    if cache_path:
+        from utils.preprocessor_cache import open_cache, strip_config
+
+        open_cache(cache_path).close() # create the tables before the workers use it
+        stripped_config_path = os.path.join(parts_folder, "run_config_stripped.yaml")
+        with open(run_config_path) as f:
+            stripped_config = strip_config(yaml.safe_load(f))
+        with open(stripped_config_path, "w") as f:
+            yaml.safe_dump(stripped_config, f, sort_keys=False)
+        cache = (os.path.abspath(cache_path), stripped_config_path)
+    # one shard per file, so that the load is balanced among workers
+    shards = [(i, [path], config_path, run_config_path, os.path.join(parts_folder, f"part{i}.root"), cache, prune) for i, path in enumerate(files)]
+
+    color_msg(f"Filling histograms from {len(files)} files with {nworkers} workers", color="green")
+    start = time.time()
+    with multiprocessing.get_context("spawn").Pool(nworkers) as pool:
+        parts = pool.map(_fill_shard, shards, chunksize=1)
+    color_msg(f"Done in {time.time() - start:.1f} s", color="blue", indentLevel=1)
+
+    outpath = os.path.join(histos_folder, f"histograms{tag}.root")
+    merger = r.TFileMerger(False)
+    merger.OutputFile(outpath, "RECREATE")
+    for part in parts:
+        merger.AddFile(part)
+    if not merger.Merge():
+        raise RuntimeError(f"Failed to merge the partial histograms in {parts_folder}")
+    for part in parts:
+        os.remove(part)
+    if prune:
+        os.remove(run_config_path)
+    if cache is not None:
+        os.remove(cache[1])
+    os.rmdir(parts_folder)
+    color_msg(f"Histograms saved in {outpath}", color="green")
+    return outpath
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="Input ROOT file or folder")
+    parser.add_argument("-o", "--outfolder", default=".", help="Output folder")
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML file")
+    parser.add_argument("--tag", default="", help="Tag of the output file, histograms<tag>.root")
+    parser.add_argument("-j", "--nworkers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--maxfiles", type=int, default=None, help="Maximum number of files to process")
+    parser.add_argument("--prune", action="store_true", help="Build only the particle types and attributes used by the config, and read only their branches")
+    parser.add_argument("--cache", default=None, help="SQLite file to cache the results of the preprocessors (see utils/preprocessor_cache.py)")
+    parser.add_argument("--compare-to", default=None, help="Output of dtpr fill-histos for the same inputs and config to compare with, bin by bin")
+    args = parser.parse_args()
+
+    outpath = parallel_fill_histos(args.inpath, args.outfolder, args.config, tag=args.tag, nworkers=args.nworkers, maxfiles=args.maxfiles,
+                                   prune=args.prune, cache_path=args.cache)
+    if args.compare_to:
+        from dtpr.utils.functions import color_msg
+
+        differences = compare_histos(args.compare_to, outpath)
+        for difference in differences:
+            color_msg(difference, color="red", indentLevel=1)
+        if differences:
+            sys.exit(f"{len(differences)} histograms differ from {args.compare_to}")
+        color_msg(f"Same histograms as {args.compare_to}", color="green")
+
+
+if __name__ == "__main__":
+    main()
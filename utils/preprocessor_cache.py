@@ -0,0 +1,290 @@
+"""
+On-disk cache of the results of the ntuple preprocessors (e.g. ``analyze_genmuon_matches``, ``build_real_showers``,
+``barrel_filter_analyzer`` and ``highpt_showers_identifier``), to iterate on the histograms without running them
+again over the whole ntuple.
+
+The events are built without the preprocessors and selectors of the run config (see ``strip_config``). The first
+time a file is read with a given config, the preprocessors and selectors are run on its events and what they
+derive is stored in a SQLite file, keyed by the file digest, the entry number and a hash of the particle types,
+preprocessors and selectors of the config (so that changing e.g. a preprocessor kwarg in the YAML invalidates
+the cache). The next times, the stored results are attached back to the events instead. Stored per event:
+
+- the event attributes added by the preprocessors (e.g. ``realshowers``, ``bf_matches``), and the particle lists
+  they replace or filter (e.g. ``fwshowers`` after ``analyze_fwshowers``), with any new particles they contain
+- the attributes the preprocessors add to the ntuple particles (e.g. ``is_true_shower``, ``matched_tps``,
+  ``showered``), references to other particles are stored as their positions in the event lists
+- whether the event passes the selectors
+
+Event attributes starting with an underscore (per event caches, e.g. ``_particles_index``) are not stored, and
+the attributes read from branches are assumed not to be modified by the preprocessors. Changes in the code of the
+preprocessors are not detected, remove the cache file after them.
+
+Usage, through the parallel filling (from the study folder, as with dtpr):
+    python ../utils/parallel_fill_histos.py -i INPUT_FOLDER -o . -cf ./run_config.yaml --cache ./preprocessors_cache.sqlite
+"""
+import os
+import zlib
+import pickle
+import sqlite3
+import hashlib
+import importlib
+import yaml
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+from dtpr.base import Particle
+from utils.functions import MatchedList
+
+_DIGEST_CHUNK = 1 << 20
+_CONFIG_KEYS = ("particle_types", "ntuple_preprocessors", "ntuple_selectors")
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (file TEXT, config TEXT, entry INTEGER, data BLOB, PRIMARY KEY (file, config, entry));
+CREATE TABLE IF NOT EXISTS files (file TEXT, config TEXT, nentries INTEGER, PRIMARY KEY (file, config));
+"""
+
+
+def file_digest(path: str) -> str:
+    """
+    Digest identifying an input file by its size and its first and last MiB, so that copies of a file share
+    their cache entries and reading the whole file is not needed.
+
+    :param path: The path of the file
+    :type path: str
+    :return: The hexadecimal digest
+    :rtype: str
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(_DIGEST_CHUNK))
+        if size > _DIGEST_CHUNK:
+            f.seek(max(size - _DIGEST_CHUNK, _DIGEST_CHUNK))
+            digest.update(f.read(_DIGEST_CHUNK))
+    return digest.hexdigest()
+
+
+def config_key(config: Dict[str, Any]) -> str:
+    """
+    Hash of the particle types, preprocessors (with their kwargs) and selectors of a run config.
+
+    :param config: The run config
+    :type config: Dict[str, Any]
+    :return: The hexadecimal hash
+    :rtype: str
+    """
+    return hashlib.sha1(yaml.safe_dump({key: config.get(key, None) for key in _CONFIG_KEYS}, sort_keys=True).encode()).hexdigest()
+
+
+def strip_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a run config without preprocessors and selectors, to build the events read from the cache."""
+    return dict(config, ntuple_preprocessors={}, ntuple_selectors={})
+
+
+def open_cache(path: str) -> sqlite3.Connection:
+    """
+    Open (or create) a cache file. It can be shared by several processes.
+
+    :param path: The path of the SQLite file
+    :type path: str
+    :return: The connection
+    :rtype: sqlite3.Connection
+    """
+    conn = sqlite3.connect(path, timeout=600)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def load_functions(config: Dict[str, Any], section: str) -> List[Tuple[Callable, Dict[str, Any]]]:
+    """Import the functions of the preprocessors or selectors of a run config, with their kwargs, in order."""
+    functions = []
+    for info in (config.get(section, None) or {}).values():
+        module, name = info["src"].rsplit(".", 1)
+        functions.append((getattr(importlib.import_module(module), name), info.get("kwargs", None) or {}))
+    return functions
+
+
+def _literal_attributes(particle_types: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """The attributes of each particle type set to a literal value in the config (e.g. matched_tps: [])."""
+    return {
+        ptype: {
+            name: attr for name, attr in spec.get("attributes", {}).items()
+            if not (isinstance(attr, dict) and attr.keys() & {"branch", "expr", "src"})
+        }
+        for ptype, spec in particle_types.items()
+    }
+
+
+def snapshot_event(ev: Any, particle_types: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Record the state of an event before running the preprocessors: its attribute names, its particle lists and
+    the attribute names of their particles.
+
+    :param ev: The event, built without preprocessors
+    :type ev: Any
+    :param particle_types: The particle_types block of the run config
+    :type particle_types: Dict[str, Any]
+    :return: The snapshot, see ``encode_derived``
+    :rtype: Dict[str, Any]
+    """
+    lists = {ptype: list(getattr(ev, ptype)) for ptype in particle_types if isinstance(getattr(ev, ptype, None), list)}
+    return {
+        "event_attrs": set(vars(ev)),
+        "lists": lists,
+        "particle_attrs": {ptype: set(vars(particles[0])) if particles else set() for ptype, particles in lists.items()},
+        "refs": {id(p): ("p", ptype, pos) for ptype, particles in lists.items() for pos, p in enumerate(particles)},
+    }
+
+
+def _encode(value: Any, refs: Dict[int, Tuple], new: List[Any]) -> Tuple:
+    """Encode a value as tagged tuples, replacing the particles by references (see ``_decode``)."""
+    if isinstance(value, Particle):
+        ref = refs.get(id(value))
+        if ref is None:
+            # particles created by the preprocessors are stored whole, once
+            ref = refs[id(value)] = ("n", len(new))
+            new.append(None)
+            new[ref[1]] = {name: _encode(val, refs, new) for name, val in vars(value).items()}
+        return ref
+    if isinstance(value, MatchedList):
+        return ("m", [_encode(item, refs, new) for item in value])
+    if isinstance(value, list):
+        return ("l", [_encode(item, refs, new) for item in value])
+    if isinstance(value, tuple):
+        return ("t", [_encode(item, refs, new) for item in value])
+    if isinstance(value, dict):
+        return ("d", [(_encode(key, refs, new), _encode(val, refs, new)) for key, val in value.items()])
+    return ("v", value)
+
+
+def encode_derived(ev: Any, snapshot: Dict[str, Any], particle_types: Dict[str, Any]) -> bytes:
+    """
+    Encode what the preprocessors derived on an event, compared to its snapshot before running them.
+
+    :param ev: The event, after running the preprocessors
+    :type ev: Any
+    :param snapshot: The snapshot of the event before running the preprocessors, see ``snapshot_event``
+    :type snapshot: Dict[str, Any]
+    :param particle_types: The particle_types block of the run config
+    :type particle_types: Dict[str, Any]
+    :return: The compressed encoded results
+    :rtype: bytes
+    """
+    refs, new = dict(snapshot["refs"]), []
+    event = {}
+    for name, value in vars(ev).items():
+        if name.startswith("_"):
+            continue
+        if name in snapshot["lists"]:
+            base = snapshot["lists"][name]
+            if isinstance(value, list) and len(value) == len(base) and all(a is b for a, b in zip(value, base)):
+                continue # not modified
+        elif name in snapshot["event_attrs"]:
+            continue
+        event[name] = _encode(value, refs, new)
+
+    literals = _literal_attributes(particle_types)
+    particles = {}
+    for ptype, base in snapshot["lists"].items():
+        base_attrs, defaults = snapshot["particle_attrs"][ptype], literals.get(ptype, {})
+        for pos, p in enumerate(base):
+            attrs = {
+                name: _encode(value, refs, new) for name, value in vars(p).items()
+                if name not in base_attrs or (name in defaults and (type(value) is not type(defaults[name]) or value != defaults[name]))
+            }
+            if attrs:
+                particles[(ptype, pos)] = attrs
+    return zlib.compress(pickle.dumps({"event": event, "particles": particles, "new": new}, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _decode(value: Tuple, lists: Dict[str, List[Any]], new: List[Any]) -> Any:
+    """Decode a value encoded by ``_encode``."""
+    tag = value[0]
+    if tag == "p":
+        return lists[value[1]][value[2]]
+    if tag == "n":
+        return new[value[1]]
+    if tag == "m":
+        return MatchedList(_decode(item, lists, new) for item in value[1])
+    if tag == "l":
+        return [_decode(item, lists, new) for item in value[1]]
+    if tag == "t":
+        return tuple(_decode(item, lists, new) for item in value[1])
+    if tag == "d":
+        return {_decode(key, lists, new): _decode(val, lists, new) for key, val in value[1]}
+    return value[1]
+
+
+def restore_derived(ev: Any, data: bytes, particle_types: Dict[str, Any]) -> None:
+    """
+    Attach the results encoded by ``encode_derived`` to an event built without preprocessors.
+
+    :param ev: The event, built without preprocessors
+    :type ev: Any
+    :param data: The compressed encoded results
+    :type data: bytes
+    :param particle_types: The particle_types block of the run config
+    :type particle_types: Dict[str, Any]
+    :return: None, modifies the event and its particles
+    :rtype: None
+    """
+    derived = pickle.loads(zlib.decompress(data))
+    lists = {ptype: getattr(ev, ptype) for ptype in particle_types if isinstance(getattr(ev, ptype, None), list)}
+    # new particles can refer to each other, so they are created before decoding their attributes
+    new = [Particle.__new__(Particle) for _ in derived["new"]]
+    for particle, attrs in zip(new, derived["new"]):
+        particle.__dict__.update({name: _decode(value, lists, new) for name, value in attrs.items()})
+    for (ptype, pos), attrs in derived["particles"].items():
+        for name, value in attrs.items():
+            setattr(lists[ptype][pos], name, _decode(value, lists, new))
+    for name, value in derived["event"].items():
+        setattr(ev, name, _decode(value, lists, new))
+
+
+def cached_events(events: Iterable[Any], path: str, config: Dict[str, Any], conn: sqlite3.Connection) -> Iterator[Any]:
+    """
+    Iterate over the events of a file with the preprocessors and selectors of a run config applied, from the
+    cache if the file was already processed with the same config, running them and filling the cache otherwise.
+
+    :param events: The events of the file, built without preprocessors and selectors (see ``strip_config``)
+    :type events: Iterable[Any]
+    :param path: The path of the file, to compute its digest
+    :type path: str
+    :param config: The run config, with its preprocessors and selectors
+    :type config: Dict[str, Any]
+    :param conn: The cache, see ``open_cache``
+    :type conn: sqlite3.Connection
+    :return: The selected events
+    :rtype: Iterator[Any]
+    """
+    digest, key = file_digest(path), config_key(config)
+    particle_types = config["particle_types"]
+
+    if conn.execute("SELECT nentries FROM files WHERE file = ? AND config = ?", (digest, key)).fetchone() is not None:
+        rows = dict(conn.execute("SELECT entry, data FROM events WHERE file = ? AND config = ?", (digest, key)))
+        for ev in events:
+            if ev is None:
+                continue
+            data = rows.get(ev.index, None)
+            if data is None: # not selected
+                continue
+            restore_derived(ev, data, particle_types)
+            yield ev
+        return
+
+    preprocessors = load_functions(config, "ntuple_preprocessors")
+    selectors = load_functions(config, "ntuple_selectors")
+    rows = []
+    for ev in events:
+        if ev is None:
+            continue
+        snapshot = snapshot_event(ev, particle_types)
+        for func, kwargs in preprocessors:
+            func(ev, **kwargs)
+        selected = all(func(ev, **kwargs) for func, kwargs in selectors)
+        # encoded before yielding, as the histogram functions can also add attributes to the event
+        rows.append((digest, key, ev.index, encode_derived(ev, snapshot, particle_types) if selected else None))
+        if selected:
+            yield ev
+    # only files read until the end are marked as cached
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (digest, key, len(rows)))
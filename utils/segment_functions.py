@@ -1,7 +1,8 @@
 from dtpr.base import Particle
-from dtpr.utils.functions import append_to_matched_list
+from utils.functions import append_to_matched_list
 import math
-from typing import Optional
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
 
 def match_offline_AMtp(segment: Particle, tp: Particle, max_dPhi: Optional[float] = 0.1) -> None:
     """
@@ -48,3 +49,62 @@ def match_offline_AMtp(segment: Particle, tp: Particle, max_dPhi: Optional[float
                 for gm in segment.matched_genmuons:
                     append_to_matched_list(gm, 'matched_tps', tp)
                     append_to_matched_list(tp, 'matched_genmuons', gm)
+
+
+def _chamber_sector(sc: int) -> int:
+    """Map the sectors 13 and 14 to the sectors 4 and 10 of their chambers."""
+    return 4 if sc == 13 else 10 if sc == 14 else sc
+
+
+def index_tps_by_chamber(tps: List[Particle]) -> Dict[Tuple[int, int, int, bool], List[Particle]]:
+    """
+    Group trigger primitives by chamber (sectors 13/14 mapped to 4/10) and by BX == 0, keeping their order.
+
+    :param tps: The trigger primitives
+    :type tps: List[Particle]
+    :return: Dictionary from (wh, sc, st, BX == 0) to the trigger primitives
+    :rtype: Dict[Tuple[int, int, int, bool], List[Particle]]
+    """
+    index = {}
+    for tp in tps:
+        index.setdefault((tp.wh, _chamber_sector(tp.sc), tp.st, tp.BX == 0), []).append(tp)
+    return index
+
+
+def get_tps_by_chamber(ev: Any) -> Dict[Tuple[int, int, int, bool], List[Particle]]:
+    """
+    Get the trigger primitives of the event grouped by chamber (see ``index_tps_by_chamber``), built once per
+    event and rebuilt if the TPs list is replaced or changes its length.
+
+    :param ev: The event containing the TPs
+    :type ev: Any
+    :return: Dictionary from (wh, sc, st, BX == 0) to the trigger primitives
+    :rtype: Dict[Tuple[int, int, int, bool], List[Particle]]
+    """
+    cached = getattr(ev, "_tps_by_chamber", None)
+    if cached is None or cached[0] is not ev.tps or cached[1] != len(ev.tps):
+        cached = (ev.tps, len(ev.tps), index_tps_by_chamber(ev.tps))
+        setattr(ev, "_tps_by_chamber", cached)
+    return cached[2]
+
+
+def match_offline_AMtps(segments: List[Particle], tps_by_chamber: Dict[Tuple[int, int, int, bool], List[Particle]], max_dPhi: Optional[float] = 0.1) -> List[List[Particle]]:
+    """
+    Vectorized version of ``match_offline_AMtp``: each segment is only compared to the BX == 0 trigger primitives
+    of its chamber, and the dPhi of all those pairs is computed at once, without modifying the particles.
+
+    :param segments: The segments
+    :type segments: List[Particle]
+    :param tps_by_chamber: The trigger primitives grouped by chamber, see ``get_tps_by_chamber``
+    :type tps_by_chamber: Dict[Tuple[int, int, int, bool], List[Particle]]
+    :param max_dPhi: The maximum dPhi for matching
+    :type max_dPhi: float
+    :return: The matched trigger primitives of each segment, in the order of the TPs
+    :rtype: List[List[Particle]]
+    """
+    candidates = [tps_by_chamber.get((seg.wh, _chamber_sector(seg.sc), seg.st, True), []) for seg in segments]
+    seg_phi = np.repeat(np.array([seg.phi for seg in segments], dtype=float), [len(tps) for tps in candidates])
+    # -- Use a conversion factor to express phi in radians
+    trig_glb_phi = np.array([tp.phi / tp.phires_conv + math.pi / 6 * (tp.sc - 1) for tps in candidates for tp in tps], dtype=float)
+    matched = iter((np.abs(np.arccos(np.cos(seg_phi - trig_glb_phi))) < max_dPhi).tolist())
+    return [[tp for tp in tps if next(matched)] for tps in candidates]
@@ -0,0 +1,238 @@
+"""
+Writer of the derived shower collections (e.g. ``fwshowers`` from ``build_fwshowers``, ``realshowers`` from
+``build_real_showers``) and their match relations into a compact ROOT friend tree, aligned entry by entry to the
+DTNtuple it comes from, so that plots and ML trainings can read them with uproot (or as a friend of the DTTREE)
+instead of processing the digis again. The events can also be read through the preprocessor cache (``--cache``,
+see ``utils.preprocessor_cache``).
+
+One friend file is written per input file, ``<outfolder>/<input name>_showers.root``, with a row per entry of the
+input tree (entries not passing the selectors of the config have empty collections and ``selected`` False). Each
+collection is stored as a jagged record, e.g. for fwshowers the branches ``nfwshower``, ``fwshower_wh``,
+``fwshower_BX``, ``fwshower_prediction_value``..., with missing or None values set to -99 (NaN for floats).
+Array attributes (``shower_profile``) and lists of matched particles (``matched_tps``, stored as the ``index`` of the
+particles, their position in the ntuple) are flattened per event into their own branch, e.g.
+``fwshower_shower_profile``, with the size of each shower in ``fwshower_shower_profile_size``, so that they can be
+rebuilt with ``ak.unflatten(arrays.fwshower_shower_profile, ak.flatten(arrays.fwshower_shower_profile_size), axis=1)``.
+
+With ``--nn-score``, the NN discriminator scoring of the fwshowers is deferred to the writing of each chunk: the
+profiles of the showers of all the events of the chunk (``--chunk-size`` entries) are scored together with
+``utils.shower_functions.score_fwshowers``, instead of event by event in the preprocessors. The config should then
+build the showers with ``use_NN_filter: False`` (and without ``nn_filter_fwshowers``), so that they are not scored
+twice, and nothing else in the event loop must use ``isnot_dropped``/``prediction_value``, since they are only set
+when the chunk is written.
+
+Usage (from the study folder, as with dtpr):
+    python ../utils/shower_friend_tree.py -i NTUPLE -o ./friends -cf ./run_config.yaml [--collections fwshowers realshowers]
+        [--nn-score [--nn-batch-size 4096]]
+"""
+import os
+import argparse
+import numpy as np
+import awkward as ak
+import uproot
+import yaml
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_DUMMY = -99
+
+# columns written for each collection: attribute -> dtype, "array" (flattened array) or "indices" (matched particles)
+DEFAULT_COLUMNS = {
+    "fwshowers": {
+        "wh": "int32", "sc": "int32", "st": "int32", "sl": "int32", "nDigis": "int32",
+        "BX": "int32", "BXM1": "int32", "BXM2": "int32", "average_BX_hits": "float32",
+        "min_wire": "int32", "max_wire": "int32", "prediction_value": "float32",
+        "is_true_shower": "bool", "is_highpt_shower": "bool", "comes_from_showered_genmuon": "bool",
+        "shower_profile": "array", "wires_profile": "array", "matched_tps": "indices",
+    },
+    "realshowers": {
+        "wh": "int32", "sc": "int32", "st": "int32", "sl": "int32", "shower_type": "int32",
+        "nsimhits": "int32", "ndigis": "int32", "min_wire": "int32", "max_wire": "int32",
+    },
+}
+
+
+def _scalar(value: Any, dtype: str) -> Any:
+    """Replace None values by the dummy value of the column type."""
+    if value is None:
+        return np.nan if dtype.startswith("float") else (False if dtype == "bool" else _DUMMY)
+    return value
+
+
+def _flatten(values: List[Any], kind: str) -> np.ndarray:
+    """Concatenate the arrays (or the indices of the matched particles) of the particles."""
+    dtype = np.int32 if kind == "indices" else np.float32
+    if kind == "indices":
+        values = [[item.index for item in value] for value in values]
+    return np.concatenate([np.zeros(0, dtype=dtype)] + [np.asarray(value, dtype=dtype).ravel() for value in values])
+
+
+def collection_columns(events: List[Any], name: str, columns: Dict[str, str]) -> Dict[str, ak.Array]:
+    """
+    Build the branches of a collection for a chunk of events.
+
+    :param events: The events of the chunk, None for the entries without event
+    :type events: List[Any]
+    :param name: The collection (event attribute), e.g. "fwshowers"
+    :type name: str
+    :param columns: The attributes to store, see ``DEFAULT_COLUMNS``
+    :type columns: Dict[str, str]
+    :return: The branches of the chunk, by name
+    :rtype: Dict[str, ak.Array]
+    """
+    prefix = name[:-1] if name.endswith("s") else name
+    per_event = [(getattr(ev, name, None) or []) if ev is not None else [] for ev in events]
+    particles = [p for collection in per_event for p in collection]
+    counts = np.array([len(collection) for collection in per_event], dtype=np.int64)
+    particle_event = np.repeat(np.arange(len(events)), counts)
+
+    fields, flattened = {}, {}
+    for attr, kind in columns.items():
+        if kind in ("array", "indices"):
+            values = [getattr(p, attr, None) for p in particles]
+            values = [value if value is not None else [] for value in values]
+            sizes = np.array([len(value) for value in values], dtype=np.int32)
+            fields[f"{attr}_size"] = sizes
+            event_sizes = np.bincount(particle_event, weights=sizes, minlength=len(events)).astype(np.int64)
+            flattened[f"{prefix}_{attr}"] = ak.unflatten(_flatten(values, kind), event_sizes)
+        else:
+            fields[attr] = np.array([_scalar(getattr(p, attr, None), kind) for p in particles], dtype=kind)
+    branches = {prefix: ak.unflatten(ak.zip(fields), counts)}
+    branches.update(flattened)
+    return branches
+
+
+def score_chunk_fwshowers(events: List[Any], batch_size: Optional[int] = None, backend: str = "numpy") -> None:
+    """
+    Score the fwshowers of a chunk of events together with the NN discriminator (deferred scoring stage).
+
+    :param events: The events of the chunk, None for the entries without event
+    :type events: List[Any]
+    :param batch_size: Maximum number of showers per forward pass. All the showers of the chunk at once if None
+    :type batch_size: Optional[int]
+    :param backend: The discriminator backend, "numpy" (default) or "torch"
+    :type backend: str
+    :return: None, modifies the showers in place
+    :rtype: None
+    """
+    from utils.shower_functions import score_fwshowers
+
+    showers = [shower for ev in events if ev is not None for shower in getattr(ev, "fwshowers", None) or []]
+    score_fwshowers(showers, batch_size=batch_size, backend=backend)
+
+
+def write_shower_friend(events: Iterable[Any], outpath: str, nentries: int, collections: Optional[Dict[str, Dict[str, str]]] = None,
+                        tree_name: str = "SHOWERS", chunk_size: int = 1000, chunk_stage: Optional[Callable[[List[Any]], None]] = None) -> None:
+    """
+    Write the friend tree of an input file.
+
+    :param events: The events of the input file, with their entry in ``index`` (None for not selected entries)
+    :type events: Iterable[Any]
+    :param outpath: The path of the output ROOT file
+    :type outpath: str
+    :param nentries: The number of entries of the input tree
+    :type nentries: int
+    :param collections: The collections and their columns. DEFAULT_COLUMNS if None
+    :type collections: Optional[Dict[str, Dict[str, str]]]
+    :param tree_name: The name of the friend tree
+    :type tree_name: str
+    :param chunk_size: Number of entries written at once
+    :type chunk_size: int
+    :param chunk_stage: Function called with the events of each chunk before writing it, e.g. ``score_chunk_fwshowers``
+    :type chunk_stage: Optional[Callable[[List[Any]], None]]
+    :return: None
+    :rtype: None
+    """
+    collections = DEFAULT_COLUMNS if collections is None else collections
+    with uproot.recreate(outpath) as outfile:
+        tree, chunk, entry = None, [], 0
+
+        def flush():
+            nonlocal tree, chunk
+            if chunk_stage is not None:
+                chunk_stage(chunk)
+            branches = {
+                "entry": np.arange(entry - len(chunk), entry, dtype=np.int64),
+                "selected": np.array([ev is not None for ev in chunk], dtype=bool),
+            }
+            for name, columns in collections.items():
+                branches.update(collection_columns(chunk, name, columns))
+            if tree is None:
+                tree = outfile.mktree(tree_name, {key: value.type if isinstance(value, ak.Array) else value.dtype for key, value in branches.items()})
+            tree.extend(branches)
+            chunk = []
+
+        def add(ev):
+            nonlocal entry
+            chunk.append(ev)
+            entry += 1
+            if len(chunk) >= chunk_size:
+                flush()
+
+        for ev in events:
+            if ev is None:
+                continue
+            # entries skipped by the selectors get empty collections
+            while entry < ev.index:
+                add(None)
+            add(ev)
+        while entry < nentries:
+            add(None)
+        if chunk or tree is None:
+            flush()
+
+
+def main():
+    from dtpr.base import NTuple
+    from dtpr.base.config import RUN_CONFIG
+    from dtpr.utils.functions import color_msg, create_outfolder
+    from utils.parallel_fill_histos import list_root_files
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--inpath", required=True, help="Input ROOT file or folder")
+    parser.add_argument("-o", "--outfolder", default="./friends", help="Output folder")
+    parser.add_argument("-cf", "--config", default="./run_config.yaml", help="Run config YAML file")
+    parser.add_argument("--collections", nargs="+", default=list(DEFAULT_COLUMNS), choices=list(DEFAULT_COLUMNS), help="Collections to write")
+    parser.add_argument("--maxfiles", type=int, default=None, help="Maximum number of files to process")
+    parser.add_argument("--cache", default=None, help="Preprocessor cache SQLite file (see utils/preprocessor_cache.py)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Number of entries written at once")
+    parser.add_argument("--nn-score", action="store_true", help="Score the fwshowers of each chunk together with the NN discriminator")
+    parser.add_argument("--nn-batch-size", type=int, default=None, help="Maximum number of showers per forward pass (all the chunk if not set)")
+    parser.add_argument("--nn-backend", default="numpy", choices=["numpy", "torch"], help="NN discriminator backend")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    tree_path = config.get("ntuple_tree_name", "/dtNtupleProducer/DTTREE").strip("/")
+    collections = {name: DEFAULT_COLUMNS[name] for name in args.collections}
+    chunk_stage = None
+    if args.nn_score:
+        chunk_stage = lambda events: score_chunk_fwshowers(events, batch_size=args.nn_batch_size, backend=args.nn_backend)
+    create_outfolder(args.outfolder)
+
+    conn, stripped_config_path = None, None
+    if args.cache:
+        from utils.preprocessor_cache import open_cache, cached_events, strip_config
+
+        conn = open_cache(args.cache)
+        stripped_config_path = os.path.join(args.outfolder, ".run_config_stripped.yaml")
+        with open(stripped_config_path, "w") as f:
+            yaml.safe_dump(strip_config(config), f, sort_keys=False)
+    RUN_CONFIG.change_config_file(config_path=stripped_config_path or args.config)
+
+    try:
+        for path in list_root_files(args.inpath, args.maxfiles):
+            with uproot.open(path) as infile:
+                nentries = infile[tree_path].num_entries
+            outpath = os.path.join(args.outfolder, os.path.basename(path).replace(".root", "_showers.root"))
+            events = NTuple(inputFolder=path).events
+            if conn is not None:
+                events = cached_events(events, path, config, conn)
+            write_shower_friend(events, outpath, nentries, collections, chunk_size=args.chunk_size, chunk_stage=chunk_stage)
+            color_msg(f"{outpath} written ({nentries} entries)", color="green")
+    finally:
+        if stripped_config_path:
+            os.remove(stripped_config_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,22 +7,41 @@ from typing import Tuple, Optional, List
 from collections import deque
 from dtpr.base import Event, Particle
 from dtpr.utils.functions import color_msg, create_outfolder, get_unique_locs
+from utils.functions import get_particles_by_loc, MatchedList
 import numpy as np
-import torch
-import torch.nn as nn
 import os
 
-# Load shower discriminator model
-import joblib
-
+# Shower discriminator: the NumPy export (see utils/export_shower_discriminator.py) is used by default,
+# torch (and the original model and scaler files) are only loaded if the "torch" backend is requested
+_npz_path = os.path.join(os.path.dirname(__file__), 'shower_discriminator.npz')
 _model_path = os.path.join(os.path.dirname(__file__), 'shower_discriminator.pth')
 _scaler_path = os.path.join(os.path.dirname(__file__), 'scaler.pkl')
 
-_shower_model = None
-_scaler = None
+_nn_params = None
+_torch_discriminator = None
+
+if os.path.exists(_npz_path):
+    with np.load(_npz_path) as _npz:
+        _nn_params = {key: _npz[key] for key in _npz.files}
+else:
+    warnings.warn("WARNING: shower_discriminator.npz NOT FOUND. NN filtering is only available with the torch backend.")
+
 
+def _load_torch_discriminator() -> Optional[Tuple[object, object]]:
+    """
+    Build the torch shower discriminator and load its scaler. Only done the first time it is requested.
+
+    :return: Tuple with the model and the scaler, or None if the model file is not found
+    :rtype: Optional[Tuple[object, object]]
+    """
+    global _torch_discriminator
+    if _torch_discriminator is not None or not os.path.exists(_model_path):
+        return _torch_discriminator
+
+    import torch
+    import torch.nn as nn
+    import joblib
 
-if os.path.exists(_model_path):
     class _ShowerNet(nn.Module):
         def __init__(self):
             super().__init__()
@@ -35,33 +54,265 @@ if os.path.exists(_model_path):
         def forward(self, x):
             return self.network(x)
 
-    _shower_model = _ShowerNet()
-    _shower_model.load_state_dict(torch.load(_model_path, map_location='cpu'))
-    _shower_model.eval()
+    model = _ShowerNet()
+    model.load_state_dict(torch.load(_model_path, map_location='cpu'))
+    model.eval()
 
     # Load scaler
-    if os.path.exists(_scaler_path):
-        _scaler = joblib.load(_scaler_path)
-    else:
+    if not os.path.exists(_scaler_path):
         warnings.warn("WARNING: scaler.pkl NOT FOUND. NN filtering will produce meaningless output!")
+        return None
+    _torch_discriminator = (model, joblib.load(_scaler_path))
+    return _torch_discriminator
+
 
+def _nn_available(backend: str) -> bool:
+    """
+    Check if the shower discriminator can be evaluated with the given backend.
+
+    :param backend: The discriminator backend, "numpy" or "torch"
+    :type backend: str
+    :return: True if the weights (and scaler) of the backend are available
+    :rtype: bool
+    """
+    if backend == "numpy":
+        return _nn_params is not None
+    if backend == "torch":
+        return _load_torch_discriminator() is not None
+    raise ValueError(f"Unknown shower discriminator backend '{backend}', use 'numpy' or 'torch'")
+
+
+def _digis_columns(digis: List[Particle]) -> Tuple[ndarray, ...]:
+    """
+    Dump the digis attributes needed by the firmware emulation into flat integer columns.
+
+    :param digis: The digis to dump
+    :type digis: List[Particle]
+    :return: Tuple with the (wh, sc, st, sl, w, BX) columns
+    :rtype: Tuple[ndarray, ...]
+    """
+    cols = np.array([(d.wh, d.sc, d.st, d.sl, d.w, d.BX) for d in digis], dtype=np.int64).reshape(-1, 6)
+    return tuple(cols.T)
+
+
+def _peak_window_summary(bxs: ndarray, wires: ndarray, peak: int, maxbx: int) -> dict:
+    """
+    Compute the shower summary values from the accepted hits of a superlayer around the
+    peak of the sliding window. The window is taken as the slice ``[peak-16, peak]`` of the
+    per-BX arrays of length ``maxbx + 1``, keeping the python slicing semantics of the
+    firmware emulation (a negative start wraps around the end of the BX axis).
+
+    :param bxs: BXs of the accepted hits of the superlayer, sorted
+    :type bxs: ndarray
+    :param wires: Wires of the accepted hits of the superlayer
+    :type wires: ndarray
+    :param peak: BX of the sliding window peak
+    :type peak: int
+    :param maxbx: Maximum BX of the event digis
+    :type maxbx: int
+    :return: Dictionary with BX, average_BX_hits, BXM1, BXM2 and shower_profile
+    :rtype: dict
+    """
+    lo, hi, _ = slice(peak - 16, peak + 1).indices(maxbx + 1)
+    in_window = (bxs >= lo) & (bxs < hi)
+    bxs_in_shower = np.unique(bxs[in_window])
+    has_bxs = bxs_in_shower.size > 0
+    return {
+        "BX": bxs_in_shower.min() if has_bxs else None,
+        "average_BX_hits": bxs[in_window].sum() / in_window.sum() if has_bxs else None,
+        "BXM1": int(np.mean(bxs_in_shower[:4])) if has_bxs else None,
+        "BXM2": int(np.mean(np.concatenate([bxs_in_shower[:2], bxs_in_shower[-2:]]))) if has_bxs else None,
+        "shower_profile": np.bincount(wires[in_window], minlength=97),
+    }
+
+
+def _new_superlayer_state(maxbx: int) -> dict:
+    """
+    Create the (zeroed) firmware emulator state of a single superlayer.
+
+    :param maxbx: Maximum BX of the event digis
+    :type maxbx: int
+    :return: Dictionary with the per-BX (Hit_vector_SL, hit_BX, Hits_per_Bx), per-wire
+        (Lastfired_BX, Hits_vector_SL) and per-wire-and-BX (Hits_profile) arrays
+    :rtype: dict
+    """
+    return {
+        "Hit_vector_SL": np.zeros(maxbx+1, dtype=int),
+        "Hits_vector_SL": np.zeros(128, dtype=int),
+        "Lastfired_BX": np.zeros(128, dtype=int),
+        "hit_BX": np.zeros(maxbx+1, dtype=int),
+        "Hits_per_Bx": np.zeros(maxbx+1, dtype=int),
+        "Hits_profile": np.zeros((97, maxbx+1), dtype=int),
+    }
+
+
+def _emulate_fwshowers_loop(wh: ndarray, sc: ndarray, st: ndarray, sl: ndarray, w: ndarray, BX: ndarray, threshold: List[int]) -> List[dict]:
+    """
+    Reference (hit by hit) emulation of the shower reconstruction in FPGA firmware. The emulator
+    state is only allocated for the superlayers with hits, so the memory per event scales with the
+    number of occupied superlayers instead of the full detector.
+
+    :param wh, sc, st, sl, w, BX: Digis columns, in the event order
+    :type wh, sc, st, sl, w, BX: ndarray
+    :param threshold: The threshold per station for shower building
+    :type threshold: List[int]
+    :return: List of dictionaries with the showers information, see ``_emulate_fwshowers``
+    :rtype: List[dict]
+    """
+    Active_regions=[]
+    MaxBX=int(BX.max())
+    # emulator state only for the superlayers with hits, keyed by (wh, sc, st, sl)
+    SL_states = {}
+
+    for _wh, _sc, _st, _sl, _w, _BX in zip(wh, sc, st, sl, w, BX):
+        region = (int(_wh), int(_sc), int(_st), int(_sl))
+        state = SL_states.get(region)
+        Lastfired_BX = state["Lastfired_BX"][_w] if state is not None else 0
+        #Hotwire_logic;
+        if Lastfired_BX!=_BX and Lastfired_BX!=_BX+1 :
+            if state is None:
+                state = SL_states[region] = _new_superlayer_state(MaxBX)
+            state["Lastfired_BX"][_w]=_BX
+            Active_regions.append(region)
+            state["Hits_profile"][_w, _BX] += 1
+            state["Hits_per_Bx"][_BX] += 1
+            state["Hit_vector_SL"][_BX:_BX+16] += 1
+            state["hit_BX"][_BX] = _BX # array to store the value of the BX
+            state["Hits_vector_SL"][_w] = 1
+
+    showers = []
+    for active_region in set(Active_regions):
+        #process_layer
+        _wh, _sc, _st, _sl = active_region
+        state = SL_states[active_region]
+        if state["Hit_vector_SL"].max() < threshold[_st-1]:
+            continue
+        #maxhits
+        nhits=state["Hit_vector_SL"].max()
+        peak= np.where(state["Hit_vector_SL"] == nhits)[0][0] # Get the first index of the peak
+        BXs_in_shower=state["hit_BX"][peak-16:peak+1]
+        Hits_inShower=state["Hits_per_Bx"][peak-16:peak+1]
+        # Find non-zero indices in Hits_vector_SL for this region
+        wire_indices = np.nonzero(state["Hits_vector_SL"])[0]
+        in_region = (wh == _wh) & (sc == _sc) & (st == _st) & (sl == _sl)
+        showers.append({
+            "wh": _wh, "sc": _sc, "st": _st, "sl": _sl,
+            "nhits": nhits,
+            "BX": min(BXs_in_shower[BXs_in_shower>0]) if BXs_in_shower[BXs_in_shower>0].size>0 else None,
+            "average_BX_hits": sum((BXs_in_shower*Hits_inShower))/sum(Hits_inShower) if sum(Hits_inShower)>0 else None,
+            "BXM1": int(np.mean(BXs_in_shower[BXs_in_shower > 0][:4])) if (BXs_in_shower[BXs_in_shower > 0].size > 0) else None,
+            "BXM2": int(np.mean(np.concatenate([BXs_in_shower[BXs_in_shower > 0][:2], BXs_in_shower[BXs_in_shower > 0][-2:]]))) if (BXs_in_shower[BXs_in_shower > 0].size > 0) else None,
+            "min_wire": int(wire_indices.min()) if wire_indices.size > 0 else None,
+            "max_wire": int(wire_indices.max()) if wire_indices.size > 0 else None,
+            "shower_profile": state["Hits_profile"][:, peak-16:peak+1].sum(axis=1),
+            "digis_idx": np.flatnonzero(in_region & (BX >= peak-16) & (BX <= peak)),
+        })
+    return showers
+
+
+def _emulate_fwshowers(wh: ndarray, sc: ndarray, st: ndarray, sl: ndarray, w: ndarray, BX: ndarray, threshold: List[int]) -> List[dict]:
+    """
+    Array based emulation of the shower reconstruction in FPGA firmware. It reproduces
+    ``_emulate_fwshowers_loop`` but only works over the occupied superlayers:
+
+        1. hot wire rejection: a hit is dropped if the same (SL, wire) already fired in that BX.
+        2. 16-BX sliding window: the number of hits in ``[BX-15, BX]`` is computed for every hit.
+        3. the peak of each superlayer is the first BX reaching the maximum number of hits.
+        4. superlayers passing the threshold of its station are summarized around the peak.
+
+    The digis are expected to be sorted by BX (as the ``sorter`` of the configs does) and to
+    have non negative BXs; otherwise, the reference emulation is used.
+
+    :param wh, sc, st, sl, w, BX: Digis columns, in the event order
+    :type wh, sc, st, sl, w, BX: ndarray
+    :param threshold: The threshold per station for shower building
+    :type threshold: List[int]
+    :return: List of dictionaries with the location (wh, sc, st, sl), number of hits at the peak (nhits),
+        BX, average_BX_hits, BXM1, BXM2, min_wire, max_wire, shower_profile and the indices of the digis
+        in the shower (digis_idx) of each shower
+    :rtype: List[dict]
+    """
+    if BX.min() < 0 or np.any(np.diff(BX) < 0):
+        return _emulate_fwshowers_loop(wh, sc, st, sl, w, BX, threshold)
+
+    maxbx = int(BX.max())
+    region = (((wh + 2) * 15 + sc) * 5 + st) * 3 + (sl - 1)
+
+    # hot wire rejection: since digis are BX sorted, only the first hit of a (SL, wire) in a BX is kept.
+    # BX 0 hits are never accepted, the firmware last fired BX of each wire starts at 0
+    _, first_idx = np.unique((region * 128 + w) * (maxbx + 1) + BX, return_index=True)
+    accepted = np.zeros(BX.size, dtype=bool)
+    accepted[first_idx] = True
+    accepted &= BX > 0
+    if not accepted.any():
+        return []
+
+    # sort the accepted hits by (superlayer, BX) to count the hits in the sliding window
+    acc_idx = np.flatnonzero(accepted)
+    order = acc_idx[np.lexsort((BX[acc_idx], region[acc_idx]))]
+    hit_region, hit_bx, hit_w = region[order], BX[order], w[order]
+    keys = hit_region * (maxbx + 1) + hit_bx
+    in_window = np.searchsorted(keys, keys, side="right") - np.searchsorted(keys, keys - np.minimum(hit_bx, 15), side="left")
+
+    regions, starts, nhits_per_region = np.unique(hit_region, return_index=True, return_counts=True)
+    ends = starts + nhits_per_region
+    nhits = np.maximum.reduceat(in_window, starts)
+    # the peak is the first BX of the superlayer reaching the maximum
+    is_peak = in_window == np.repeat(nhits, nhits_per_region)
+    _, peak_pos = np.unique(hit_region[is_peak], return_index=True)
+    peaks = hit_bx[is_peak][peak_pos]
+
+    # superlayers in order of their first accepted hit, to keep the same iteration order of the set below
+    first_hit = np.unique(region[acc_idx], return_index=True)[1]
+    active_regions = list(zip(*(col[acc_idx][np.sort(first_hit)].tolist() for col in (wh, sc, st, sl))))
+    region_pos = dict(zip(regions.tolist(), range(regions.size)))
+
+    # digis (including the hot wire rejected ones) grouped by superlayer, keeping the event order
+    digis_order = np.argsort(region, kind="stable")
+    digis_lo = np.searchsorted(region[digis_order], regions, side="left")
+    digis_hi = np.searchsorted(region[digis_order], regions, side="right")
+
+    showers = []
+    for _wh, _sc, _st, _sl in set(active_regions):
+        ireg = region_pos[(((_wh + 2) * 15 + _sc) * 5 + _st) * 3 + (_sl - 1)]
+        if nhits[ireg] < threshold[_st - 1]:
+            continue
+        peak = int(peaks[ireg])
+        bxs = hit_bx[starts[ireg]:ends[ireg]]
+        wires = hit_w[starts[ireg]:ends[ireg]]
+        digis_idx = digis_order[digis_lo[ireg]:digis_hi[ireg]]
+        digis_idx = digis_idx[(BX[digis_idx] >= peak - 16) & (BX[digis_idx] <= peak)]
+        showers.append({
+            "wh": _wh, "sc": _sc, "st": _st, "sl": _sl,
+            "nhits": nhits[ireg],
+            **_peak_window_summary(bxs, wires, peak, maxbx),
+            "min_wire": int(wires.min()),
+            "max_wire": int(wires.max()),
+            "digis_idx": digis_idx,
+        })
+    return showers
 
 
 def build_fwshowers(ev: Event, threshold: Optional[List[int]] = None, debug: Optional[bool] = False, 
-                   debug_step: Optional[int] = 4, use_NN_filter: Optional[bool] = True, debug_path: Optional[str] = "./results") -> None:
+                   debug_step: Optional[int] = 4, use_NN_filter: Optional[bool] = True, debug_path: Optional[str] = "./results",
+                   engine: Optional[str] = "vectorized", nn_backend: Optional[str] = "numpy") -> None:
     """
     Emulate the behavior of shower reconstruction in FPGA firmware.
     
     :param ev: The event containing digis to process
     :type ev: Event
-    :param threshold: The threshold for shower building
-    :type threshold: Optional[int]
+    :param threshold: The threshold per station for shower building
+    :type threshold: Optional[List[int]]
     :param debug: Whether to enable debugging outputs
     :type debug: bool
     :param debug_step: The step interval for creating debug plots
     :type debug_step: int
     :param debug_path: The path to save debug plots
     :type debug_path: str
+    :param engine: The emulation engine to use: "vectorized" (default) or "loop" (reference, hit by hit)
+    :type engine: Optional[str]
+    :param nn_backend: The shower discriminator backend, "numpy" (default) or "torch"
+    :type nn_backend: Optional[str]
     :return: None, modifies the event by adding fwshowers attribute
     :rtype: None
     """
@@ -71,84 +322,178 @@ def build_fwshowers(ev: Event, threshold: Optional[List[int]] = None, debug: Opt
     setattr(ev, "fwshowers", [])    
     if not ev.digis:
         return
-    #prepare the event to store the showers
-    Has_shower_builder=np.zeros((5,15,5,3), dtype=bool)
-
-    Active_regions=[]  
-    MaxBX=max(ev.digis, key=lambda d: d.BX, default=None).BX  
-    Hit_vector_SL = np.zeros((5, 15, 5, 3, int(MaxBX+1)), dtype=int)
-    Hits_vector_SL = np.zeros((5, 15, 5, 3, 128), dtype=int)
-    Lastfired_BX = np.zeros((5, 15, 5, 3, 128), dtype=int)
-    hit_BX= np.zeros((5, 15, 5, 3, int(MaxBX+1)), dtype=int)
-    Hits_per_Bx= np.zeros((5, 15, 5, 3, int(MaxBX+1)), dtype=int)
-    Hits_profile = np.zeros((5, 15, 5, 3, 97, int(MaxBX+1)), dtype=int)
-    shower_profile= np.zeros(96, dtype=int)  # to store the shower profile for debug plots
-
-    for digi in ev.digis:
-        wh, sc, st, sl = digi.wh, digi.sc, digi.st, digi.sl   
-        #Hotwire_logic;
-        if Lastfired_BX[wh+2, sc, st, sl-1, digi.w]!=digi.BX and Lastfired_BX[wh+2, sc, st, sl-1, digi.w]!=digi.BX+1 :  # SL index adjusted to 0,1,2 
-            Lastfired_BX[wh+2, sc, st, sl-1, digi.w]=digi.BX
-            Active_regions.append((wh, sc, st, sl))
-            Hits_profile[wh+2, sc, st, sl-1, digi.w, int(digi.BX)] += 1  # SL index adjusted to 0,1,2
-            Hits_per_Bx[wh+2, sc, st, sl-1, int(digi.BX)] += 1  # SL index adjusted to 0,1,2
-            Hit_vector_SL[wh+2, sc, st, sl-1, int(digi.BX):int(digi.BX)+16] += 1  # SL index adjusted to 0,1,2
-            hit_BX[wh+2, sc, st, sl-1, int(digi.BX)] = int(digi.BX) # array to store the value of the BX
-            Hits_vector_SL[wh+2, sc, st, sl-1, digi.w] = 1  # SL index adjusted to 0,1,2
-    ish=0        
+    if engine not in ("vectorized", "loop"):
+        raise ValueError(f"Unknown firmware emulation engine '{engine}', use 'vectorized' or 'loop'")
+
+    emulate = _emulate_fwshowers if engine == "vectorized" else _emulate_fwshowers_loop
+
+    for shower in emulate(*_digis_columns(ev.digis), threshold=threshold):
+        ev.fwshowers.append(_make_fwshower(ev, shower))
+
+    # all the showers of the event are scored in a single batch
+    score_fwshowers(ev.fwshowers, use_NN_filter=use_NN_filter, backend=nn_backend)
+
+
+def build_fwshowers_by_thr(ev: Event, thresholds: List[int], use_NN_filter: Optional[bool] = True,
+                           engine: Optional[str] = "vectorized", nn_backend: Optional[str] = "numpy") -> None:
+    """
+    Emulate the shower reconstruction in FPGA firmware for several thresholds in a single pass, e.g. for
+    threshold scans. Only the final threshold check depends on the threshold, so the emulation is run once
+    with the loosest threshold of each station and the showers of each threshold are those reaching it.
+    Showers passing several thresholds are shared between them.
+
+    :param ev: The event containing digis to process
+    :type ev: Event
+    :param thresholds: The thresholds to emulate. Each one can be a single value for all the stations or
+        a list with the threshold per station
+    :type thresholds: List[int]
+    :param use_NN_filter: Whether to score the showers with the NN discriminator
+    :type use_NN_filter: Optional[bool]
+    :param engine: The emulation engine to use: "vectorized" (default) or "loop" (reference, hit by hit)
+    :type engine: Optional[str]
+    :param nn_backend: The shower discriminator backend, "numpy" (default) or "torch"
+    :type nn_backend: Optional[str]
+    :return: None, modifies the event by adding the fwshowers_by_thr attribute: a dictionary from each
+        threshold (tuple if given per station) to its list of showers
+    :rtype: None
+    """
+    if not hasattr(ev, "digis"):
+            warnings.warn("'digis' is not included in _PARTICLE_TYPES. Please check the config YAML file. Skipping firmware shower building.")
+            return
+    thrs_by_st = {
+        tuple(thr) if isinstance(thr, (list, tuple)) else thr: list(thr) if isinstance(thr, (list, tuple)) else [thr] * 4
+        for thr in thresholds
+    }
+    setattr(ev, "fwshowers_by_thr", {thr: [] for thr in thrs_by_st})
+    if not ev.digis:
+        return
+    if engine not in ("vectorized", "loop"):
+        raise ValueError(f"Unknown firmware emulation engine '{engine}', use 'vectorized' or 'loop'")
+
+    emulate = _emulate_fwshowers if engine == "vectorized" else _emulate_fwshowers_loop
+    loosest = np.min(list(thrs_by_st.values()), axis=0).tolist()
+    fwshowers = [_make_fwshower(ev, shower) for shower in emulate(*_digis_columns(ev.digis), threshold=loosest)]
+    score_fwshowers(fwshowers, use_NN_filter=use_NN_filter, backend=nn_backend)
+
+    for thr, thr_by_st in thrs_by_st.items():
+        ev.fwshowers_by_thr[thr] = [shower for shower in fwshowers if shower.nDigis >= thr_by_st[shower.st - 1]]
+
+
+def _make_fwshower(ev: Event, shower: dict) -> Particle:
+    """
+    Create the shower particle from the output of the firmware emulation.
+
+    :param ev: The event containing the digis of the shower
+    :type ev: Event
+    :param shower: The shower information, see ``_emulate_fwshowers``
+    :type shower: dict
+    :return: The shower
+    :rtype: Particle
+    """
+    _shower = Particle(index=0, wh=shower["wh"], sc=shower["sc"], st=shower["st"], nDigis=shower["nhits"], BX=shower["BX"], name="Shower")
+    _shower.average_BX_hits = shower["average_BX_hits"]
+    _shower.min_wire = shower["min_wire"]
+    _shower.digis = [ev.digis[i] for i in shower["digis_idx"]]
+    _shower.max_wire = shower["max_wire"]
+    _shower.shower_profile = shower["shower_profile"]
+    _shower.sl = shower["sl"]
+    _shower.BXM1 = shower["BXM1"]
+    _shower.BXM2 = shower["BXM2"]
+    _shower.matched_tps = MatchedList()  # Initialize matched_tps
+    return _shower
+
+
+def predict_shower_probs(profiles: ndarray, backend: Optional[str] = "numpy") -> ndarray:
+    """
+    Compute the shower discriminator probabilities of a batch of shower profiles: standard scaling,
+    4 Linear layers with ReLU activations in between and a sigmoid.
+
+    :param profiles: The 97-bin shower profiles, with shape (nshowers, 97)
+    :type profiles: ndarray
+    :param backend: "numpy" (default) to use the exported weights, or "torch" to use the original model
+    :type backend: Optional[str]
+    :return: The probabilities of each shower, with shape (nshowers,)
+    :rtype: ndarray
+    """
+    x = np.array(profiles, dtype=np.float32).reshape(-1, 97)
+    if backend == "torch":
+        import torch
+        model, scaler = _load_torch_discriminator()
+        x = torch.tensor(scaler.transform(x), dtype=torch.float32)
+        with torch.no_grad():
+            probs = torch.sigmoid(model(x))
+        return probs.numpy().reshape(-1)
+
+    # same operations (and float32 precision) as the scaler and the torch model
+    x -= _nn_params["scaler_mean"]
+    x /= _nn_params["scaler_scale"]
+    for i in range(4):
+        x = x @ _nn_params[f"W{i}"].T + _nn_params[f"b{i}"]
+        if i < 3:
+            np.maximum(x, 0, out=x)
+    return (1 / (1 + np.exp(-x))).reshape(-1)
+
+
+def score_fwshowers(showers: List[Particle], use_NN_filter: Optional[bool] = True, batch_size: Optional[int] = None,
+                    backend: Optional[str] = "numpy") -> None:
+    """
+    Set the shower discriminator ``prediction_value`` and ``isnot_dropped`` flags of the showers. The
+    showers can come from any number of events, so profiles can be collected across events and scored
+    together. If the model (or the scaler) is not available, or ``use_NN_filter`` is False, showers are
+    never dropped.
+
+    :param showers: The showers to score
+    :type showers: List[Particle]
+    :param use_NN_filter: Whether to use the NN discriminator
+    :type use_NN_filter: Optional[bool]
+    :param batch_size: Maximum number of showers per forward pass. All at once if None
+    :type batch_size: Optional[int]
+    :param backend: The discriminator backend, "numpy" (default) or "torch"
+    :type backend: Optional[str]
+    :return: None, modifies the showers in place
+    :rtype: None
+    """
+    if not (use_NN_filter and _nn_available(backend)):
+        # fallback: no NN, never drop shower
+        for shower in showers:
+            shower.prediction_value = None
+            shower.isnot_dropped = True
+        return
+    if not showers:
+        return
+
+    batch_size = batch_size or len(showers)
+    for start in range(0, len(showers), batch_size):
+        batch = showers[start:start + batch_size]
+        probs = predict_shower_probs(np.stack([shower.shower_profile for shower in batch]), backend=backend)
+        for shower, prob in zip(batch, probs.tolist()):
+            shower.prediction_value = prob
+            shower.isnot_dropped = prob > 0.5
+
+
+def nn_filter_fwshowers(ev: Event, batch_size: Optional[int] = None, backend: Optional[str] = "numpy") -> None:
+    """
+    Preprocessor to score the firmware showers of the event with the NN discriminator. Meant to be used
+    after ``build_fwshowers`` with ``use_NN_filter: False`` in the ``ntuple_preprocessors`` of the config.
+    Preprocessors run event by event, so the showers are batched within the event; to score the showers of
+    many events together, see the deferred stage of ``utils/shower_friend_tree.py`` (``--nn-score``).
+
+    :param ev: The event containing the firmware showers
+    :type ev: Event
+    :param batch_size: Maximum number of showers per forward pass. All at once if None
+    :type batch_size: Optional[int]
+    :param backend: The discriminator backend, "numpy" (default) or "torch"
+    :type backend: Optional[str]
+    :return: None, modifies the showers in place
+    :rtype: None
+    """
+    if not hasattr(ev, "fwshowers"):
+        warnings.warn("Event has no 'fwshowers'. Please run build_fwshowers before nn_filter_fwshowers. Skipping NN filtering.")
+        return
+    if not _nn_available(backend):
+        warnings.warn("Shower discriminator model or scaler not found. Showers will not be dropped.")
+    score_fwshowers(ev.fwshowers, batch_size=batch_size, backend=backend)
 
-    for active_region in set(Active_regions):
-        #process_layer
-        wh, sc, st, sl = active_region
-        if  Hit_vector_SL[wh+2, sc, st, sl-1, :].max() >= threshold[st-1]:  # SL index adjusted to 0,1,2
-            
-            Has_shower_builder[wh+2, sc, st, sl-1] = True
-            #maxhits
-            nhits=Hit_vector_SL[wh+2, sc, st, sl-1, :].max()
-            peak= np.where(Hit_vector_SL[wh+2, sc, st, sl-1, :] == nhits)[0][0] # Get the first index of the peak
-            BXs_in_shower=hit_BX[wh+2, sc, st, sl-1, peak-16:peak+1]
-            BX=min(BXs_in_shower[BXs_in_shower>0]) if BXs_in_shower[BXs_in_shower>0].size>0 else None
-            Hits_inShower=Hits_per_Bx[wh+2, sc, st, sl-1, peak-16:peak+1]
-            average_BX_hits=sum((BXs_in_shower*Hits_inShower))/sum(Hits_inShower) if sum(Hits_inShower)>0 else None
-            Mehtod1_BX=int(np.mean(BXs_in_shower[BXs_in_shower > 0][:4])) if (BXs_in_shower[BXs_in_shower > 0].size > 0) else None
-            Method2_BX = int(np.mean(np.concatenate([BXs_in_shower[BXs_in_shower > 0][:2], BXs_in_shower[BXs_in_shower > 0][-2:]]))) if (BXs_in_shower[BXs_in_shower > 0].size > 0) else None
-            # Find non-zero indices in Hits_vector_SL for this region
-            wire_indices = np.nonzero(Hits_vector_SL[wh+2, sc, st, sl-1])[0]
-            min_wire = int(wire_indices.min()) if wire_indices.size > 0 else None
-            max_wire = int(wire_indices.max()) if wire_indices.size > 0 else None  
-            digis=[]
-            for hits in ev.digis:
-                if hits.wh==wh and hits.sc==sc and hits.st==st and hits.sl==sl and hits.BX>=peak-16 and hits.BX<=peak:
-                    digis.append(hits)
-            _shower = Particle(index=ish, wh=wh, sc=sc, st=st, nDigis=nhits, BX=BX, name="Shower")
-            _shower.average_BX_hits = average_BX_hits
-            _shower.min_wire = min_wire
-            _shower.digis = digis
-            _shower.max_wire = max_wire       
-            _shower.shower_profile = Hits_profile[wh+2, sc, st, sl-1, :, peak-16:peak+1].sum(axis=1)  # SL index adjusted to 0,1,2
-            _shower.sl = sl
-            _shower.BXM1=Mehtod1_BX
-            _shower.BXM2=Method2_BX
-            _shower.matched_tps = []  # Initialize matched_tps
-            if use_NN_filter and _shower_model is not None and _scaler is not None:
-                # reshape to (1, 97) and scale
-                profile_np = _shower.shower_profile.astype(np.float32).reshape(1, -1)
-                profile_scaled = _scaler.transform(profile_np)
-                # convert to torch tensor
-                x = torch.tensor(profile_scaled, dtype=torch.float32)
-                # model prediction
-                with torch.no_grad():
-                    logits = _shower_model(x)
-                    prob = torch.sigmoid(logits).item()
-                _shower.prediction_value = prob
-                _shower.isnot_dropped = prob > 0.5
-
-            else:
-                # fallback: no NN, never drop shower
-                _shower.prediction_value = None
-                _shower.isnot_dropped = True                            
-        
-            ev.fwshowers.append(_shower)
 
 def _process_superlayer(ev_BXs: List[int], digis_df: DataFrame, threshold: int) -> Tuple[bool, int, int, ndarray]:
     """
@@ -204,7 +549,12 @@ def _process_superlayer(ev_BXs: List[int], digis_df: DataFrame, threshold: int)
 
 def build_real_showers(ev: Event, threshold: Optional[int] = None,Filtersimhits:Optional[bool] = True, debug: Optional[bool] = False) -> None:
     """
-    Build real showers based on simhit information.
+    Build real showers based on simhit information. A superlayer holds a real shower if its simhits
+    (optionally only those with a digi in the same (l, w)) fire at least ``threshold`` cells and:
+
+        1. there are muon (>= 3) and electron hits spread over the wires (wire variance > 1), or
+        2. there are electron hits spread over the wires, or
+        3. a generator muon has more than one matched segment in the same chamber.
     
     :param ev: The event containing simhits to process
     :type ev: Event
@@ -228,82 +578,66 @@ def build_real_showers(ev: Event, threshold: Optional[int] = None,Filtersimhits:
     simhits_locs = get_unique_locs(particles=ev.simhits, loc_ids=["wh", "sc", "st", "sl"])
     digis_locs = get_unique_locs(particles=ev.digis, loc_ids=["wh", "sc", "st", "sl"])
     indexs = simhits_locs.union(digis_locs)
+    are_duplicated_segments = None # computed once, only if needed
 
     for wh, sc, st, sl in indexs:
-        simhits_sdf = DataFrame([simhit.__dict__ for simhit in ev.filter_particles("simhits", wh=wh, sc=sc, st=st, sl=sl)])
-        digis_sdf = DataFrame([digi.__dict__ for digi in ev.filter_particles("digis", wh=wh, sc=sc, st=st, sl=sl)])
-        
+        digis = get_particles_by_loc(ev, "digis", wh=wh, sc=sc, st=st, sl=sl)
+        simhits = get_particles_by_loc(ev, "simhits", wh=wh, sc=sc, st=st, sl=sl)
+        digi_cells = {(digi.l, digi.w) for digi in digis}
+
         # Filter simhits to only include those that have a corresponding digi at the same (l, w) location
         if Filtersimhits:
-            if not simhits_sdf.empty and not digis_sdf.empty:
-                # Create sets of (l, w) coordinates for efficient lookup
-                digi_coords = set(zip(digis_sdf['l'], digis_sdf['w']))
-                simhits_sdf = simhits_sdf[simhits_sdf.apply(lambda row: (row['l'], row['w']) in digi_coords, axis=1)]
-            elif digis_sdf.empty:
-                # If there are no digis, clear simhits_sdf as there are no matching coordinates
-                simhits_sdf = DataFrame()
-
-        _build_shower = False
-
-        if not simhits_sdf.empty:
-            simhits_sdf = simhits_sdf[["l", "w", "particle_type"]].drop_duplicates()
-            # conditions...
-            # pass the threshold of hits
-            pass_thr = len(simhits_sdf.drop_duplicates(["l", "w"])) >= thr
-            # at least 3 muon hits
-            are_muons_hits = len(simhits_sdf.loc[simhits_sdf["particle_type"].abs() == 13]) >= 3
-            # at least 1 electron hit
-            are_electron_hits = len(simhits_sdf.loc[simhits_sdf["particle_type"].abs() == 11]) > 0
-            # hits are spread out in the chamber
-            spread = simhits_sdf["w"].std()**2 > 1
-            # are duplicated matched segments
+            simhits = [simhit for simhit in simhits if (simhit.l, simhit.w) in digi_cells]
+        if not simhits:
+            continue
+
+        # unique (l, w, particle_type) hits, in order of appearance
+        hits = np.array(list(dict.fromkeys((simhit.l, simhit.w, simhit.particle_type) for simhit in simhits)))
+        simhit_cells = {(l, w) for l, w, _ in hits.tolist()}
+        # conditions...
+        # pass the threshold of hits
+        pass_thr = len(simhit_cells) >= thr
+        if not pass_thr:
+            continue
+        # at least 3 muon hits
+        are_muons_hits = np.count_nonzero(np.abs(hits[:, 2]) == 13) >= 3
+        # at least 1 electron hit
+        are_electron_hits = np.any(np.abs(hits[:, 2]) == 11)
+        # hits are spread out in the chamber
+        wires_var = np.std(hits[:, 1], ddof=1)**2 if len(hits) > 1 else np.nan
+        spread = wires_var > 1
+        # are duplicated matched segments
+        if are_duplicated_segments is None:
             matched_segments = [seg for gm in ev.genmuons for seg in getattr(gm, 'matched_segments', [])]
-            if matched_segments:
-                are_duplicated_segments = len(matched_segments) > len(get_unique_locs(matched_segments, loc_ids=["wh", "sc", "st"]))
-            else:
-                are_duplicated_segments = False # -- for G4 DTNtuples there are no segments
-
-            if pass_thr:
-                if debug: color_msg(f'spread: {spread} --> {simhits_sdf["w"].std()**2}', "purple", indentLevel=2)
-                if are_muons_hits and are_electron_hits and spread:
-                    shower_type = 1
-                elif are_electron_hits and spread:
-                    shower_type = 2
-                elif are_duplicated_segments:
-                    shower_type = 3
-                else:
-                    continue
-                _build_shower = True
-
-        # elif not digis_sdf.empty:
-        #     digis_sdf = digis_sdf[["l", "w"]].drop_duplicates()
-        #     # conditions...
-        #     pass_thr = len(digis_sdf) >= thr
-        #     # hits are spread out in the chamber
-        #     std_ = digis_sdf["w"].std()**2
-        #     spread = std_ > 1 and std_ < 5
-        #     if debug: color_msg(f'spread: {spread} --> {std_}', "purple", indentLevel=2)
-        #     if debug: color_msg(f'iqr: {digis_sdf["w"].quantile(0.25)}, {digis_sdf["w"].quantile(0.75)}', "purple", indentLevel=2)
-        #     if len(digis_sdf) >= thr and spread:
-        #         shower_type = 4
-        #         _build_shower = True
-        
-        if _build_shower:
-            _index = ev.realshowers[-1].index + 1 if ev.realshowers else 0
-            _shower = Particle(index=_index, wh=wh, sc=sc, st=st, name="Shower") 
-            _shower.shower_type = shower_type
-            _shower.sl = sl
-            _shower.nsimhits = len(simhits_sdf.drop_duplicates(["l", "w"])) if not simhits_sdf.empty else 0
-            _shower.ndigis = len(digis_sdf.drop_duplicates(["l", "w"])) if not digis_sdf.empty else 0
-            _shower.min_wire = int(min(simhits_sdf["w"].min(), digis_sdf["w"].min())) if not simhits_sdf.empty and not digis_sdf.empty else (int(simhits_sdf["w"].min()) if not simhits_sdf.empty else int(digis_sdf["w"].min()))
-            _shower.max_wire = int(max(simhits_sdf["w"].max(), digis_sdf["w"].max())) if not simhits_sdf.empty and not digis_sdf.empty else (int(simhits_sdf["w"].max()) if not simhits_sdf.empty else int(digis_sdf["w"].max()))
-            ev.realshowers.append(_shower)
-            if debug:
-                color_msg(
-                    f'Realshower detected in (wh, sc, st, sl): ({wh}, {sc}, {st}, {sl}) - type: {shower_type}',
-                    "green",
-                    indentLevel=2,
-                )
+            # -- for G4 DTNtuples there are no segments
+            are_duplicated_segments = len(matched_segments) > len(get_unique_locs(matched_segments, loc_ids=["wh", "sc", "st"]))
+
+        if debug: color_msg(f'spread: {spread} --> {wires_var}', "purple", indentLevel=2)
+        if are_muons_hits and are_electron_hits and spread:
+            shower_type = 1
+        elif are_electron_hits and spread:
+            shower_type = 2
+        elif are_duplicated_segments:
+            shower_type = 3
+        else:
+            continue
+
+        _index = ev.realshowers[-1].index + 1 if ev.realshowers else 0
+        _shower = Particle(index=_index, wh=wh, sc=sc, st=st, name="Shower") 
+        _shower.shower_type = shower_type
+        _shower.sl = sl
+        _shower.nsimhits = len(simhit_cells)
+        _shower.ndigis = len(digi_cells)
+        wires = hits[:, 1].tolist() + [digi.w for digi in digis]
+        _shower.min_wire = int(min(wires))
+        _shower.max_wire = int(max(wires))
+        ev.realshowers.append(_shower)
+        if debug:
+            color_msg(
+                f'Realshower detected in (wh, sc, st, sl): ({wh}, {sc}, {st}, {sl}) - type: {shower_type}',
+                "green",
+                indentLevel=2,
+            )
 
 def analyze_fwshowers(ev: Event) -> None:
     """
@@ -320,7 +654,7 @@ def analyze_fwshowers(ev: Event) -> None:
 
     for shower in ev.fwshowers:   
         wh, sc, st , sl = shower.wh, shower.sc, shower.st, shower.sl
-        if ev.filter_particles("realshowers", wh=wh, sc=sc, st=st, sl=sl):
+        if get_particles_by_loc(ev, "realshowers", wh=wh, sc=sc, st=st, sl=sl):
             shower.is_true_shower = True
         else:
             shower.is_true_shower = False
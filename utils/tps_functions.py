@@ -66,4 +66,95 @@ def compute_psi_local(tp: Particle) -> float:
 
     psi_local = -1 * parent_station.face_orientation_factor * (phi_rad + phiB_rad) + np.pi # add pi to point the angle outwards the CMS
 
-    return np.degrees(psi_local)
\ No newline at end of file
+    return np.degrees(psi_local)
+
+# ------------------------- Lookup tables for the TP local coordinates -------------------------
+# compute_x0 and compute_psi_local only depend on the TP phi/phiB and on the geometry of its chamber,
+# which can be reduced to a few coefficients per (wh, sc, st, sl) since the frame transformations are affine:
+#   posLoc_x = scale * tan(phi) + offset
+#   dirLoc_phi = degrees(-face_orientation_factor * (phi + phiB) + pi)
+
+# barrel chambers, sectors 13 and 14 only exist in MB4
+_STATION_KEYS = [(wh, sc, st) for wh in range(-2, 3) for st in range(1, 5) for sc in range(1, 13 if st < 4 else 15)]
+_TP_GEOMETRY_TABLES = {}
+
+def tp_geometry_table(ref_frame="SL13Center") -> np.ndarray:
+    """
+    Get the table of coefficients of the TP local position and angle, built on first use for each reference frame.
+
+    :param ref_frame: The reference frame of the local x position. Available options are ["SL13Center" (default), "Station", "SectorRef"].
+    :type ref_frame: str
+    :return: Array of shape (5, 14, 4, 4, 3) indexed by [wh + 2, sc - 1, st - 1, sl] holding (scale, offset, face_orientation_factor). NaN for non existing chambers.
+    :rtype: np.ndarray
+    """
+    if ref_frame not in _TP_GEOMETRY_TABLES:
+        table = np.full((5, 14, 4, 4, 3), np.nan)
+        for wh, sc, st in _STATION_KEYS:
+            station = Station(wh, sc, st)
+            x_ch, y_ch, _ = station.global_center
+            r_ch = np.sqrt(x_ch**2 + y_ch**2)
+            dphi = np.arctan2(y_ch, x_ch) - ((4 if sc == 13 else 10 if sc == 14 else sc) - 1) * np.pi / 6
+            factor = station.face_orientation_factor
+
+            scale, offset = -1 * r_ch * np.cos(dphi) * factor, 0.
+            if ref_frame != "SectorRef":
+                offset = station.transformer.transform((0, 0, 0), from_frame="SectorRef", to_frame=ref_frame)[0]
+                scale *= station.transformer.transform((1, 0, 0), from_frame="SectorRef", to_frame=ref_frame)[0] - offset
+            for sl in range(4):
+                sl_offset = 0
+                if ref_frame == "SL13Center" and sl != 0:
+                    sl_offset = station.transformer.transform((0, 0, 0), from_frame=ref_frame, to_frame=f"SL{sl}")[0]
+                table[wh + 2, sc - 1, st - 1, sl] = (scale, offset - sl_offset, factor)
+        _TP_GEOMETRY_TABLES[ref_frame] = table
+    return _TP_GEOMETRY_TABLES[ref_frame]
+
+def compute_tps_local(wh, sc, st, sl, phi, phiB, phires_conv=65536.0 / 0.5, phiBres_conv=4096.0 / 2.0, ref_frame="SL13Center"):
+    """
+    Vectorized version of compute_x0 and compute_psi_local, computing the local position and angle of many AM Trigger
+    Primitives (e.g. all the TPs of an event or a chunk of events) at once from the geometry lookup table.
+
+    :param wh, sc, st, sl: The TPs wheel, sector, station and superlayer.
+    :type wh, sc, st, sl: np.ndarray
+    :param phi, phiB: The TPs phi and phiB, in hardware units.
+    :type phi, phiB: np.ndarray
+    :param phires_conv: The conversion factor from phi hardware units to radians.
+    :type phires_conv: float
+    :param phiBres_conv: The conversion factor from phiB hardware units to radians.
+    :type phiBres_conv: float
+    :param ref_frame: The reference frame of the local x position. Available options are ["SL13Center" (default), "Station", "SectorRef"].
+    :type ref_frame: str
+    :return: The x positions referenced to ref_frame and the local angles in degrees of the TPs.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    coefs = tp_geometry_table(ref_frame)[np.asarray(wh) + 2, np.asarray(sc) - 1, np.asarray(st) - 1, np.asarray(sl)]
+    phi_rad = np.asarray(phi, dtype=np.float64) / phires_conv
+    phiB_rad = np.asarray(phiB, dtype=np.float64) / phiBres_conv
+
+    x_0 = coefs[..., 0] * np.tan(phi_rad) + coefs[..., 1]
+    psi_local = -1 * coefs[..., 2] * (phi_rad + phiB_rad) + np.pi
+
+    return x_0, np.degrees(psi_local)
+
+def compute_tps_local_coordinates(ev, ref_frame="SL13Center") -> None:
+    """
+    Preprocessor setting the posLoc_x and dirLoc_phi attributes of all the TPs of the event in one array call,
+    instead of per TP ``src`` attributes (compute_x0 and compute_psi_local).
+
+    :param ev: The event containing the TPs.
+    :type ev: Event
+    :param ref_frame: The reference frame of the local x position. Available options are ["SL13Center" (default), "Station", "SectorRef"].
+    :type ref_frame: str
+    :return: None, modifies the TPs of the event.
+    :rtype: None
+    """
+    tps = getattr(ev, "tps", None)
+    if not tps:
+        return
+    locs = np.array([(tp.wh, tp.sc, tp.st, tp.sl) for tp in tps], dtype=np.int64)
+    phis = np.array([(tp.phi, tp.phiB) for tp in tps], dtype=np.float64)
+    x_0, psi_local = compute_tps_local(
+        *locs.T, *phis.T, phires_conv=tps[0].phires_conv, phiBres_conv=tps[0].phiBres_conv, ref_frame=ref_frame
+    )
+    for tp, x, psi in zip(tps, x_0.tolist(), psi_local.tolist()):
+        tp.posLoc_x = x
+        tp.dirLoc_phi = psi